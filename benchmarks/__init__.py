@@ -0,0 +1,57 @@
+"""
+Бенчмарки проекта. Запуск из корня проекта:
+
+    python -m benchmarks.<имя модуля>
+
+Каждый бенчмарк работает на отдельной тестовой базе данных, которая создаётся и удаляется автоматически.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+
+@contextmanager
+def test_database():
+    """ Временная тестовая база данных на время бенчмарка """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func, repeat=50):
+    """ Время выполнения func в миллисекундах: медиана, p95 и p99 """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return percentiles(timings)
+
+
+def percentiles(timings):
+    """ Медиана, p95 и p99 списка длительностей """
+    timings = sorted(timings)
+    return {
+        'p50': statistics.median(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def print_table(headers, rows):
+    """ Вывод результатов бенчмарка таблицей """
+    rows = [[f'{cell:.3f}' if isinstance(cell, float) else str(cell) for cell in row] for row in rows]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    for row in [headers, *rows]:
+        print('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths)))
@@ -0,0 +1,149 @@
+"""
+Задержки (p50/p95/p99) и количество SQL-запросов по каждому эндпоинту networks/urls.py на синтетической сети.
+
+Размер сети задаётся переменными окружения BENCH_FACTORIES, BENCH_RETAILERS, BENCH_CONSUMERS, BENCH_PRODUCTS,
+число повторов - BENCH_REPEAT. Запросы выполняются с холодным кэшем ответов (кэш очищается перед каждым запросом)
+и, для кэшируемых эндпоинтов, с тёплым.
+"""
+import itertools
+import os
+from io import StringIO
+
+from benchmarks import measure, print_table, test_database
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, reset_queries  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+from networks.models import NetworkNode, Contacts, Product  # noqa: E402
+
+SIZES = {
+    'factories': int(os.getenv('BENCH_FACTORIES', 20)),
+    'retailers': int(os.getenv('BENCH_RETAILERS', 2000)),
+    'consumers': int(os.getenv('BENCH_CONSUMERS', 20000)),
+    'products': int(os.getenv('BENCH_PRODUCTS', 500)),
+}
+REPEAT = int(os.getenv('BENCH_REPEAT', 30))
+CACHED = {
+    'networks-list-create', 'network-detail', 'networks-debt-analytics',
+    'networks-location-analytics country', 'networks-location-analytics city',
+}
+
+
+def endpoints():
+    """
+    GET-запросы ко всем эндпоинтам networks/urls.py, кроме потоковой выгрузки; POST пакетной загрузки -
+    с новыми названиями, POST журнала задолженности и постановки задачи в очередь
+    """
+    factory = NetworkNode.objects.filter(level=0).order_by('pk').first()
+    retailer = NetworkNode.objects.filter(level=1).order_by('pk').first()
+    consumer = NetworkNode.objects.filter(level=2).order_by('pk').first()
+    product = Product.objects.order_by('pk').first()
+    contacts = Contacts.objects.order_by('pk').first()
+    last_page = max(1, NetworkNode.objects.count() // 10)
+    counter = itertools.count()
+
+    def bulk_batch():
+        batch = next(counter)
+        return [
+            {'name': f'Bench {batch} {i}', 'level': 2, 'supplier': retailer.pk, 'products': [product.pk]}
+            for i in range(100)
+        ]
+
+    def debt_batch():
+        return [{'network_node': retailer.pk, 'amount': '1.00', 'comment': 'Bench'} for _ in range(100)]
+
+    def rebuild_job():
+        return {'task': 'networks.rebuild_supply_chain'}
+
+    networks_list = reverse('networks:networks-list-create')
+    transactions = reverse('networks:networks-debt-transactions')
+    locations = reverse('networks:networks-location-analytics')
+    return [
+        ('products-list', 'get', reverse('networks:products-list'), None),
+        ('products-list by sales channels', 'get',
+         reverse('networks:products-list') + '?ordering=-sales_channels_count', None),
+        ('products-list cursor', 'get', reverse('networks:products-list') + '?pagination=cursor', None),
+        ('products-detail', 'get', reverse('networks:products-detail', kwargs={'pk': product.pk}), None),
+        ('contacts-list', 'get', reverse('networks:contacts-list'), None),
+        ('contacts-detail', 'get', reverse('networks:contacts-detail', kwargs={'pk': contacts.pk}), None),
+        ('networks-list-create', 'get', networks_list, None),
+        ('networks-list-create deep page', 'get', networks_list + f'?page_size={last_page}', None),
+        ('networks-list-create search', 'get', networks_list + '?search=land', None),
+        ('networks-list-create by products', 'get', networks_list + '?ordering=-products_count', None),
+        ('network-detail', 'get', reverse('networks:network-detail', kwargs={'pk': factory.pk}), None),
+        ('network-ancestors', 'get', reverse('networks:network-ancestors', kwargs={'pk': consumer.pk}), None),
+        ('network-descendants', 'get', reverse('networks:network-descendants', kwargs={'pk': factory.pk}), None),
+        ('networks-bulk (100 nodes)', 'post', reverse('networks:networks-bulk'), bulk_batch),
+        ('networks-debt-analytics', 'get', reverse('networks:networks-debt-analytics'), None),
+        ('networks-location-analytics country', 'get', locations + '?group_by=country', None),
+        ('networks-location-analytics city', 'get', locations + '?group_by=city', None),
+        ('networks-debt-transactions', 'get', transactions, None),
+        ('networks-debt-transactions cursor', 'get', transactions + '?pagination=cursor', None),
+        ('networks-debt-transactions node', 'get', transactions + f'?network_node={retailer.pk}', None),
+        ('networks-debt-transactions (100 postings)', 'post', transactions, debt_batch),
+        ('jobs-list', 'get', reverse('networks:jobs-list'), None),
+        ('jobs-list enqueue', 'post', reverse('networks:jobs-list'), rebuild_job),
+        ('database-metrics', 'get', reverse('networks:database-metrics'), None),
+        ('async-networks-list', 'get', reverse('networks:async-networks-list'), None),
+        ('async-network-detail', 'get', reverse('networks:async-network-detail', kwargs={'pk': factory.pk}), None),
+        ('async-products-list', 'get', reverse('networks:async-products-list'), None),
+        ('async-products-detail', 'get', reverse('networks:async-products-detail', kwargs={'pk': product.pk}), None),
+        ('async-contacts-list', 'get', reverse('networks:async-contacts-list'), None),
+        ('async-contacts-detail', 'get',
+         reverse('networks:async-contacts-detail', kwargs={'pk': contacts.pk}), None),
+    ]
+
+
+def request(client, method, url, payload):
+    if method == 'post':
+        return client.post(url, data=payload(), format='json')
+    return client.get(url)
+
+
+def main():
+    setup_test_environment()
+    rows = []
+    with test_database():
+        call_command('generate_network', stdout=StringIO(), batch_size=5000, **SIZES)
+        client = APIClient()
+        # Сотрудник: метрики соединений доступны только персоналу. Токен, а не force_authenticate: асинхронные
+        # эндпоинты аутентифицируют запрос сами, и в замер входит JWT-аутентификация
+        user = get_user_model().objects.create(username='bench', is_staff=True)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+        for name, method, url, payload in endpoints():
+            reset_queries()
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = request(client, method, url, payload)
+            # Количество запоминается сразу: следующие запросы очищают журнал запросов соединения
+            query_count = len(queries)
+            # 201 - записанные проводки, 202 - задача в очереди
+            assert response.status_code in (200, 201, 202), (name, response.status_code)
+
+            def cold():
+                cache.clear()
+                request(client, method, url, payload)
+
+            timings = measure(cold, repeat=REPEAT)
+            row = [name, query_count, timings['p50'], timings['p95'], timings['p99']]
+            if name in CACHED:
+                warm = measure(lambda: request(client, method, url, payload), repeat=REPEAT)
+                row.append(warm['p50'])
+            else:
+                row.append('-')
+            rows.append(row)
+
+    print(f"Network: {SIZES['factories']} factories, {SIZES['retailers']} retailers, "
+          f"{SIZES['consumers']} consumers, {SIZES['products']} products; {REPEAT} requests per endpoint")
+    print_table(['endpoint', 'queries', 'p50 ms', 'p95 ms', 'p99 ms', 'cached p50 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
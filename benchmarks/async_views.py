@@ -0,0 +1,112 @@
+"""
+Пропускная способность асинхронных (ASGI) эндпоинтов чтения в сравнении с синхронными (WSGI) при равном
+числе обработчиков: N потоков WSGI против N одновременных запросов в одном цикле событий ASGI.
+
+Число обработчиков задаётся переменной окружения BENCH_WORKERS (список через запятую, по умолчанию 1,4,16),
+число запросов на каждый замер - BENCH_REQUESTS, размер сети - BENCH_RETAILERS и BENCH_CONSUMERS.
+Кэш ответов отключён, чтобы сравнивались чтение из базы данных и сериализация.
+Результат имеет смысл на PostgreSQL: запросы SQLite не освобождают поток на время ввода-вывода.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from asgiref.sync import ThreadSensitiveContext
+
+from benchmarks import print_table, test_database
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test import Client, AsyncClient  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+from networks.models import NetworkNode, Product  # noqa: E402
+
+WORKERS = [int(workers) for workers in os.getenv('BENCH_WORKERS', '1,4,16').split(',')]
+REQUESTS = int(os.getenv('BENCH_REQUESTS', 200))
+SIZES = {
+    'factories': 10,
+    'retailers': int(os.getenv('BENCH_RETAILERS', 1000)),
+    'consumers': int(os.getenv('BENCH_CONSUMERS', 10000)),
+    'products': 200,
+}
+
+
+def endpoints():
+    """ Пары синхронный / асинхронный URL одного и того же ответа """
+    node = NetworkNode.objects.filter(level=1).order_by('pk').first()
+    product = Product.objects.order_by('pk').first()
+    return [
+        ('networks list', reverse('networks:networks-list-create'), reverse('networks:async-networks-list')),
+        ('network detail', reverse('networks:network-detail', kwargs={'pk': node.pk}),
+         reverse('networks:async-network-detail', kwargs={'pk': node.pk})),
+        ('products list', reverse('networks:products-list'), reverse('networks:async-products-list')),
+        ('products detail', reverse('networks:products-detail', kwargs={'pk': product.pk}),
+         reverse('networks:async-products-detail', kwargs={'pk': product.pk})),
+        ('contacts list', reverse('networks:contacts-list'), reverse('networks:async-contacts-list')),
+    ]
+
+
+def wsgi_throughput(url, headers, workers):
+    """ Запросов в секунду: workers потоков, каждый со своим клиентом и соединением с базой данных """
+
+    def worker(count):
+        client = Client(headers=headers)
+        try:
+            for _ in range(count):
+                assert client.get(url).status_code == 200
+        finally:
+            connections.close_all()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(worker, [REQUESTS // workers] * workers))
+    return REQUESTS // workers * workers / (time.perf_counter() - start)
+
+
+def asgi_throughput(url, headers, workers):
+    """ Запросов в секунду: workers одновременных запросов в одном цикле событий """
+
+    async def worker(count):
+        client = AsyncClient()
+        for _ in range(count):
+            # Как ASGI-сервер: у каждого запроса свой поток для синхронного кода и своё соединение с базой данных
+            async with ThreadSensitiveContext():
+                response = await client.get(url, headers=headers)
+            assert response.status_code == 200, response.content
+
+    async def run():
+        await asyncio.gather(*(worker(REQUESTS // workers) for _ in range(workers)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return REQUESTS // workers * workers / (time.perf_counter() - start)
+
+
+def main():
+    setup_test_environment()
+    rows = []
+    with test_database(), override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+        call_command('generate_network', stdout=StringIO(), **SIZES)
+        user = get_user_model().objects.create(username='bench')
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+        for name, sync_url, async_url in endpoints():
+            for workers in WORKERS:
+                sync_rps = wsgi_throughput(sync_url, headers, workers)
+                async_rps = asgi_throughput(async_url, headers, workers)
+                rows.append([name, workers, sync_rps, async_rps, async_rps / sync_rps])
+
+    print(f"Network: {SIZES['retailers']} retailers, {SIZES['consumers']} consumers; "
+          f"{REQUESTS} requests per measurement, database: {connections['default'].vendor}")
+    print_table(['endpoint', 'workers', 'WSGI req/s', 'ASGI req/s', 'ASGI / WSGI'], rows)
+
+
+if __name__ == '__main__':
+    main()
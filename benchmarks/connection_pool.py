@@ -0,0 +1,97 @@
+"""
+Задержки (p50/p95/p99) карточки организации /networks/<pk>/ при открытии соединения на каждый запрос,
+с постоянными соединениями (CONN_MAX_AGE) и с пулом соединений (networks.backends.postgresql_pool).
+
+Каждый профиль запускается в отдельном процессе со своими переменными окружения POSTGRES_* на общей
+тестовой базе данных. BENCH_THREADS потоков выполняют по BENCH_REQUESTS запросов, после каждого запроса
+соединения закрываются, как в конце запроса на сервере (close_old_connections). Размер пула - BENCH_POOL_SIZE
+(по умолчанию меньше числа потоков, чтобы было видно ожидание). Кэш ответов отключён.
+Бенчмарк требует PostgreSQL: у SQLite нет стоимости подключения.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from benchmarks import percentiles, print_table, test_database
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import close_old_connections, connection, connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+from networks.db_pool import pool_stats  # noqa: E402
+from networks.models import NetworkNode  # noqa: E402
+
+THREADS = int(os.getenv('BENCH_THREADS', 8))
+REQUESTS = int(os.getenv('BENCH_REQUESTS', 200))
+POOL_SIZE = int(os.getenv('BENCH_POOL_SIZE', max(1, THREADS // 2)))
+PROFILES = [
+    ('new connection per request', {'POSTGRES_CONN_MAX_AGE': '0', 'POSTGRES_POOL_MAX_SIZE': '0'}),
+    ('persistent connections', {'POSTGRES_CONN_MAX_AGE': '60', 'POSTGRES_POOL_MAX_SIZE': '0'}),
+    (f'pool of {POOL_SIZE}', {'POSTGRES_POOL_MAX_SIZE': str(POOL_SIZE), 'POSTGRES_POOL_MIN_SIZE': '0'}),
+]
+
+
+def run_profile():
+    """ Замер в процессе профиля: длительности запросов в миллисекундах и метрики пула - JSON в stdout """
+    setup_test_environment()
+    user = get_user_model().objects.get(username='bench')
+    headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+    node = NetworkNode.objects.order_by('pk').first()
+    url = reverse('networks:network-detail', kwargs={'pk': node.pk})
+    close_old_connections()
+
+    def worker(count):
+        client = Client(headers=headers)
+        timings = []
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                assert client.get(url).status_code == 200
+                # Тестовый клиент не закрывает соединения по сигналу request_finished, как сервер
+                close_old_connections()
+                timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            connections.close_all()
+        return timings
+
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+        with ThreadPoolExecutor(THREADS) as executor:
+            timings = [timing for chunk in executor.map(worker, [REQUESTS] * THREADS) for timing in chunk]
+    print(json.dumps({'timings': timings, 'pools': pool_stats()}))
+
+
+def main():
+    rows = []
+    with test_database():
+        call_command('generate_network', stdout=StringIO(), factories=5, retailers=100, consumers=500, products=50)
+        get_user_model().objects.create(username='bench')
+        env = {**os.environ, 'POSTGRES_DB': connection.settings_dict['NAME']}
+        # Соединение родительского процесса не должно занимать место в пуле профилей
+        connection.close()
+
+        for name, profile in PROFILES:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.connection_pool', 'run'],
+                                    env={**env, **profile}, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            timing = percentiles(result['timings'])
+            pool = result['pools'][0] if result['pools'] else {}
+            rows.append([name, timing['p50'], timing['p95'], timing['p99'],
+                         pool.get('size', '-'), pool.get('checkouts', '-'), pool.get('wait_ms_max', '-')])
+
+    print(f'{THREADS} threads x {REQUESTS} requests to /networks/<pk>/, database: {connection.vendor}')
+    print_table(['profile', 'p50, ms', 'p95, ms', 'p99, ms', 'pool size', 'checkouts', 'max wait, ms'], rows)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['run']:
+        run_profile()
+    else:
+        main()
@@ -0,0 +1,56 @@
+"""
+Стоимость проверки цикла в цепочке поставок в зависимости от глубины цепочки.
+
+Сравнивается проверка по таблице замыкания (SupplyLink) с обходом цепочки поставщиков по одному запросу на уровень.
+"""
+from benchmarks import measure, print_table, test_database
+
+from django.db import connection, reset_queries  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from networks.models import NetworkNode, SupplyLink  # noqa: E402
+
+DEPTHS = (10, 100, 500, 1000)
+
+
+def build_chain(depth):
+    """ Цепочка из depth организаций: завод и ретейлеры, каждый следующий - клиент предыдущего """
+    NetworkNode.objects.all().delete()
+    nodes = NetworkNode.objects.bulk_create(
+        [NetworkNode(name=f'Node {i}', level=0 if i == 0 else 1) for i in range(depth)]
+    )
+    for supplier, node in zip(nodes, nodes[1:]):
+        node.supplier = supplier
+    NetworkNode.objects.bulk_update(nodes[1:], ['supplier'], batch_size=1000)
+    SupplyLink.objects.rebuild()
+    return nodes[0], nodes[-1]
+
+
+def walk_chain(node_id, supplier_id):
+    """ Обход цепочки поставщиков в Python: один запрос на каждый уровень """
+    while supplier_id is not None:
+        if supplier_id == node_id:
+            return True
+        supplier_id = NetworkNode.objects.filter(pk=supplier_id).values_list('supplier_id', flat=True).get()
+    return False
+
+
+def main():
+    rows = []
+    with test_database():
+        for depth in DEPTHS:
+            factory, last = build_chain(depth)
+            # Худший случай: завод пытаются сделать клиентом последнего звена цепочки
+            closure = measure(lambda: SupplyLink.objects.creates_cycle(factory.pk, last.pk))
+            walk = measure(lambda: walk_chain(factory.pk, last.pk), repeat=5)
+            reset_queries()
+            with CaptureQueriesContext(connection) as closure_queries:
+                SupplyLink.objects.creates_cycle(factory.pk, last.pk)
+            with CaptureQueriesContext(connection) as walk_queries:
+                walk_chain(factory.pk, last.pk)
+            rows.append([depth, len(closure_queries), closure['p50'], closure['p95'], len(walk_queries), walk['p50']])
+    print_table(['depth', 'queries', 'closure p50 ms', 'closure p95 ms', 'walk queries', 'walk p50 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
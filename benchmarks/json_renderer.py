@@ -0,0 +1,60 @@
+"""
+Скорость кодирования ответов API: JSONRenderer DRF (стандартная библиотека json) и FastJSONRenderer (orjson),
+а также разбора тех же данных JSONParser и FastJSONParser.
+
+Данные - сериализованные списки узлов сети (с контактами и продуктами) и продуктов по 10, 100 и 1000 записей.
+Число повторов задаётся переменной окружения BENCH_REPEAT.
+"""
+import os
+from io import BytesIO, StringIO
+
+from benchmarks import measure, print_table, test_database
+
+from django.core.management import call_command  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from networks import fastjson  # noqa: E402
+from networks.models import NetworkNode, Product  # noqa: E402
+from networks.parsers import FastJSONParser  # noqa: E402
+from networks.renderers import FastJSONRenderer  # noqa: E402
+from networks.serializers import NetworkNodeDetailSerializer, ProductSerializer  # noqa: E402
+
+ROWS = [10, 100, 1000]
+REPEAT = int(os.getenv('BENCH_REPEAT', 50))
+
+
+def main():
+    rows = []
+    with test_database():
+        call_command('generate_network', stdout=StringIO(), factories=10, retailers=max(ROWS), consumers=0,
+                     products=max(ROWS), products_per_node=5)
+        datasets = [
+            ('networks', NetworkNodeDetailSerializer(NetworkNode.objects.for_detail()[:max(ROWS)], many=True).data),
+            ('products', ProductSerializer(Product.objects.for_list()[:max(ROWS)], many=True).data),
+        ]
+
+    for name, data in datasets:
+        for count in ROWS:
+            page = data[:count]
+            content = JSONRenderer().render(page)
+            assert FastJSONRenderer().render(page) == content
+
+            drf = measure(lambda: JSONRenderer().render(page), repeat=REPEAT)
+            fast = measure(lambda: FastJSONRenderer().render(page), repeat=REPEAT)
+            megabytes = len(content) / 1024 / 1024
+            rows.append([name, 'encode', count, len(content), drf['p50'], fast['p50'], drf['p50'] / fast['p50'],
+                         megabytes / fast['p50'] * 1000])
+
+            drf = measure(lambda: JSONParser().parse(BytesIO(content)), repeat=REPEAT)
+            fast = measure(lambda: FastJSONParser().parse(BytesIO(content)), repeat=REPEAT)
+            rows.append([name, 'decode', count, len(content), drf['p50'], fast['p50'], drf['p50'] / fast['p50'],
+                         megabytes / fast['p50'] * 1000])
+
+    backend = 'orjson' if fastjson.orjson is not None else 'json (orjson is not installed)'
+    print(f'p50 of {REPEAT} runs, fast backend: {backend}, output checked to be byte-identical')
+    print_table(['list', 'operation', 'rows', 'bytes', 'DRF ms', 'fast ms', 'speedup', 'fast MB/s'], rows)
+
+
+if __name__ == '__main__':
+    main()
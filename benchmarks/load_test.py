@@ -0,0 +1,139 @@
+"""
+Нагрузочный тест запущенных серверов приложения: пропускная способность и задержки (p50/p95/p99) одной и той же
+смеси запросов для каждого адреса, например production-профиля (gunicorn) и сервера разработки (runserver):
+
+    docker-compose --profile dev up -d app app-dev
+    python -m benchmarks.load_test http://localhost:8000 http://localhost:8001
+
+Смесь - списки организаций, продуктов и контактов, карточки организаций и статический файл админ-панели
+в случайном порядке с зерном BENCH_SEED, поэтому каждый сервер получает одну и ту же последовательность.
+BENCH_CONCURRENCY клиентов с keep-alive соединениями выполняют всего BENCH_REQUESTS запросов после BENCH_WARMUP
+запросов прогрева. Токен выдаёт /api/token/ пользователю SUPERUSER_NAME с паролем SUPERUSER_PASSWORD
+(python manage.py csu). В отличие от остальных бенчмарков тестовая база данных не создаётся: серверы работают
+со своими данными, поэтому профили сравниваются на одном наборе данных (например, generate_network).
+"""
+import http.client
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from benchmarks import percentiles, print_table
+
+CONCURRENCY = int(os.getenv('BENCH_CONCURRENCY', 16))
+REQUESTS = int(os.getenv('BENCH_REQUESTS', 2000))
+WARMUP = int(os.getenv('BENCH_WARMUP', 100))
+SEED = int(os.getenv('BENCH_SEED', 1))
+# Пути смеси и их веса; <pk> заменяется id случайной организации с первой страницы списка
+MIX = [
+    ('/networks/', 4),
+    ('/networks/<pk>/', 4),
+    ('/products/', 2),
+    ('/contacts/', 2),
+    ('/static/admin/css/base.css', 1),
+]
+
+
+class Client:
+    """ Клиент с keep-alive соединением; при ошибке соединение открывается заново """
+
+    def __init__(self, url, token=None):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = dict(self.headers)
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response.status, content
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def obtain_token(url):
+    client = Client(url)
+    status, content = client.request('POST', '/api/token/', {
+        'username': os.getenv('SUPERUSER_NAME'),
+        'password': os.getenv('SUPERUSER_PASSWORD'),
+    })
+    client.close()
+    if status != 200:
+        sys.exit(f'{url}: /api/token/ returned {status}, check SUPERUSER_NAME and SUPERUSER_PASSWORD')
+    return json.loads(content)['access']
+
+
+def build_paths(url, token):
+    """ Последовательность путей смеси, одинаковая для всех серверов при одних данных и зерне """
+    client = Client(url, token)
+    status, content = client.request('GET', '/networks/')
+    client.close()
+    pks = [node['id'] for node in json.loads(content)['results']] if status == 200 else []
+    if not pks:
+        sys.exit(f'{url}: no network nodes to request, load data first (generate_network)')
+
+    generator = random.Random(SEED)
+    paths, weights = zip(*MIX)
+    return [path.replace('<pk>', str(generator.choice(pks)))
+            for path in generator.choices(paths, weights, k=WARMUP + REQUESTS)]
+
+
+def run(url, token, paths):
+    """ Длительности запросов в миллисекундах и число ошибок (ответ не 2xx/3xx или сбой соединения) """
+
+    def worker(chunk):
+        client = Client(url, token)
+        timings, errors = [], 0
+        for path in chunk:
+            start = time.perf_counter()
+            try:
+                status, _ = client.request('GET', path)
+            except (OSError, http.client.HTTPException):
+                status = None
+            timings.append((time.perf_counter() - start) * 1000)
+            errors += status is None or status >= 400
+        client.close()
+        return timings, errors
+
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        list(executor.map(worker, [paths[:WARMUP][number::CONCURRENCY] for number in range(CONCURRENCY)]))
+        start = time.perf_counter()
+        results = list(executor.map(worker, [paths[WARMUP:][number::CONCURRENCY] for number in range(CONCURRENCY)]))
+        elapsed = time.perf_counter() - start
+    timings = [timing for chunk, _ in results for timing in chunk]
+    return timings, sum(errors for _, errors in results), elapsed
+
+
+def main(urls):
+    rows = []
+    for url in urls:
+        token = obtain_token(url)
+        timings, errors, elapsed = run(url, token, build_paths(url, token))
+        timing = percentiles(timings)
+        rows.append([url, len(timings), errors, len(timings) / elapsed, timing['p50'], timing['p95'], timing['p99']])
+
+    print(f'{CONCURRENCY} clients x {REQUESTS} requests (+{WARMUP} warm-up), seed {SEED}')
+    print_table(['server', 'requests', 'errors', 'req/s', 'p50, ms', 'p95, ms', 'p99, ms'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['http://localhost:8000'])
@@ -0,0 +1,103 @@
+"""
+Планы запросов и время поиска по стране, городу, названию и уровню до и после индексов миграции 0004.
+
+Размер набора данных задаётся переменной окружения BENCH_NODES (по умолчанию 20000 организаций).
+"""
+import importlib
+import os
+import random
+
+from benchmarks import measure, print_table, test_database
+
+from django.db import connection  # noqa: E402
+from django.db.models import Exists, OuterRef  # noqa: E402
+
+from networks.models import NetworkNode, Contacts  # noqa: E402
+
+NODES = int(os.getenv('BENCH_NODES', 20000))
+B_TREE_INDEXES = [
+    (Contacts, 'contacts_country_idx'),
+    (Contacts, 'contacts_city_idx'),
+    (NetworkNode, 'networknode_level_idx'),
+]
+search_indexes = importlib.import_module('networks.migrations.0004_search_indexes')
+
+QUERIES = {
+    'search contacts__country': lambda: NetworkNode.objects.filter(Exists(
+        NetworkNode.objects.filter(pk=OuterRef('pk'), contacts__country__icontains='land')
+    )),
+    'country = ...': lambda: Contacts.objects.filter(country='Country 7'),
+    'city icontains': lambda: Contacts.objects.filter(city__icontains='ty 42'),
+    'name icontains': lambda: NetworkNode.objects.filter(name__icontains='node 1234'),
+    'level = 0': lambda: NetworkNode.objects.filter(level=0),
+}
+
+
+def generate():
+    """ Организации с двумя контактами каждая: 50 стран и 1000 городов """
+    rnd = random.Random(0)
+    countries = [f'Country {i}' for i in range(45)] + ['Finland', 'Poland', 'Iceland', 'Ireland', 'Thailand']
+    contacts = Contacts.objects.bulk_create(
+        [
+            Contacts(email=f'node{i}@example.com', country=rnd.choice(countries), city=f'City {rnd.randrange(1000)}')
+            for i in range(NODES * 2)
+        ],
+        batch_size=5000,
+    )
+    nodes = NetworkNode.objects.bulk_create(
+        [NetworkNode(name=f'Node {i}', level=0 if i % 100 == 0 else 1) for i in range(NODES)],
+        batch_size=5000,
+    )
+    through = NetworkNode.contacts.through
+    through.objects.bulk_create(
+        [
+            through(networknode_id=node.pk, contacts_id=contacts[2 * i + shift].pk)
+            for i, node in enumerate(nodes)
+            for shift in (0, 1)
+        ],
+        batch_size=5000,
+    )
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+def drop_indexes():
+    with connection.schema_editor() as editor:
+        for model, name in B_TREE_INDEXES:
+            editor.remove_index(model, next(index for index in model._meta.indexes if index.name == name))
+        search_indexes.drop_trigram_indexes(None, editor)
+
+
+def create_indexes():
+    with connection.schema_editor() as editor:
+        for model, name in B_TREE_INDEXES:
+            editor.add_index(model, next(index for index in model._meta.indexes if index.name == name))
+        search_indexes.create_trigram_indexes(None, editor)
+
+
+def run(label):
+    results = {}
+    for name, query in QUERIES.items():
+        print(f'--- {label}: {name}')
+        print(query().explain())
+        results[name] = measure(lambda: list(query().values_list('pk', flat=True)), repeat=20)
+    return results
+
+
+def main():
+    with test_database():
+        generate()
+        drop_indexes()
+        before = run('before')
+        create_indexes()
+        after = run('after')
+    print()
+    print_table(
+        ['query', 'before p50 ms', 'after p50 ms', 'before p95 ms', 'after p95 ms'],
+        [[name, before[name]['p50'], after[name]['p50'], before[name]['p95'], after[name]['p95']] for name in QUERIES],
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Время сериализации страниц списков узлов сети и продуктов: обычный ListSerializer DRF и CompiledListSerializer.
+
+Объекты загружаются один раз с предзагрузкой, как в представлениях, поэтому измеряется только сериализация.
+Число повторов задаётся переменной окружения BENCH_REPEAT.
+"""
+import os
+from io import StringIO
+
+from benchmarks import measure, print_table, test_database
+
+from django.core.management import call_command  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.serializers import ListSerializer  # noqa: E402
+
+from networks.models import NetworkNode, Product  # noqa: E402
+from networks.serializers import NetworkNodeSerializer, ProductSerializer  # noqa: E402
+
+ROWS = [10, 100, 1000]
+REPEAT = int(os.getenv('BENCH_REPEAT', 50))
+
+
+def main():
+    rows = []
+    with test_database():
+        call_command('generate_network', stdout=StringIO(), factories=10, retailers=max(ROWS), consumers=0,
+                     products=max(ROWS), products_per_node=5)
+        datasets = [
+            ('networks', NetworkNodeSerializer, list(NetworkNode.objects.for_list()[:max(ROWS)])),
+            ('products', ProductSerializer, list(Product.objects.for_list()[:max(ROWS)])),
+        ]
+
+        for name, serializer_class, objects in datasets:
+            for count in ROWS:
+                page = objects[:count]
+                regular = ListSerializer(child=serializer_class(), instance=page).data
+                assert JSONRenderer().render(serializer_class(page, many=True).data) == JSONRenderer().render(regular)
+
+                drf = measure(lambda: ListSerializer(child=serializer_class(), instance=page).data, repeat=REPEAT)
+                compiled = measure(lambda: serializer_class(page, many=True).data, repeat=REPEAT)
+                rows.append([name, count, drf['p50'], compiled['p50'], drf['p50'] / compiled['p50']])
+
+    print(f'p50 of {REPEAT} runs, output checked to be byte-identical')
+    print_table(['list', 'rows', 'DRF ms', 'compiled ms', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
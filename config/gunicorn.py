@@ -0,0 +1,32 @@
+"""
+Настройки gunicorn для запуска приложения в production: gunicorn -c config/gunicorn.py
+
+Каждый процесс обрабатывает запросы в APP_SERVER_THREADS потоках (класс gthread, WSGI config.wsgi): пока поток
+ждёт базу данных, процесс обслуживает другие запросы. С APP_SERVER_WORKER_CLASS=uvicorn_worker.UvicornWorker
+процессы запускают ASGI-приложение config.asgi, и асинхронные эндпоинты не занимают поток на время запросов.
+Соединений с базой данных не больше WEB_CONCURRENCY * APP_SERVER_THREADS (с пулом - POSTGRES_POOL_MAX_SIZE
+на процесс).
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('APP_SERVER_BIND', '0.0.0.0:8000')
+
+# Процессов по умолчанию 2 на ядро + 1; WEB_CONCURRENCY - переменная окружения gunicorn для числа процессов
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('APP_SERVER_THREADS', 4))
+worker_class = os.getenv('APP_SERVER_WORKER_CLASS', 'gthread')
+wsgi_app = 'config.asgi:application' if worker_class.startswith('uvicorn') else 'config.wsgi:application'
+
+# Процесс, не ответивший timeout секунд, перезапускается; keep-alive соединения клиентов держатся keepalive секунд
+timeout = int(os.getenv('APP_SERVER_TIMEOUT', 30))
+graceful_timeout = timeout
+keepalive = int(os.getenv('APP_SERVER_KEEPALIVE', 5))
+
+# Процесс перезапускается после max_requests запросов (с разбросом, чтобы не все сразу): ограничивает рост памяти
+max_requests = int(os.getenv('APP_SERVER_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
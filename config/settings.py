@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
+import importlib.util
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -26,7 +27,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# С DEBUG каждое соединение хранит все выполненные SQL-запросы в памяти; включается только для разработки
+DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS').split(',')
 
@@ -50,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'networks.instrumentation.QueryInstrumentationMiddleware',
+    'networks.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,8 +63,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Статические файлы отдаёт процесс приложения через WhiteNoise - необязательная зависимость (extras production)
+if importlib.util.find_spec('whitenoise') is not None:
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'config.urls'
 
+# Без OPTIONS['loaders'] шаблоны загружаются через django.template.loaders.cached.Loader: каждый шаблон
+# разбирается один раз на процесс (при DEBUG кэш сбрасывается при изменении файлов runserver)
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -90,9 +101,110 @@ DATABASES = {
         'HOST': os.getenv('POSTGRES_HOST'),
         'PORT': 5432,
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
+        # Постоянные соединения: время жизни соединения между запросами, секунды (0 - закрывать после запроса),
+        # и проверка соединения перед использованием в следующем запросе
+        'CONN_MAX_AGE': int(os.getenv('POSTGRES_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('POSTGRES_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# Пул соединений процесса (networks.backends.postgresql_pool) при POSTGRES_POOL_MAX_SIZE > 0: наименьшее и
+# наибольшее число соединений, ожидание свободного соединения, секунды, и время жизни соединения, секунды.
+# Соединения хранит пул, поэтому Django возвращает их после каждого запроса (CONN_MAX_AGE = 0)
+if int(os.getenv('POSTGRES_POOL_MAX_SIZE', 0)) > 0:
+    DATABASES['default'].update({
+        'ENGINE': 'networks.backends.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', 0)),
+                'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE')),
+                'timeout': float(os.getenv('POSTGRES_POOL_TIMEOUT', 10)),
+                'max_lifetime': float(os.getenv('POSTGRES_POOL_MAX_LIFETIME', 3600)),
+            },
+        },
+    })
+
+# Реплики для чтения: адреса через запятую, база данных и пользователь те же, что у основной.
+# Чтение безопасных запросов API и админ-панели направляется на реплики (networks.replicas)
+for number, host in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['networks.replicas.ReplicaRouter']
+
+# Время после изменяющего запроса, в течение которого клиент читает с основной базы данных, секунды
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Время жизни кэша ответов API узлов сети, секунды
+NETWORKS_CACHE_TIMEOUT = int(os.getenv('NETWORKS_CACHE_TIMEOUT', 300))
+
+# Время жизни кэша аналитики задолженности, секунды
+NETWORKS_ANALYTICS_CACHE_TIMEOUT = int(os.getenv('NETWORKS_ANALYTICS_CACHE_TIMEOUT', 60))
+
+# Кэш пользователей JWT-аутентификации в памяти процесса: число пользователей и время жизни записи, секунды.
+# Время жизни ограничивает задержку блокировки пользователя (is_active) в других процессах
+USERS_AUTH_CACHE_SIZE = int(os.getenv('USERS_AUTH_CACHE_SIZE', 1024))
+USERS_AUTH_CACHE_TIMEOUT = int(os.getenv('USERS_AUTH_CACHE_TIMEOUT', 30))
+
+# Действия админ-панели над выборкой от этого числа объектов ставятся в очередь фоновых задач
+ADMIN_ACTIONS_BACKGROUND_THRESHOLD = int(os.getenv('ADMIN_ACTIONS_BACKGROUND_THRESHOLD', 10000))
+
+# Списки админ-панели: время кэширования количества строк и вариантов фильтров, секунды, и размер таблицы,
+# начиная с которого количество строк без фильтров берётся из статистики PostgreSQL
+ADMIN_CHANGELIST_CACHE_TIMEOUT = int(os.getenv('ADMIN_CHANGELIST_CACHE_TIMEOUT', 60))
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000))
+
+# Фоновые задачи (run_jobs): число процессов обработчика, интервал опроса очереди, секунды, число попыток задачи,
+# задержка первого повтора, секунды (каждый следующий - вдвое дольше), время без отметки о ходе выполнения,
+# после которого задача считается брошенной и возвращается в очередь, секунды, и каталог файлов выгрузок
+JOBS_WORKER_PROCESSES = int(os.getenv('JOBS_WORKER_PROCESSES', 2))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
+JOBS_RETRY_DELAY = int(os.getenv('JOBS_RETRY_DELAY', 30))
+JOBS_STALE_TIMEOUT = int(os.getenv('JOBS_STALE_TIMEOUT', 300))
+JOBS_RESULT_DIR = os.getenv('JOBS_RESULT_DIR', str(BASE_DIR / 'job_results'))
+
+# Бюджеты SQL-запросов представлений: при True превышение вызывает исключение, иначе пишется в лог
+NETWORKS_QUERY_BUDGET_STRICT = os.getenv('NETWORKS_QUERY_BUDGET_STRICT', 'False') == 'True'
+
+# Logging
+# https://docs.djangoproject.com/en/5.0/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # Метрики запросов к API; INFO - каждый запрос, WARNING - только превышения бюджета SQL-запросов
+        'networks.instrumentation': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_METRICS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -126,6 +238,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = 'static/'
+# Каталог для collectstatic
+STATIC_ROOT = os.getenv('STATIC_ROOT', str(BASE_DIR / 'staticfiles'))
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # В production - whitenoise.storage.CompressedManifestStaticFilesStorage: collectstatic добавляет хэш
+    # содержимого в имена файлов и сжимает их заранее, WhiteNoise отдаёт их с кэшированием на год
+    'staticfiles': {
+        'BACKEND': os.getenv('STATICFILES_BACKEND', 'django.contrib.staticfiles.storage.StaticFilesStorage'),
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -134,7 +259,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'networks.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'networks.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_PAGINATION_CLASS': 'networks.pagination.CustomPaginator',
     'PAGE_SIZE': 10,
@@ -0,0 +1,110 @@
+"""
+Операции админ-панели над множествами организаций.
+
+Проверки и изменения выполняются запросами по частям из CHUNK_SIZE организаций, поэтому число запросов
+не зависит от размера выборки в пределах части и растёт на один-два запроса на каждую следующую часть.
+Массовые UPDATE не отправляют сигналы сохранения: иерархия поставок и кэш обновляются явно.
+Большие выборки выполняются фоновой задачей task с параметрами params() (networks.tasks).
+"""
+
+from django.db import transaction
+from django.db.models import Q
+
+from networks.bulk import chunked
+from networks.cache import invalidate_nodes
+from networks.ledger import zero_out_debt
+from networks.models import NetworkNode, SupplyLink
+
+
+class SupplierReassignment:
+    """ Назначение одного поставщика выбранным организациям вместе со всеми их клиентами """
+
+    task = 'networks.reassign_supplier'
+
+    def __init__(self, pks, supplier_id):
+        self.pks = sorted(set(pks))
+        self.supplier_id = supplier_id
+        self.errors = []
+
+    def params(self):
+        return {'pks': self.pks, 'supplier_id': self.supplier_id}
+
+    def is_valid(self):
+        """ Заводы не имеют поставщика; поставщик не может быть выбранной организацией или её клиентом """
+        if not NetworkNode.objects.filter(pk=self.supplier_id).exists():
+            self.errors.append(f'Invalid pk "{self.supplier_id}" - object does not exist.')
+            return False
+        for chunk in chunked(self.pks):
+            if NetworkNode.objects.filter(pk__in=chunk, level=0).exists():
+                self.errors.append('Factory cannot have a supplier.')
+                break
+        for chunk in chunked(self.pks):
+            if SupplyLink.objects.filter(ancestor_id__in=chunk, descendant_id=self.supplier_id).exists():
+                self.errors.append('An organisation cannot be supplied by its own client.')
+                break
+        return not self.errors
+
+    @transaction.atomic
+    def save(self):
+        for chunk in chunked(self.pks):
+            NetworkNode.objects.filter(pk__in=chunk).update(supplier_id=self.supplier_id)
+        SupplyLink.objects.move_subtrees(self.pks)
+        transaction.on_commit(lambda: invalidate_nodes(self.pks))
+        return len(self.pks)
+
+
+class LevelChange:
+    """ Изменение уровня выбранных организаций с проверкой правил уровней для выборки целиком """
+
+    task = 'networks.change_level'
+
+    def __init__(self, pks, level):
+        self.pks = sorted(set(pks))
+        self.level = level
+        self.errors = []
+
+    def params(self):
+        return {'pks': self.pks, 'level': self.level}
+
+    def is_valid(self):
+        """ Завод не имеет поставщика и задолженности, ретейл и ИП имеют поставщика """
+        if self.level == 0:
+            rules = [
+                (Q(supplier__isnull=False), 'Factory cannot have a supplier.'),
+                (~Q(debt_amount=0), 'The factory cannot be in debt as it has no supplier.'),
+            ]
+        else:
+            rules = [(Q(supplier__isnull=True), 'Retail or Consumer must have a supplier.')]
+        for condition, message in rules:
+            for chunk in chunked(self.pks):
+                if NetworkNode.objects.filter(condition, pk__in=chunk).exists():
+                    self.errors.append(message)
+                    break
+        return not self.errors
+
+    @transaction.atomic
+    def save(self):
+        for chunk in chunked(self.pks):
+            NetworkNode.objects.filter(pk__in=chunk).update(level=self.level)
+        transaction.on_commit(lambda: invalidate_nodes(self.pks))
+        return len(self.pks)
+
+
+class DebtReset:
+    """ Обнуление задолженности выбранных организаций проводками журнала (networks.ledger.zero_out_debt) """
+
+    task = 'networks.zero_out_debt'
+
+    def __init__(self, pks):
+        self.pks = sorted(set(pks))
+        self.errors = []
+
+    def params(self):
+        return {'pks': self.pks}
+
+    def is_valid(self):
+        return True
+
+    def save(self):
+        zero_out_debt(self.pks)
+        return len(self.pks)
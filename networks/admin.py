@@ -1,52 +1,192 @@
+from django import forms
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.html import format_html
 
-from networks.models import NetworkNode, Product, Contacts
+from networks.actions import SupplierReassignment, LevelChange, DebtReset
+from networks.admin_actions import action_parameters, perform
+from networks.admin_changelist import ScalableChangeListMixin, CachedValuesListFilter, DebtRangeListFilter, \
+    FactorySalesChannelListFilter
+from networks.export import EXPORT_FORMATS
+from networks.jobs import enqueue
+from networks.models import NetworkNode, Product, Contacts, DebtTransaction, Job
+
+
+class FirstClientsFormSet(BaseInlineFormSet):
+    """ Формы только первых клиентов организации: у завода их может быть сотни тысяч """
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            queryset = super().get_queryset()
+            pks = list(queryset.values_list('pk', flat=True)[:SupplierInline.max_clients])
+            self._queryset = queryset.filter(pk__in=pks)
+        return self._queryset
 
 
 class SupplierInline(admin.TabularInline):
-    """ Отображает дополнительные сведения о клиентах в карточке организации """
+    """ Отображает дополнительные сведения о первых клиентах в карточке организации """
     model = NetworkNode
+    formset = FirstClientsFormSet
+    fields = ('name', 'level', 'debt_amount')
+    readonly_fields = ('debt_amount',)
     extra = 1
+    show_change_link = True
+    max_clients = 20
     verbose_name = "Client"
     verbose_name_plural = "Clients"
 
 
+class SupplierForm(forms.Form):
+    """ Поставщик по id: список всех организаций на странице действия был бы слишком велик """
+    supplier = forms.ModelChoiceField(queryset=NetworkNode.objects.all(), widget=forms.NumberInput,
+                                      label='Supplier id')
+
+
+class LevelForm(forms.Form):
+    level = forms.TypedChoiceField(choices=NetworkNode.LEVELS_CHOICES, coerce=int)
+
+
+class ExportForm(forms.Form):
+    export_format = forms.ChoiceField(choices=[(name, name) for name in sorted(EXPORT_FORMATS)], label='Format')
+
+
 @admin.register(NetworkNode)
-class NetworkNodeAdmin(admin.ModelAdmin):
-    fields = ('name', 'level', 'supplier', 'debt_amount', 'creation_time')
+class NetworkNodeAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    fields = ('name', 'level', 'supplier', 'debt_amount', 'creation_time', 'clients')
     list_display = ('id', 'name', 'level', 'supplier', 'debt_amount')
-    readonly_fields = ('contacts', 'products', 'creation_time')
+    readonly_fields = ('contacts', 'products', 'debt_amount', 'creation_time', 'clients')
     list_display_links = ('id', 'name', 'supplier')
+    list_select_related = ('supplier',)
+    raw_id_fields = ('supplier',)
     search_fields = ('name', 'contacts__city')
-    list_filter = ('level', 'contacts__country', 'debt_amount')
-    actions = ('zero_out_debt',)
+    list_filter = ('level', ('contacts__country', CachedValuesListFilter), DebtRangeListFilter)
+    actions = ('zero_out_debt', 'reassign_supplier', 'change_level', 'export_nodes')
     ordering = ('name',)
     list_per_page = 10
     inlines = [SupplierInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_admin()
+
+    @admin.display(description='All clients')
+    def clients(self, obj):
+        """ Ссылка на список всех клиентов: в карточке выводятся только первые SupplierInline.max_clients """
+        url = reverse('admin:networks_networknode_changelist')
+        return format_html('<a href="{}?supplier__id__exact={}">{} clients</a>', url, obj.pk, obj.supplied_by.count())
+
     @admin.action(description='Clear the debt of selected customers')
     def zero_out_debt(self, request, queryset):
-        queryset.update(debt_amount=0.00)
-        self.message_user(request, f'The debt was set to zero.')
+        # Обнуление записывается в журнал задолженности проводками
+        pks = list(queryset.values_list('pk', flat=True))
+        perform(self, request, DebtReset(pks), len(pks), 'The debt was set to zero')
+
+    @admin.action(description='Reassign supplier of selected network nodes')
+    def reassign_supplier(self, request, queryset):
+        data, response = action_parameters(self, request, queryset, SupplierForm, 'reassign_supplier',
+                                           'Reassign supplier')
+        if response is not None:
+            return response
+        pks = list(queryset.values_list('pk', flat=True))
+        perform(self, request, SupplierReassignment(pks, data['supplier'].pk), len(pks), 'Supplier reassigned')
+
+    @admin.action(description='Change level of selected network nodes')
+    def change_level(self, request, queryset):
+        data, response = action_parameters(self, request, queryset, LevelForm, 'change_level', 'Change level')
+        if response is not None:
+            return response
+        pks = list(queryset.values_list('pk', flat=True))
+        perform(self, request, LevelChange(pks, data['level']), len(pks), 'Level changed')
+
+    @admin.action(description='Export selected network nodes in the background')
+    def export_nodes(self, request, queryset):
+        data, response = action_parameters(self, request, queryset, ExportForm, 'export_nodes', 'Export')
+        if response is not None:
+            return response
+        # "Выбрать все" без фильтров - выгрузка всей сети без перечисления id
+        pks = list(queryset.values_list('pk', flat=True)) if queryset.query.where else None
+        job = enqueue('networks.export', created_by=request.user, export_format=data['export_format'], pks=pks)
+        url = reverse('admin:networks_job_change', args=[job.pk])
+        self.message_user(request, format_html('Export is queued as <a href="{}">job #{}</a>.', url, job.pk))
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('id', 'name', 'model', 'release_date')
-    readonly_fields = ('sales_channel',)
+    fields = ('name', 'model', 'release_date', 'sales_channels')
+    readonly_fields = ('sales_channels',)
     list_display_links = ('id', 'name')
     search_fields = ('name',)
-    list_filter = ('sales_channel__name',)
+    list_filter = (FactorySalesChannelListFilter,)
     ordering = ('name',)
     list_per_page = 10
+    max_sales_channels = 20
+
+    @admin.display(description='Sales channels')
+    def sales_channels(self, obj):
+        """ Количество и первые каналы продаж: у продукта их могут быть сотни тысяч """
+        names = list(obj.sales_channel.order_by('pk').values_list('name', flat=True)[:self.max_sales_channels])
+        count = obj.sales_channel.count() if len(names) == self.max_sales_channels else len(names)
+        more = f' and {count - len(names)} more' if count > len(names) else ''
+        return f'{count}: {", ".join(names)}{more}' if names else '-'
 
 
 @admin.register(Contacts)
-class ContactsAdmin(admin.ModelAdmin):
+class ContactsAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('id', 'network_node', 'email', 'department', 'country', 'city', 'street', 'building')
     readonly_fields = ('network_node',)
     list_display_links = ('id', 'network_node')
+    list_select_related = ('network_node',)
     search_fields = ('network_node__name',)
-    list_filter = ('country', 'city')
+    list_filter = (('country', CachedValuesListFilter), ('city', CachedValuesListFilter))
     ordering = ('network_node',)
     list_per_page = 10
+
+
+@admin.register(DebtTransaction)
+class DebtTransactionAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    """ Журнал задолженности только для просмотра: проводки не изменяются и не удаляются """
+    list_display = ('id', 'network_node', 'amount', 'comment', 'created_at')
+    list_display_links = ('id',)
+    list_select_related = ('network_node',)
+    search_fields = ('network_node__name', 'comment')
+    raw_id_fields = ('network_node',)
+    ordering = ('-pk',)
+    list_per_page = 10
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    """ Фоновые задачи только для просмотра и повтора: задачи изменяет обработчик run_jobs """
+    list_display = ('id', 'task', 'status', 'progress', 'attempts', 'created_by', 'created_at', 'finished_at')
+    list_display_links = ('id', 'task')
+    list_select_related = ('created_by',)
+    list_filter = ('status',)
+    search_fields = ('task',)
+    actions = ('retry_jobs',)
+    ordering = ('-pk',)
+    list_per_page = 10
+
+    @admin.display(description='Progress')
+    def progress(self, obj):
+        progress = obj.progress
+        return f'{progress}%' if progress is not None else f'{obj.done}'
+
+    @admin.action(description='Retry selected failed jobs')
+    def retry_jobs(self, request, queryset):
+        self.message_user(request, f'{queryset.retry()} jobs queued again.')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,58 @@
+"""
+Общие части действий админ-панели над множествами объектов: форма параметров действия на промежуточной
+странице и выполнение операции сразу или в фоне для больших выборок.
+
+Операция - объект с методами is_valid() и save() и списком errors (networks.actions, users.actions).
+"""
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+
+from networks.jobs import enqueue
+
+
+def action_parameters(modeladmin, request, queryset, form_class, action, title):
+    """
+    Параметры действия: (cleaned_data, None) после отправки формы или (None, промежуточная страница с формой).
+    Выбор объектов, в том числе "выбрать все" с фильтрами списка, передаётся дальше без перечисления id.
+    """
+    if 'apply' in request.POST:
+        form = form_class(request.POST)
+        if form.is_valid():
+            return form.cleaned_data, None
+    else:
+        form = form_class()
+
+    context = {
+        **modeladmin.admin_site.each_context(request),
+        'title': title,
+        'opts': modeladmin.model._meta,
+        'form': form,
+        'action': action,
+        'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+        'select_across': request.POST.get('select_across', '0'),
+        'count': queryset.count(),
+    }
+    return None, TemplateResponse(request, 'admin/action_form.html', context)
+
+
+def perform(modeladmin, request, operation, count, description):
+    """
+    Проверка операции и её выполнение: сразу или, начиная с ADMIN_ACTIONS_BACKGROUND_THRESHOLD объектов,
+    фоновой задачей, чтобы запрос админ-панели не упирался в таймаут сервера
+    """
+    if not operation.is_valid():
+        for error in operation.errors:
+            modeladmin.message_user(request, error, messages.ERROR)
+        return
+
+    if count >= settings.ADMIN_ACTIONS_BACKGROUND_THRESHOLD:
+        job = enqueue(operation.task, created_by=request.user, **operation.params())
+        modeladmin.message_user(request, f'{description}: {count} objects will be updated in the background '
+                                         f'(job #{job.pk}).')
+    else:
+        operation.save()
+        modeladmin.message_user(request, f'{description}: {count} objects updated.')
@@ -0,0 +1,107 @@
+"""
+Списки админ-панели на больших таблицах.
+
+Django для каждой страницы списка считает строки выборки и таблицы целиком и строит варианты фильтров
+запросами DISTINCT по всей таблице. Здесь количество строк без фильтров оценивается по статистике
+PostgreSQL, точные количества и варианты фильтров кэшируются на ADMIN_CHANGELIST_CACHE_TIMEOUT секунд.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор с оценкой количества строк. Без фильтров на PostgreSQL количество берётся из pg_class.reltuples,
+    если оценка не меньше ADMIN_ESTIMATED_COUNT_THRESHOLD; иначе точное количество кэшируется по тексту запроса.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        estimate = self.estimate(queryset)
+        if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+
+        key = 'admin:count:' + hashlib.md5(f'{queryset.db}:{queryset.query}'.encode()).hexdigest()
+        return cache.get_or_set(key, queryset.count, settings.ADMIN_CHANGELIST_CACHE_TIMEOUT)
+
+    @staticmethod
+    def estimate(queryset):
+        """ Оценка числа строк таблицы по статистике PostgreSQL или None, если оценки нет """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where or queryset.query.distinct:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # До первого ANALYZE reltuples равно -1
+        return row[0] if row and row[0] >= 0 else None
+
+
+class CachedValuesListFilter(admin.AllValuesFieldListFilter):
+    """ Фильтр по значениям поля, как list_filter по имени поля, с кэшированным списком вариантов """
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = f'admin:filter:{model._meta.label_lower}:{field_path}'
+        self.lookup_choices = cache.get_or_set(key, lambda: list(self.lookup_choices),
+                                               settings.ADMIN_CHANGELIST_CACHE_TIMEOUT)
+
+
+class DebtRangeListFilter(admin.SimpleListFilter):
+    """ Фильтр задолженности по диапазонам вместо списка всех различных сумм """
+
+    title = 'debt'
+    parameter_name = 'debt_range'
+    ranges = {
+        'negative': ('Overpaid', Q(debt_amount__lt=0)),
+        'zero': ('No debt', Q(debt_amount=0)),
+        'lt1000': ('Up to 1 000', Q(debt_amount__gt=0, debt_amount__lt=1000)),
+        'lt10000': ('1 000 - 10 000', Q(debt_amount__gte=1000, debt_amount__lt=10000)),
+        'gte10000': ('10 000 and more', Q(debt_amount__gte=10000)),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(value, title) for value, (title, _) in self.ranges.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() in self.ranges:
+            return queryset.filter(self.ranges[self.value()][1])
+        return queryset
+
+
+class FactorySalesChannelListFilter(admin.SimpleListFilter):
+    """ Фильтр продуктов по заводу среди каналов продаж: список всех организаций был бы слишком велик """
+
+    title = 'factory'
+    parameter_name = 'factory'
+
+    def lookups(self, request, model_admin):
+        from networks.models import NetworkNode
+
+        return cache.get_or_set(
+            'admin:filter:networks.product:factory',
+            lambda: list(NetworkNode.objects.filter(level=0).order_by('name').values_list('pk', 'name')),
+            settings.ADMIN_CHANGELIST_CACHE_TIMEOUT,
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(sales_channel=self.value())
+        return queryset
+
+
+class ScalableChangeListMixin:
+    """ Оценка количества строк без второго подсчёта по всей таблице """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
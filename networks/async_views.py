@@ -0,0 +1,168 @@
+"""
+Асинхронные (ASGI) эндпоинты чтения списков и карточек узлов сети, продуктов и контактов.
+
+Данные читаются асинхронным ORM (acount, aiterator, aget), поэтому обработчик не занимает поток на время
+запросов к базе данных. Сериализация выполняется в цикле событий над уже загруженными и предзагруженными
+объектами: обращение к базе данных из сериалайзера вызовет SynchronousOnlyOperation.
+Ответы совпадают с синхронными представлениями networks.views: те же queryset, сериалайзеры, пагинация
+по номеру страницы (параметр page_size), поиск и JSON-рендерер.
+"""
+
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from networks.filters import IndexedSearchFilter
+from networks.serializers import NetworkNodeSerializer, NetworkNodeDetailSerializer, ProductSerializer, \
+    ContactsSerializer
+from networks.views import NetworkNodeAPIView, NetworkNodeRetrieveAPIView, ProductViewSet, ContactsViewSet
+from users.authentication import CachedJWTAuthentication
+
+
+class AsyncReadView(View):
+    """ Базовое асинхронное представление чтения: JWT-аутентификация и права IsAuthenticated, IsActive """
+
+    http_method_names = ['get']
+    authentication_class = CachedJWTAuthentication
+    serializer_class = None
+    queryset = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await self.authenticate(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            headers = {}
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                headers['WWW-Authenticate'] = self.authentication_class().authenticate_header(request)
+                exc.status_code = status.HTTP_401_UNAUTHORIZED
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return self.render(data, exc.status_code, headers)
+
+    async def authenticate(self, request):
+        """ Пользователь по JWT: токен проверяется без обращения к базе данных, пользователь читается асинхронно """
+        authentication = self.authentication_class()
+        header = authentication.get_header(request)
+        raw_token = header and authentication.get_raw_token(header)
+        if not raw_token:
+            raise exceptions.NotAuthenticated()
+        user = await sync_to_async(authentication.get_user)(authentication.get_validated_token(raw_token))
+        if not user.is_active:
+            raise exceptions.PermissionDenied()
+        return user
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get_serializer(self, *args, **kwargs):
+        return self.serializer_class(*args, context={'request': self.request, 'view': self}, **kwargs)
+
+    def render(self, data, status_code=status.HTTP_200_OK, headers=None):
+        renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else \
+            renderer.media_type
+        return HttpResponse(renderer.render(data), status=status_code, content_type=content_type, headers=headers)
+
+
+class AsyncListView(AsyncReadView):
+    """ Асинхронный список с пагинацией по номеру страницы, как у CustomPaginator """
+
+    page_size = api_settings.PAGE_SIZE
+    page_query_param = 'page_size'
+    search_fields = None
+
+    def filter_queryset(self, queryset):
+        if not self.search_fields:
+            return queryset
+        return IndexedSearchFilter().filter_queryset(Request(self.request), queryset, self)
+
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        count = await queryset.acount()
+
+        pages = max(1, -(-count // self.page_size))
+        page = request.GET.get(self.page_query_param, 1)
+        if page == 'last':
+            page = pages
+        try:
+            page = int(page)
+        except ValueError:
+            page = 0
+        if not 1 <= page <= pages:
+            raise exceptions.NotFound('Invalid page.')
+
+        start = (page - 1) * self.page_size
+        objects = [obj async for obj in queryset[start:start + self.page_size].aiterator(chunk_size=self.page_size)]
+        return self.render(OrderedDict([
+            ('count', count),
+            ('next', self.get_page_link(page + 1) if page < pages else None),
+            ('previous', self.get_page_link(page - 1) if page > 1 else None),
+            ('results', self.get_serializer(objects, many=True).data),
+        ]))
+
+    def get_page_link(self, page):
+        url = self.request.build_absolute_uri()
+        if page == 1:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, page)
+
+
+class AsyncDetailView(AsyncReadView):
+    """ Асинхронная карточка объекта по pk """
+
+    async def get(self, request, pk, *args, **kwargs):
+        queryset = self.get_queryset()
+        try:
+            instance = await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            raise exceptions.NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+        return self.render(self.get_serializer(instance).data)
+
+
+class AsyncNetworkNodeListView(AsyncListView):
+    """ Асинхронный список узлов сети с поиском по стране """
+    queryset = NetworkNodeAPIView.queryset.for_list()
+    serializer_class = NetworkNodeSerializer
+    search_fields = NetworkNodeAPIView.search_fields
+    query_budget = NetworkNodeAPIView.query_budget['GET']
+
+
+class AsyncNetworkNodeDetailView(AsyncDetailView):
+    """ Асинхронная карточка узла сети """
+    queryset = NetworkNodeRetrieveAPIView.queryset
+    serializer_class = NetworkNodeDetailSerializer
+    query_budget = NetworkNodeRetrieveAPIView.query_budget['GET']
+
+
+class AsyncProductListView(AsyncListView):
+    """ Асинхронный список продуктов """
+    queryset = ProductViewSet.queryset
+    serializer_class = ProductSerializer
+    query_budget = ProductViewSet.query_budget['GET']
+
+
+class AsyncProductDetailView(AsyncDetailView):
+    """ Асинхронная карточка продукта """
+    queryset = ProductViewSet.queryset
+    serializer_class = ProductSerializer
+    query_budget = ProductViewSet.query_budget['GET']
+
+
+class AsyncContactsListView(AsyncListView):
+    """ Асинхронный список контактов """
+    queryset = ContactsViewSet.queryset
+    serializer_class = ContactsSerializer
+    query_budget = ContactsViewSet.query_budget['GET']
+
+
+class AsyncContactsDetailView(AsyncDetailView):
+    """ Асинхронная карточка контакта """
+    queryset = ContactsViewSet.queryset
+    serializer_class = ContactsSerializer
+    query_budget = ContactsViewSet.query_budget['GET']
@@ -0,0 +1,92 @@
+"""
+Бэкенд PostgreSQL с пулом соединений процесса (networks.db_pool).
+
+Настройки пула - OPTIONS['pool'] базы данных, как у встроенного пула Django 5.1:
+{'min_size': 0, 'max_size': 10, 'timeout': 30, 'max_lifetime': 3600}. Закрытие соединения Django (в конце
+запроса при CONN_MAX_AGE = 0) возвращает его в пул; при CONN_HEALTH_CHECKS свободное соединение проверяется
+перед выдачей. Время ожидания соединения учитывается в метриках запроса (networks.instrumentation).
+"""
+
+import os
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as PostgreSQLDatabaseCreation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.utils.asyncio import async_unsafe
+
+from networks.db_pool import get_pool, pools, pools_lock
+from networks.instrumentation import current_metrics
+
+# Состояние транзакции соединения (psycopg2 и psycopg 3)
+TRANSACTION_STATUS_IDLE = 0
+TRANSACTION_STATUS_UNKNOWN = 4
+
+
+class DatabaseCreation(PostgreSQLDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Свободные соединения пула с тестовой базой данных мешают её удалению
+        with pools_lock:
+            matching = [pool for key, pool in pools.items() if key[0] == self.connection.alias]
+        for pool in matching:
+            pool.close_all()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_pool(self, conn_params):
+        # Отдельный пул для каждого процесса: соединения не наследуются после fork
+        key = (self.alias, os.getpid(), tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+        options = self.settings_dict['OPTIONS'].get('pool') or {}
+        pool = get_pool(key, self.alias, **options)
+        if pool.min_size:
+            pool.warm_up(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        return pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        connection, waited = pool.getconn(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            self.check_pooled if self.settings_dict['CONN_HEALTH_CHECKS'] else None,
+        )
+        # Уровень изоляции задаётся при открытии соединения, у выданного из пула он тот же
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        self.pool = pool
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.pool_checkouts += 1
+            metrics.pool_wait += waited
+        return connection
+
+    @staticmethod
+    def check_pooled(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Exception:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection = self.connection
+        status = connection.info.transaction_status if not connection.closed else TRANSACTION_STATUS_UNKNOWN
+        discard = status == TRANSACTION_STATUS_UNKNOWN
+        if not discard and status != TRANSACTION_STATUS_IDLE:
+            # Незавершённая транзакция не переходит к следующему запросу
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+        self.pool.putconn(connection, discard=discard)
@@ -0,0 +1,290 @@
+from decimal import Decimal
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from networks.cache import invalidate_nodes
+from networks.models import NetworkNode, Contacts, Product, SupplyLink, DebtTransaction
+from networks.validators import SupplierValidator, FactoryDebtValidator
+
+CHUNK_SIZE = 1000
+
+
+def chunked(values, size=CHUNK_SIZE):
+    """ Разбиение значений на части для запросов с IN и пакетной записи """
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class NetworkNodeBulkUpsert:
+    """
+    Пакетное создание и обновление узлов сети по уникальному названию.
+
+    Все проверки выполняются для пакета целиком запросами по множествам значений, без запросов на каждую запись.
+    Поставщик задаётся id существующей организации (supplier) или названием (supplier_name) - существующей
+    организации или другой записи того же пакета.
+    Узел сети определяется ключом: id для существующих организаций и названием для новых.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.errors = {}
+        self.existing = {}
+        self.keys = []
+        self.suppliers = {}
+
+    def add_error(self, index, field, message):
+        self.errors.setdefault(index, {}).setdefault(field, []).append(message)
+
+    def get_errors(self):
+        """ Ошибки по каждой записи пакета """
+        return [{'index': index, 'errors': errors} for index, errors in sorted(self.errors.items())]
+
+    def is_valid(self):
+        self.load_existing()
+        self.resolve_suppliers()
+        self.validate_rules()
+        self.validate_relations(Contacts, 'contacts')
+        self.validate_relations(Product, 'products')
+        if not self.errors:
+            self.validate_cycles()
+        return not self.errors
+
+    def load_existing(self):
+        """ Существующие организации из пакета и поставщики, указанные по названию или id """
+        names = {item['name'] for item in self.items} | {
+            item['supplier_name'] for item in self.items if item.get('supplier_name')
+        }
+        supplier_ids = {item['supplier'] for item in self.items if item.get('supplier')}
+
+        fields = ('id', 'name', 'level', 'supplier_id', 'debt_amount')
+        self.by_name = {}
+        self.by_id = {}
+        for chunk in chunked(names):
+            for row in NetworkNode.objects.filter(name__in=chunk).values(*fields):
+                self.by_name[row['name']] = self.by_id[row['id']] = row
+        for chunk in chunked(supplier_ids - set(self.by_id)):
+            for row in NetworkNode.objects.filter(pk__in=chunk).values(*fields):
+                self.by_id[row['id']] = row
+
+        seen = set()
+        for index, item in enumerate(self.items):
+            if item['name'] in seen:
+                self.add_error(index, 'name', 'Duplicate network node name in the batch.')
+            seen.add(item['name'])
+            row = self.by_name.get(item['name'])
+            self.existing[index] = row
+            self.keys.append(row['id'] if row else item['name'])
+
+    def resolve_suppliers(self):
+        """ Ключ поставщика каждой записи с учётом организаций из того же пакета """
+        batch_names = {item['name'] for item in self.items}
+        for index, item in enumerate(self.items):
+            row = self.existing[index]
+            if 'supplier' in item and 'supplier_name' in item:
+                self.add_error(index, 'supplier', 'Specify either supplier or supplier_name, not both.')
+                continue
+            if 'supplier_name' in item:
+                name = item['supplier_name']
+                if name in self.by_name:
+                    self.suppliers[index] = self.by_name[name]['id']
+                elif name in batch_names:
+                    self.suppliers[index] = name
+                else:
+                    self.add_error(index, 'supplier_name', f'Network node "{name}" does not exist.')
+            elif 'supplier' in item:
+                pk = item['supplier']
+                if pk is not None and pk not in self.by_id:
+                    self.add_error(index, 'supplier', f'Invalid pk "{pk}" - object does not exist.')
+                self.suppliers[index] = pk
+            else:
+                self.suppliers[index] = row['supplier_id'] if row else None
+
+    def validate_rules(self):
+        """ Правила уровней и задолженности, общие с сериалайзерами API """
+        for index, item in enumerate(self.items):
+            row = self.existing[index]
+            supplier = self.suppliers.get(index)
+            if supplier is not None and supplier == self.keys[index]:
+                self.add_error(index, 'supplier', 'An organisation cannot be its own supplier.')
+            if row and 'debt_amount' in item and item['debt_amount'] != row['debt_amount']:
+                self.add_error(index, 'debt_amount', 'This field is restricted to be changed.')
+
+            attrs = {
+                'level': item.get('level', row['level'] if row else 1),
+                'supplier': supplier,
+                'debt_amount': item.get('debt_amount', row['debt_amount'] if row else 0),
+            }
+            for validator in (SupplierValidator(), FactoryDebtValidator()):
+                try:
+                    validator(attrs)
+                except ValidationError as exc:
+                    for message in exc.detail:
+                        self.add_error(index, 'non_field_errors', str(message))
+
+    def validate_relations(self, model, field):
+        """ Проверка существования контактов или продуктов всего пакета одним набором запросов """
+        ids = {pk for item in self.items for pk in item.get(field, ())}
+        existing = set()
+        for chunk in chunked(ids):
+            existing.update(model.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+        for index, item in enumerate(self.items):
+            for pk in item.get(field, ()):
+                if pk not in existing:
+                    self.add_error(index, field, f'Invalid pk "{pk}" - object does not exist.')
+
+    def supplier_chains(self):
+        """ Текущие поставщики существующих организаций, через которые проходят цепочки пакета """
+        supplier_ids = {key for key in self.suppliers.values() if isinstance(key, int)}
+        chains = {}
+        for chunk in chunked(supplier_ids):
+            for ancestor_id, descendant_id, depth in SupplyLink.objects.filter(descendant__in=chunk).values_list(
+                    'ancestor_id', 'descendant_id', 'depth'):
+                chains.setdefault(descendant_id, []).append((depth, ancestor_id))
+        next_supplier = {}
+        for chain in chains.values():
+            chain = [pk for _, pk in sorted(chain)]
+            next_supplier.update(zip(chain, chain[1:]))
+        return next_supplier
+
+    def validate_cycles(self):
+        """ Поиск циклов в цепочках поставок с учётом изменений всего пакета """
+        next_supplier = self.supplier_chains()
+        index_by_key = {}
+        for index, key in enumerate(self.keys):
+            next_supplier[key] = self.suppliers[index]
+            index_by_key[key] = index
+
+        done = set()
+        for start in self.keys:
+            path = []
+            on_path = set()
+            key = start
+            while key is not None and key not in done:
+                if key in on_path:
+                    for cycle_key in path[path.index(key):]:
+                        if cycle_key in index_by_key:
+                            self.add_error(index_by_key[cycle_key], 'supplier',
+                                           'An organisation cannot be supplied by its own client.')
+                    break
+                path.append(key)
+                on_path.add(key)
+                key = next_supplier.get(key)
+            done.update(path)
+
+    def batch_depth(self):
+        """ Глубина каждой записи в цепочках внутри пакета: поставщики записываются раньше своих клиентов """
+        index_by_key = {key: index for index, key in enumerate(self.keys)}
+        depth = {}
+        for start in range(len(self.items)):
+            path = []
+            index = start
+            while index is not None and index not in depth:
+                path.append(index)
+                index = index_by_key.get(self.suppliers[index])
+            level = 0 if index is None else depth[index] + 1
+            for index in reversed(path):
+                depth[index] = level
+                level += 1
+        return depth
+
+    @transaction.atomic
+    def save(self):
+        """ Запись пакета в одной транзакции с обновлением иерархии поставок """
+        new_nodes = {}
+        updated_nodes = {}
+        for index, item in enumerate(self.items):
+            row = self.existing[index]
+            supplier = self.suppliers[index]
+            if row is None:
+                new_nodes[index] = NetworkNode(
+                    name=item['name'],
+                    level=item.get('level', 1),
+                    debt_amount=item.get('debt_amount', '0.00'),
+                    supplier_id=supplier if isinstance(supplier, int) else None,
+                )
+            else:
+                updated_nodes[index] = NetworkNode(
+                    pk=row['id'],
+                    name=row['name'],
+                    level=item.get('level', row['level']),
+                    supplier_id=supplier,
+                )
+        NetworkNode.objects.bulk_create(new_nodes.values(), batch_size=CHUNK_SIZE)
+        DebtTransaction.objects.bulk_create(
+            (
+                DebtTransaction.opening(node.pk, node.debt_amount)
+                for node in new_nodes.values() if Decimal(node.debt_amount)
+            ),
+            batch_size=CHUNK_SIZE,
+        )
+
+        # Поставщики из того же пакета получили id только после создания
+        pk_by_key = {node.name: node.pk for node in new_nodes.values()}
+        for index, node in (*new_nodes.items(), *updated_nodes.items()):
+            if isinstance(self.suppliers[index], str):
+                node.supplier_id = pk_by_key[self.suppliers[index]]
+        NetworkNode.objects.bulk_update(
+            [node for index, node in new_nodes.items() if isinstance(self.suppliers[index], str)],
+            ['supplier'], batch_size=CHUNK_SIZE,
+        )
+        NetworkNode.objects.bulk_update(updated_nodes.values(), ['level', 'supplier'], batch_size=CHUNK_SIZE)
+
+        nodes = {**new_nodes, **updated_nodes}
+        self.save_relations(nodes, 'contacts', 'contacts_id')
+        self.save_relations(nodes, 'products', 'product_id')
+        # Место организации - место первого контакта; связи записаны без сигналов m2m_changed
+        for chunk in chunked([node.pk for index, node in nodes.items() if 'contacts' in self.items[index]]):
+            NetworkNode.objects.filter(pk__in=chunk).refresh_location()
+        for chunk in chunked([node.pk for index, node in nodes.items() if 'products' in self.items[index]]):
+            NetworkNode.objects.filter(pk__in=chunk).refresh_products_count()
+        self.save_supply_links(new_nodes, updated_nodes)
+        # Пакетная запись не отправляет сигналы сохранения
+        transaction.on_commit(lambda: invalidate_nodes(node.pk for node in nodes.values()))
+
+        return {'created': len(new_nodes), 'updated': len(updated_nodes)}
+
+    def save_relations(self, nodes, field, column):
+        """ Замена связей many-to-many для записей пакета, в которых передано поле """
+        through = getattr(NetworkNode, field).through
+        replaced = {index: node for index, node in nodes.items() if field in self.items[index]}
+        updated_ids = [node.pk for index, node in replaced.items() if self.existing[index]]
+        for chunk in chunked(updated_ids):
+            through.objects.filter(networknode_id__in=chunk).delete()
+        through.objects.bulk_create(
+            (
+                through(networknode_id=node.pk, **{column: pk})
+                for index, node in replaced.items()
+                for pk in dict.fromkeys(self.items[index][field])
+            ),
+            batch_size=CHUNK_SIZE,
+        )
+
+    def save_supply_links(self, new_nodes, updated_nodes):
+        """
+        Обновление таблицы замыкания: новые организации привязываются к текущим цепочкам поставщиков волнами
+        (сначала поставщики, затем их клиенты), после чего все перенесённые организации вместе с клиентами
+        (в том числе новыми) перепривязываются одним move_subtrees.
+        """
+        depth = self.batch_depth()
+        for wave in sorted({depth[index] for index in new_nodes}):
+            created = [node for index, node in new_nodes.items() if depth[index] == wave]
+            ancestors = {}
+            for chunk in chunked({node.supplier_id for node in created if node.supplier_id}):
+                for ancestor_id, descendant_id, link_depth in SupplyLink.objects.filter(
+                        descendant__in=chunk).values_list('ancestor_id', 'descendant_id', 'depth'):
+                    ancestors.setdefault(descendant_id, []).append((ancestor_id, link_depth + 1))
+            SupplyLink.objects.bulk_create(
+                (
+                    SupplyLink(ancestor_id=ancestor_id, descendant_id=node.pk, depth=link_depth)
+                    for node in created
+                    for ancestor_id, link_depth in [(node.pk, 0), *ancestors.get(node.supplier_id, ())]
+                ),
+                batch_size=CHUNK_SIZE,
+            )
+
+        moved = [node.pk for index, node in updated_nodes.items()
+                 if node.supplier_id != self.existing[index]['supplier_id']]
+        if moved:
+            SupplyLink.objects.move_subtrees(moved)
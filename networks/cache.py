@@ -0,0 +1,112 @@
+"""
+Кэш ответов API узлов сети.
+
+Ключи ответов включают версию: общую для всех страниц списка и отдельную для каждого узла сети.
+Инвалидация записывает новую версию, поэтому устаревшие записи больше не читаются и вытесняются по таймауту,
+а ответ, собранный во время инвалидации, сохраняется под уже неактуальной версией.
+
+Версия - время инвалидации. Ответ, прочитанный с реплики (networks.replicas) меньше чем через
+REPLICA_STICKY_SECONDS секунд после инвалидации, не сохраняется: реплика могла ещё не получить изменения,
+и прежние строки до истечения таймаута отдавались бы под новой версией.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from networks.fastjson import dumps
+from networks.replicas import read_from_replica
+
+LIST_VERSION_KEY = 'networks:list:version'
+
+
+def node_version_key(pk):
+    return f'networks:node:{pk}:version'
+
+
+def new_version():
+    return time.time_ns()
+
+
+def get_version(key):
+    """ Текущая версия; при отсутствии создаётся новая, а не начальная, чтобы не прочитать старые записи """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_nodes(pks):
+    """ Сброс кэша карточек узлов сети и всех страниц списка """
+    version = new_version()
+    cache.set_many({node_version_key(pk): version for pk in set(pks)}, None)
+    invalidate_lists()
+
+
+def invalidate_lists():
+    """ Сброс кэша всех страниц списка узлов сети """
+    cache.set(LIST_VERSION_KEY, new_version(), None)
+
+
+def may_lag(version):
+    """ Ответ прочитан с реплики, которая могла ещё не получить изменения, записавшие версию """
+    return read_from_replica.get() and time.time_ns() - version < settings.REPLICA_STICKY_SECONDS * 10 ** 9
+
+
+def make_etag(data):
+    return quote_etag(hashlib.md5(dumps(data, sort_keys=True)).hexdigest())
+
+
+def request_key(prefix, request, version):
+    """ Ключ ответа по полному URL запроса (фильтры, поиск, пагинация) и версии списка """
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'{prefix}:{version}:{url}'
+
+
+def cached_response(request, key, version, build, timeout=None):
+    """
+    Ответ из кэша или собранный build(); при совпадении If-None-Match - 304 без тела. version - версия
+    в ключе: ответ с реплики вскоре после её записи не сохраняется.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        entry = {'data': response.data, 'etag': make_etag(response.data)}
+        if not may_lag(version):
+            cache.set(key, entry, settings.NETWORKS_CACHE_TIMEOUT if timeout is None else timeout)
+
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if entry['etag'] in etags or '*' in etags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry['etag']})
+    return Response(entry['data'], headers={'ETag': entry['etag']})
+
+
+class CachedListMixin:
+    """ Кэширование GET-списка по полному URL запроса (фильтры, поиск, пагинация) """
+
+    def list(self, request, *args, **kwargs):
+        version = get_version(LIST_VERSION_KEY)
+        return cached_response(
+            request, request_key('networks:list', request, version), version,
+            lambda: super(CachedListMixin, self).list(request, *args, **kwargs),
+        )
+
+
+class CachedRetrieveMixin:
+    """ Кэширование GET-карточки узла сети """
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        version = get_version(node_version_key(pk))
+        return cached_response(
+            request, f'networks:node:{pk}:{version}', version,
+            lambda: super(CachedRetrieveMixin, self).retrieve(request, *args, **kwargs),
+        )
@@ -0,0 +1,170 @@
+"""
+Пул соединений с базой данных в памяти процесса для бэкенда networks.backends.postgresql_pool.
+
+Django 5.0 с psycopg2 не имеет встроенного пула (OPTIONS['pool'] появился в Django 5.1 для psycopg 3), поэтому
+без пула каждый запрос с CONN_MAX_AGE = 0 открывает новое соединение. Пул держит открытые соединения процесса
+и выдаёт их потокам на время запроса: соединение закрывается только при ошибке, по истечении max_lifetime
+или при остановке процесса. Метрики пула (размер, ожидание, выдачи) возвращает pool_stats().
+"""
+
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+# Пулы процесса по ключу бэкенда (псевдоним базы данных и параметры подключения)
+pools = {}
+pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    """ Свободное соединение не появилось за timeout секунд """
+
+
+class ConnectionPool:
+    """
+    Пул не больше max_size соединений. Свободное соединение выдаётся сразу (последнее возвращённое - оно
+    реже простаивало), новое открывается, пока соединений меньше max_size, иначе поток ждёт возврата
+    соединения до timeout секунд. min_size соединений открываются при создании пула.
+    """
+
+    def __init__(self, name, min_size=0, max_size=10, timeout=30, max_lifetime=3600):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.condition = threading.Condition()
+        # Свободные соединения и время открытия каждого соединения пула по его id
+        self.idle = deque()
+        self.opened_at = {}
+        self.size = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def warm_up(self, connect):
+        """ Открытие min_size соединений """
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            try:
+                connection = connect()
+            except BaseException:
+                self.release_slot()
+                raise
+            self.putconn(connection)
+
+    def getconn(self, connect, check=None):
+        """
+        Соединение из пула: (соединение, время ожидания в секундах). connect() открывает новое соединение,
+        check(connection) проверяет свободное перед выдачей - непригодное закрывается и заменяется новым.
+        """
+        started = time.monotonic()
+        with self.condition:
+            if not self.idle and self.size >= self.max_size:
+                self.waits += 1
+            while not self.idle and self.size >= self.max_size:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f'No free connection in pool {self.name} after {self.timeout} s '
+                                      f'(max_size {self.max_size}).')
+                self.condition.wait(remaining)
+            waited = time.monotonic() - started
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+            connection = self.idle.pop() if self.idle else None
+            if connection is None:
+                self.size += 1
+
+        if connection is not None and (self.expired(connection) or (check is not None and not check(connection))):
+            self.close(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = connect()
+            except BaseException:
+                self.release_slot()
+                raise
+            self.opened_at[id(connection)] = time.monotonic()
+        return connection, waited
+
+    def putconn(self, connection, discard=False):
+        """ Возврат соединения; закрытое, устаревшее или отмеченное discard соединение закрывается """
+        if discard or self.expired(connection):
+            self.close(connection)
+            self.release_slot()
+            return
+        with self.condition:
+            self.opened_at.setdefault(id(connection), time.monotonic())
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def expired(self, connection):
+        opened_at = self.opened_at.get(id(connection))
+        return bool(getattr(connection, 'closed', False)) or (
+            self.max_lifetime is not None and opened_at is not None
+            and time.monotonic() - opened_at > self.max_lifetime
+        )
+
+    def close(self, connection):
+        """ Закрытие соединения без возврата в пул; место в пуле освобождает вызывающий код """
+        self.opened_at.pop(id(connection), None)
+        with self.condition:
+            self.discarded += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def release_slot(self):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def close_all(self):
+        """ Закрытие свободных соединений, например перед удалением тестовой базы данных """
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+        for connection in idle:
+            self.close(connection)
+            self.release_slot()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'name': self.name,
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_ms_total': round(self.wait_time * 1000, 2),
+                'wait_ms_max': round(self.max_wait_time * 1000, 2),
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+            }
+
+
+def get_pool(key, name, **options):
+    """ Пул процесса по ключу; создаётся при первом обращении """
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(name, **options)
+        return pools[key]
+
+
+def pool_stats():
+    """ Метрики всех пулов процесса """
+    with pools_lock:
+        return [pool.stats() for pool in pools.values()]
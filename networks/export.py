@@ -0,0 +1,50 @@
+import csv
+
+from networks.fastjson import dumps
+from networks.models import NetworkNode
+from networks.serializers import NetworkNodeDetailSerializer
+
+EXPORT_CHUNK_SIZE = 2000
+CSV_FIELDS = ['id', 'name', 'level', 'supplier', 'debt_amount', 'creation_time', 'contacts', 'products']
+
+
+class Echo:
+    """ Псевдобуфер для csv.writer: возвращает записанную строку вместо хранения """
+
+    def write(self, value):
+        return value
+
+
+def iter_network_nodes(chunk_size=EXPORT_CHUNK_SIZE, pks=None):
+    """
+    Узлы сети с контактами и продуктами по одному, с чтением из базы данных частями по chunk_size.
+    pks ограничивает выгрузку списком id, по умолчанию выгружается вся сеть.
+    """
+    serializer = NetworkNodeDetailSerializer()
+    queryset = NetworkNode.objects.for_detail().order_by('pk')
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    for node in queryset.iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(node)
+
+
+def iter_ndjson(chunk_size=EXPORT_CHUNK_SIZE, pks=None):
+    """ Выгрузка сети в формате NDJSON: один узел сети на строку """
+    for row in iter_network_nodes(chunk_size, pks):
+        yield dumps(row).decode() + '\n'
+
+
+def iter_csv(chunk_size=EXPORT_CHUNK_SIZE, pks=None):
+    """ Выгрузка сети в формате CSV: контакты (email) и продукты (названия) через точку с запятой """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for row in iter_network_nodes(chunk_size, pks):
+        row['contacts'] = '; '.join(contacts['email'] for contacts in row['contacts'])
+        row['products'] = '; '.join(product['name'] for product in row['products'])
+        yield writer.writerow([row[field] for field in CSV_FIELDS])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv'),
+}
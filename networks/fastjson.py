@@ -0,0 +1,61 @@
+"""
+Кодирование и разбор JSON для API: orjson, если он установлен, иначе стандартная библиотека json.
+
+Вывод dumps совпадает с JSONRenderer DRF: компактные разделители, символы не ASCII без экранирования,
+экранированные U+2028 и U+2029. Decimal, даты и время, ленивые строки и прочие типы, которые orjson
+не кодирует сам или кодирует иначе, преобразуются тем же JSONEncoder DRF.
+Отличия orjson от стандартной библиотеки: float в экспоненциальной записи выводится без знака "+" (1e16),
+NaN и бесконечность - как null, а при разборе целые длиннее 64 бит читаются как float. Сериалайзеры проекта
+float не выводят (DecimalField возвращает строки), а такие целые не принимает ни одно поле API.
+"""
+
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:  # orjson - необязательная зависимость (extras fast-json)
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+encoder_default = JSONEncoder().default
+
+
+def dumps(data, sort_keys=False):
+    """ data -> JSON в байтах UTF-8 в формате JSONRenderer DRF """
+    if orjson is not None:
+        try:
+            content = orjson.dumps(
+                data,
+                default=encoder_default,
+                option=ORJSON_OPTIONS | orjson.OPT_SORT_KEYS if sort_keys else ORJSON_OPTIONS,
+            )
+        except TypeError:
+            # Целые длиннее 64 бит и прочее, что orjson не кодирует: ошибку, если она есть, выдаст json
+            pass
+        else:
+            return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+    content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+                         sort_keys=sort_keys)
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def loads(content, strict=True):
+    """
+    JSON в байтах UTF-8 или строке -> объект Python. При strict=True NaN и Infinity запрещены, как в JSONParser DRF.
+    Ошибки разбора - ValueError.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # Сообщение об ошибке и разбор NaN без strict - как у стандартной библиотеки
+            pass
+    if isinstance(content, bytes):
+        content = content.decode()
+    return json.loads(content, parse_constant=strict_constant if strict else None)
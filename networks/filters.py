@@ -0,0 +1,87 @@
+import operator
+from functools import reduce
+
+from django.db.models import Exists, OuterRef, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+
+class IndexedSearchFilter(SearchFilter):
+    """
+    Поиск по индексам (B-tree и триграммным GIN-индексам PostgreSQL на искомых колонках).
+
+    Условия поиска проверяются подзапросом EXISTS к таблице модели без аннотаций и предзагрузки основного
+    queryset: поиск по связям many-to-many не размножает строки и не требует DISTINCT, а агрегаты списка
+    (аннотации) не пересчитываются внутри подзапроса.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        lookups = [self.construct_search(str(search_field), queryset) for search_field in search_fields]
+        conditions = [
+            reduce(operator.or_, (Q(**{lookup: term}) for lookup in lookups))
+            for term in search_terms
+        ]
+
+        if not self.must_call_distinct(queryset, search_fields):
+            return queryset.filter(*conditions)
+        matches = queryset.model._default_manager.filter(*conditions).filter(pk=OuterRef('pk'))
+        return queryset.filter(Exists(matches))
+
+
+class CounterFilter(BaseFilterBackend):
+    """
+    Отбор и сортировка по хранимому счётчику связей view.counter_field (products_count, sales_channels_count):
+    ?<счётчик>__gte=, ?<счётчик>__lte= и ?ordering=<счётчик> или ?ordering=-<счётчик>.
+
+    Условия и порядок используют индекс (счётчик, id); id дополняет порядок для пагинации по ключу,
+    которой порядок передаётся через view.keyset_fields.
+    """
+
+    ordering_param = 'ordering'
+    lookups = ('gte', 'lte')
+
+    def filter_queryset(self, request, queryset, view):
+        counter = view.counter_field
+        for lookup in self.lookups:
+            param = f'{counter}__{lookup}'
+            if param in request.query_params:
+                queryset = queryset.filter(**{param: self.get_value(request, param)})
+
+        ordering = request.query_params.get(self.ordering_param)
+        if ordering in (counter, f'-{counter}'):
+            view.keyset_fields = (ordering, '-pk' if ordering.startswith('-') else 'pk')
+            queryset = queryset.order_by(*view.keyset_fields)
+        return queryset
+
+    @staticmethod
+    def get_value(request, param):
+        value = request.query_params[param]
+        if not value.isdigit():
+            raise ValidationError({param: ['A valid non-negative integer is required.']})
+        return int(value)
+
+    def get_schema_operation_parameters(self, view):
+        counter = view.counter_field
+        parameters = [
+            {
+                'name': f'{counter}__{lookup}',
+                'required': False,
+                'in': 'query',
+                'description': f'Filter by {counter} ({lookup}).',
+                'schema': {'type': 'integer', 'minimum': 0},
+            }
+            for lookup in self.lookups
+        ]
+        parameters.append({
+            'name': self.ordering_param,
+            'required': False,
+            'in': 'query',
+            'description': f'Order by {counter}.',
+            'schema': {'type': 'string', 'enum': [counter, f'-{counter}']},
+        })
+        return parameters
@@ -0,0 +1,204 @@
+"""
+Инструментирование запросов к API: количество SQL-запросов, время базы данных, повторяющиеся запросы
+и время сериализации.
+
+Метрики собираются для каждого запроса, передаются в заголовке Server-Timing и пишутся в лог
+networks.instrumentation одной JSON-строкой. Представление может задать бюджет SQL-запросов атрибутом
+query_budget: числом для всех методов или словарём {'GET': 3, 'POST': 6}. Превышение бюджета пишется в лог
+с уровнем WARNING, а при NETWORKS_QUERY_BUDGET_STRICT = True (включается в тестах) вызывает исключение.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+class QueryBudgetExceeded(Exception):
+    """ Представление выполнило больше SQL-запросов, чем задано в query_budget """
+
+
+def fingerprint(sql):
+    """ Отпечаток запроса без значений: одинаковые запросы с разными параметрами совпадают """
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = STRING_RE.sub('?', sql)
+    return NUMBER_RE.sub('?', sql)
+
+
+class RequestMetrics:
+    """ Метрики одного запроса к API """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.fingerprints = Counter()
+        self.statements = {}
+        # Выдачи соединений пулом (networks.backends.postgresql_pool) и время их ожидания
+        self.pool_checkouts = 0
+        self.pool_wait = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """ Обёртка выполнения SQL (connection.execute_wrapper) """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.statements.setdefault(key, sql)
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def duplicates(self):
+        """ Повторяющиеся запросы - признак N+1: [(отпечаток, количество, SQL)] по убыванию количества """
+        return [
+            (hashlib.md5(key.encode()).hexdigest()[:12], count, self.statements[key])
+            for key, count in self.fingerprints.most_common() if count > 1
+        ]
+
+    def server_timing(self):
+        """ Значение заголовка Server-Timing, длительности в миллисекундах """
+        duplicated = sum(count - 1 for _, count, _ in self.duplicates())
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'dup;desc="{duplicated} duplicated queries"',
+            f'ser;dur={self.serializer_time * 1000:.1f};desc="serializer"',
+            *([f'pool;dur={self.pool_wait * 1000:.1f};desc="{self.pool_checkouts} connection checkouts"']
+              if self.pool_checkouts else []),
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+    def as_log(self, request, response, view=None, budget=None):
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': view and f'{view.__module__}.{view.__qualname__}',
+            'status': response.status_code,
+            'queries': self.queries,
+            'query_budget': budget,
+            'db_ms': round(self.db_time * 1000, 2),
+            'serializer_ms': round(self.serializer_time * 1000, 2),
+            'pool_wait_ms': round(self.pool_wait * 1000, 2),
+            'total_ms': round(self.total_time * 1000, 2),
+            'duplicates': [
+                {'fingerprint': key, 'count': count, 'sql': sql[:200]} for key, count, sql in self.duplicates()
+            ],
+        }
+
+
+def get_query_budget(view, method):
+    budget = getattr(view, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Сбор метрик запроса к API и проверка бюджета SQL-запросов представления.
+    Работает и в синхронной (WSGI), и в асинхронной (ASGI) цепочке middleware, не занимая поток в ASGI.
+    Запросы потоковых ответов выполняются после выхода из middleware и не учитываются.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with self.instrument(request, metrics):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        # Соединения с базой данных привязаны к потоку: асинхронный ORM выполняет запросы в потоке sync_to_async
+        stack = await sync_to_async(self.instrument)(request, metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def instrument(self, request, metrics):
+        """ Обёртка выполнения SQL на всех соединениях с базами данных на время обработки запроса """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        request.query_metrics = metrics
+        return stack
+
+    def finish(self, request, response, metrics):
+        """ Заголовок Server-Timing, запись в лог и проверка бюджета SQL-запросов """
+        view = getattr(request, 'query_metrics_view', None)
+        budget = get_query_budget(view, request.method)
+        response['Server-Timing'] = metrics.server_timing()
+        exceeded = budget is not None and metrics.queries > budget
+        # Запись лога строится, только если она будет записана
+        if not exceeded and not logger.isEnabledFor(logging.INFO):
+            return response
+        record = metrics.as_log(request, response, view, budget)
+
+        if exceeded:
+            message = f'{record["view"]} {request.method} executed {metrics.queries} queries, budget is {budget}'
+            if getattr(settings, 'NETWORKS_QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(f'{message}: {json.dumps(record["duplicates"])}')
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Класс представления сохраняется в функции as_view(): cls у DRF, view_class у Django
+        request.query_metrics_view = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+
+
+class TimedSerializerMixin:
+    """ Учёт времени сериализации в метриках запроса; вложенные сериалайзеры не учитываются повторно """
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializer_depth:
+            return super().to_representation(instance)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_depth -= 1
@@ -0,0 +1,129 @@
+"""
+Фоновые задачи без внешних сервисов: таблица Job служит очередью, а обработчик `python manage.py run_jobs`
+захватывает задачи условным UPDATE и выполняет их в пуле процессов.
+
+Задача - функция func(job, **params), зарегистрированная декоратором task (networks.tasks, users.tasks).
+Параметры и результат хранятся в JSON. О ходе выполнения задача сообщает job.report(done, total).
+Исключение возвращает задачу в очередь с нарастающей задержкой, пока не исчерпаны max_attempts попыток;
+JobError завершает задачу сразу: повтор не исправит ошибку в данных.
+"""
+
+import logging
+import os
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from networks.models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class JobError(Exception):
+    """ Ошибка задачи, которую не исправит повтор: неверные параметры, нарушение правил данных """
+
+
+class Task:
+    """
+    Зарегистрированная задача: функция, сериалайзер параметров и разрешения DRF для постановки через API,
+    число попыток
+    """
+
+    def __init__(self, name, func, serializer_class=None, max_attempts=None, permission_classes=()):
+        self.name = name
+        self.func = func
+        self.serializer_class = serializer_class
+        self.max_attempts = max_attempts or settings.JOBS_MAX_ATTEMPTS
+        self.permission_classes = permission_classes
+
+
+def task(name, serializer_class=None, max_attempts=None, permission_classes=()):
+    """
+    Регистрация функции задачи под именем name. Задачи с serializer_class можно ставить в очередь
+    через API (/jobs/), сериалайзер проверяет параметры до постановки, а permission_classes - пользователя.
+    """
+
+    def decorator(func):
+        TASKS[name] = Task(name, func, serializer_class, max_attempts, permission_classes)
+        return func
+
+    return decorator
+
+
+def enqueue(name, created_by=None, **params):
+    """
+    Постановка задачи name в очередь; результат - Job, id которого сразу возвращается клиенту.
+    Задача видна обработчикам после фиксации текущей транзакции.
+    """
+    return Job.objects.create(task=name, params=params, max_attempts=TASKS[name].max_attempts,
+                              created_by=created_by)
+
+
+def execute(pk):
+    """ Выполнение захваченной задачи pk в текущем процессе; результат - итоговый статус задачи """
+    job = Job.objects.get(pk=pk)
+    attempt = job.attempts
+    try:
+        if job.task not in TASKS:
+            raise JobError(f'Unknown task "{job.task}".')
+        result = TASKS[job.task].func(job, **job.params)
+    except JobError as e:
+        finished = job.fail(str(e), retry=False)
+    except Exception:
+        logger.exception('Job %s failed', job)
+        finished = job.fail(traceback.format_exc())
+    else:
+        finished = job.succeed(result)
+    if not finished:
+        logger.warning('Job %s was requeued while running, the result of attempt %s is dropped', job, attempt)
+    return job.status
+
+
+@contextmanager
+def heartbeat(pk, worker, interval):
+    """ Отметка о ходе выполнения задачи pk каждые interval секунд из отдельного потока, пока выполняется блок """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                Job.objects.heartbeat([pk], worker)
+        finally:
+            # Соединение потока
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-{pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale(timeout):
+    """
+    Задачи остановленных обработчиков (без отметки о ходе выполнения дольше timeout секунд) возвращаются
+    в очередь как неудачная попытка; результат - число таких задач
+    """
+    jobs = list(Job.objects.stale(timeout))
+    for job in jobs:
+        logger.warning('Job %s of worker %s stopped responding', job, job.worker)
+        job.fail(f'Worker {job.worker} stopped responding.')
+    return len(jobs)
+
+
+def worker_name():
+    """ Имя обработчика в отметке захвата задачи: хост и id процесса """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def result_path(name):
+    """ Путь к файлу результата задачи (выгрузки) в JOBS_RESULT_DIR """
+    return os.path.join(settings.JOBS_RESULT_DIR, os.path.basename(name))
@@ -0,0 +1,151 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from networks.bulk import CHUNK_SIZE, chunked
+from networks.cache import invalidate_nodes
+from networks.models import NetworkNode, DebtTransaction
+
+# Наибольшая задолженность, которая помещается в debt_amount (max_digits=10, decimal_places=2)
+MAX_DEBT = Decimal('99999999.99')
+
+
+class DebtPosting:
+    """
+    Пакетная проводка изменений задолженности: записи журнала и задолженность организаций в одной транзакции.
+
+    Положительная сумма увеличивает задолженность организации перед поставщиком, отрицательная - уменьшает.
+    Задолженность изменяется выражением F() под блокировкой строк организаций, поэтому параллельные проводки
+    не теряют изменений друг друга.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.errors = {}
+
+    def add_error(self, index, field, message):
+        self.errors.setdefault(index, {}).setdefault(field, []).append(message)
+
+    def get_errors(self):
+        """ Ошибки по каждой записи пакета """
+        return [{'index': index, 'errors': errors} for index, errors in sorted(self.errors.items())]
+
+    def deltas(self):
+        """ Итоговое изменение задолженности каждой организации пакета """
+        deltas = defaultdict(Decimal)
+        for item in self.items:
+            deltas[item['network_node']] += item['amount']
+        return deltas
+
+    def is_valid(self):
+        """ Проверка пакета целиком: организации, уровни и итоговая задолженность """
+        nodes = {}
+        for chunk in chunked({item['network_node'] for item in self.items}):
+            nodes.update(
+                (pk, (level, debt_amount))
+                for pk, level, debt_amount in NetworkNode.objects.filter(pk__in=chunk).values_list(
+                    'pk', 'level', 'debt_amount')
+            )
+        self.check(nodes)
+        return not self.errors
+
+    def check(self, nodes):
+        """ Проверка записей пакета по уровням и задолженности организаций {id: (уровень, сумма)} """
+        deltas = self.deltas()
+        for index, item in enumerate(self.items):
+            pk = item['network_node']
+            if not item['amount']:
+                self.add_error(index, 'amount', 'Amount must not be zero.')
+            if pk not in nodes:
+                self.add_error(index, 'network_node', f'Invalid pk "{pk}" - object does not exist.')
+                continue
+            level, debt_amount = nodes[pk]
+            if level == 0:
+                self.add_error(index, 'network_node', 'The factory cannot be in debt as it has no supplier.')
+            elif abs(debt_amount + deltas[pk]) > MAX_DEBT:
+                self.add_error(index, 'amount', f'The debt cannot exceed {MAX_DEBT}.')
+
+    @transaction.atomic
+    def save(self):
+        """
+        Запись проводок и изменение задолженности одним UPDATE на часть организаций. Пакет проверяется
+        повторно под блокировкой строк: после is_valid параллельная проводка могла изменить задолженность,
+        а смена уровня - сделать организацию заводом. Ошибки повторной проверки - ValidationError без записи.
+        """
+        deltas = self.deltas()
+        self.errors = {}
+        self.check(NetworkNode.objects.lock_debt(deltas, batch_size=CHUNK_SIZE))
+        if self.errors:
+            raise ValidationError({'errors': self.get_errors()})
+        NetworkNode.objects.add_debt(deltas, batch_size=CHUNK_SIZE, lock=False)
+        DebtTransaction.objects.bulk_create(
+            (
+                DebtTransaction(network_node_id=item['network_node'], amount=item['amount'],
+                                comment=item.get('comment', ''))
+                for item in self.items
+            ),
+            batch_size=CHUNK_SIZE,
+        )
+        # Пакетная запись не отправляет сигналы сохранения
+        transaction.on_commit(lambda: invalidate_nodes(deltas))
+
+        return {'posted': len(self.items), 'nodes': len(deltas)}
+
+
+@transaction.atomic
+def zero_out_debt(pks, comment='Debt cleared'):
+    """ Обнуление задолженности организаций проводками на сумму текущей задолженности """
+    balances = NetworkNode.objects.lock_debt(pks, batch_size=CHUNK_SIZE)
+    items = [
+        {'network_node': pk, 'amount': -debt_amount, 'comment': comment}
+        for pk, (_, debt_amount) in balances.items() if debt_amount
+    ]
+    return DebtPosting(items).save()
+
+
+def compare_balances(chunk_size=2000, progress=None):
+    """
+    Сверка задолженности с журналом одним потоковым проходом по организациям и суммам журнала,
+    оба потока упорядочены по id организации. В памяти остаются только расхождения:
+    (число проверенных организаций, [(id, debt_amount, сумма журнала), ...]).
+    progress(checked) вызывается после каждых chunk_size организаций.
+    """
+    nodes = NetworkNode.objects.order_by('pk').values_list('pk', 'debt_amount').iterator(chunk_size=chunk_size)
+    balances = DebtTransaction.objects.balances().iterator(chunk_size=chunk_size)
+
+    checked = 0
+    mismatches = []
+    ledger = next(balances, None)
+    for pk, debt_amount in nodes:
+        while ledger is not None and ledger[0] < pk:
+            ledger = next(balances, None)
+        balance = ledger[1] if ledger is not None and ledger[0] == pk else 0
+        if debt_amount != balance:
+            mismatches.append((pk, debt_amount, balance))
+        checked += 1
+        if progress is not None and checked % chunk_size == 0:
+            progress(checked)
+    return checked, mismatches
+
+
+def fix_balances(mismatches):
+    """ Задолженность расходящихся организаций по журналу """
+    for chunk in chunked(mismatches):
+        with transaction.atomic():
+            # Разница применяется выражением F(): проводки, сделанные после сверки, не теряются
+            NetworkNode.objects.add_debt({pk: balance - debt_amount for pk, debt_amount, balance in chunk})
+    invalidate_nodes(pk for pk, _, _ in mismatches)
+
+
+def adjust_ledger(mismatches):
+    """ Проводки на разницу, чтобы журнал совпал с задолженностью (например, после loaddata) """
+    DebtTransaction.objects.bulk_create(
+        (
+            DebtTransaction(network_node_id=pk, amount=debt_amount - balance, comment='Reconciliation')
+            for pk, debt_amount, balance in mismatches
+        ),
+        batch_size=CHUNK_SIZE,
+    )
+    invalidate_nodes(pk for pk, _, _ in mismatches)
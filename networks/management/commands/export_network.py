@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from networks.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Export all network nodes with contacts and products as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help='Output file, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        stream, _ = EXPORT_FORMATS[options['format']]
+        chunks = stream(options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,140 @@
+import random
+from decimal import Decimal
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from networks.cache import invalidate_lists
+from networks.models import NetworkNode, Contacts, Product, SupplyLink, DebtTransaction, Location
+
+COUNTRIES = ['Russia', 'Serbia', 'Kazakhstan', 'Finland', 'Poland', 'Germany', 'China', 'Japan', 'Brazil', 'India']
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic network: factories, retailers and consumers with contacts and products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factories', type=int, default=1000)
+        parser.add_argument('--retailers', type=int, default=100000)
+        parser.add_argument('--consumers', type=int, default=1000000)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--products-per-node', type=int, default=3)
+        parser.add_argument('--cities', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='Synthetic', help='Prefix of generated names, must be unique per run')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.cities = [f'City {i}' for i in range(options['cities'])]
+
+        products = Product.objects.bulk_create(
+            [
+                Product(name=f"{options['prefix']} Product {i}", model=f'M-{i}')
+                for i in range(options['products'])
+            ],
+            batch_size=self.batch_size,
+        )
+        self.product_ids = [product.pk for product in products]
+
+        factories = self.generate_level(0, 'Factory', options['factories'], suppliers=None)
+        retailers = self.generate_level(1, 'Retailer', options['retailers'], suppliers=factories)
+        self.generate_level(2, 'Consumer', options['consumers'], suppliers=retailers)
+        invalidate_lists()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {options['factories']} factories, {options['retailers']} retailers, "
+            f"{options['consumers']} consumers and {options['products']} products"
+        ))
+
+    def generate_level(self, level, title, count, suppliers):
+        """
+        Узлы сети одного уровня пакетами по batch_size: организации, контакты, продукты и таблица замыкания.
+        suppliers - список (id, id поставщиков от прямого к заводу) организаций вышестоящего уровня.
+        Возвращает такой же список для созданного уровня, если он понадобится следующему уровню.
+        """
+        created = []
+        keep = level < 2
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            chains = [self.random.choice(suppliers) if suppliers else None for _ in range(size)]
+            with transaction.atomic():
+                nodes = NetworkNode.objects.bulk_create([
+                    NetworkNode(
+                        name=f"{self.options['prefix']} {title} {start + i}",
+                        level=level,
+                        supplier_id=chain[0] if chain else None,
+                        debt_amount=f'{self.random.randrange(100000) / 100:.2f}' if level else '0.00',
+                    )
+                    for i, chain in enumerate(chains)
+                ])
+                self.generate_relations(nodes, level)
+                DebtTransaction.objects.bulk_create(
+                    [DebtTransaction.opening(node.pk, node.debt_amount) for node in nodes if Decimal(node.debt_amount)],
+                    batch_size=self.batch_size,
+                )
+
+                links = []
+                for node, chain in zip(nodes, chains):
+                    ancestors = [chain[0], *chain[1]] if chain else []
+                    links.append(SupplyLink(ancestor_id=node.pk, descendant_id=node.pk, depth=0))
+                    links.extend(
+                        SupplyLink(ancestor_id=ancestor_id, descendant_id=node.pk, depth=depth)
+                        for depth, ancestor_id in enumerate(ancestors, start=1)
+                    )
+                    if keep:
+                        created.append((node.pk, ancestors))
+                SupplyLink.objects.bulk_create(links, batch_size=self.batch_size)
+            self.stdout.write(f'{title}: {start + size}/{count}')
+        return created
+
+    def generate_relations(self, nodes, level):
+        """ Контакт и продукты каждой организации; заводы и ретейлеры - каналы продаж своих продуктов """
+        places = [(self.random.choice(COUNTRIES), self.random.choice(self.cities)) for _ in nodes]
+        locations = Location.objects.resolve(places)
+        contacts = Contacts.objects.bulk_create([
+            Contacts(
+                email=f'info{node.pk}@example.com',
+                country=country,
+                city=city,
+                location_id=locations[country, city],
+                street=f'Street {self.random.randrange(100)}',
+                building=self.random.randrange(1, 200),
+                network_node=node,
+            )
+            for node, (country, city) in zip(nodes, places)
+        ], batch_size=self.batch_size)
+        NetworkNode.contacts.through.objects.bulk_create(
+            [
+                NetworkNode.contacts.through(networknode_id=node.pk, contacts_id=contact.pk)
+                for node, contact in zip(nodes, contacts)
+            ],
+            batch_size=self.batch_size,
+        )
+        NetworkNode.objects.filter(pk__in=[node.pk for node in nodes]).refresh_location()
+
+        sold = [
+            (node.pk, product_id)
+            for node in nodes
+            for product_id in self.random.sample(self.product_ids,
+                                                 min(self.options['products_per_node'], len(self.product_ids)))
+        ]
+        NetworkNode.products.through.objects.bulk_create(
+            [
+                NetworkNode.products.through(networknode_id=node_id, product_id=product_id)
+                for node_id, product_id in sold
+            ],
+            batch_size=self.batch_size,
+        )
+        if level < 2:
+            Product.sales_channel.through.objects.bulk_create(
+                [
+                    Product.sales_channel.through(product_id=product_id, networknode_id=node_id)
+                    for node_id, product_id in sold
+                ],
+                batch_size=self.batch_size,
+            )
+            Product.objects.filter(pk__in={product_id for node_id, product_id in sold}).refresh_sales_channels_count()
+        NetworkNode.objects.filter(pk__in=[node.pk for node in nodes]).refresh_products_count()
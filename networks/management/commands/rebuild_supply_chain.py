@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from networks.models import SupplyLink
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the supply chain hierarchy index (e.g. after loaddata)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            SupplyLink.objects.rebuild()
+        self.stdout.write(f'Supply chain links: {SupplyLink.objects.count()}')
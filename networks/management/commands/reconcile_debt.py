@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+
+from networks.ledger import compare_balances, fix_balances, adjust_ledger
+
+
+class Command(BaseCommand):
+    help = 'Compare debt balances of network nodes with the debt transaction ledger and optionally repair them'
+
+    def add_arguments(self, parser):
+        action = parser.add_mutually_exclusive_group()
+        action.add_argument('--fix', action='store_true', help='Set balances to the ledger totals')
+        action.add_argument(
+            '--adjust-ledger', action='store_true',
+            help='Post adjustment transactions so that the ledger matches balances (e.g. after loaddata)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        checked, mismatches = compare_balances(options['chunk_size'])
+        for pk, debt_amount, balance in mismatches[:20]:
+            self.stdout.write(f'Network node {pk}: debt {debt_amount}, ledger {balance}')
+        self.stdout.write(f'Checked {checked} network nodes, mismatches: {len(mismatches)}')
+
+        if options['fix']:
+            fix_balances(mismatches)
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(mismatches)} balances'))
+        elif options['adjust_ledger']:
+            adjust_ledger(mismatches)
+            self.stdout.write(self.style.SUCCESS(f'Posted {len(mismatches)} adjustment transactions'))
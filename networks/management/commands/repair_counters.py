@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand
+
+from networks.models import NetworkNode, Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored relation counters (products per network node, sales channels per product)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        counters = [
+            (NetworkNode, 'refresh_products_count', 'network nodes'),
+            (Product, 'refresh_sales_channels_count', 'products'),
+        ]
+        for model, refresh, title in counters:
+            fixed = 0
+            for first, last in self.batches(model, options['chunk_size']):
+                fixed += getattr(model.objects.filter(pk__range=(first, last)), refresh)()
+            self.stdout.write(f'Fixed {fixed} {title} counters')
+
+    @staticmethod
+    def batches(model, chunk_size):
+        """ Границы (первый id, последний id) частей таблицы по chunk_size строк: каждая часть - отдельный UPDATE """
+        last = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return
+            yield pks[0], pks[-1]
+            last = pks[-1]
@@ -0,0 +1,94 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from networks import worker
+from networks.jobs import execute, heartbeat, requeue_stale, worker_name
+from networks.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOBS_WORKER_PROCESSES,
+                            help='Worker processes; 0 runs jobs one by one in this process')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true', help='Exit when no queued job is due')
+
+    def handle(self, *args, **options):
+        self.worker = worker_name()
+        self.poll_interval = options['poll_interval']
+        self.once = options['once']
+        if options['processes'] > 0:
+            self.run_pool(options['processes'])
+        else:
+            self.run_inline()
+
+    def poll(self):
+        """ Начало цикла опроса очереди: устаревшие соединения закрываются, брошенные задачи возвращаются """
+        close_old_connections()
+        requeue_stale(settings.JOBS_STALE_TIMEOUT)
+
+    def run_inline(self):
+        """
+        Задачи по одной в текущем процессе. Ход выполнения отмечает отдельный поток трижды за JOBS_STALE_TIMEOUT:
+        задача, которая не вызывает job.report (перестроение иерархии), не считается брошенной.
+        """
+        while True:
+            self.poll()
+            claimed = Job.objects.claim(self.worker)
+            if not claimed:
+                if self.once:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            pk, = claimed
+            with heartbeat(pk, self.worker, settings.JOBS_STALE_TIMEOUT / 3):
+                status = execute(pk)
+            self.stdout.write(f'Job {pk}: {status}')
+
+    def run_pool(self, processes):
+        """
+        Задачи в пуле из processes процессов. Процесс обработчика захватывает задачи по числу свободных
+        процессов и отмечает ход выполнения за них, поэтому брошенными считаются только задачи остановленного
+        обработчика. Задачи процесса пула, завершившегося аварийно, возвращаются в очередь.
+        """
+        context = multiprocessing.get_context('spawn')
+        pool = ProcessPoolExecutor(processes, mp_context=context, initializer=worker.setup)
+        running = {}
+        try:
+            while True:
+                self.poll()
+                if running:
+                    Job.objects.heartbeat(running.values(), self.worker)
+                for pk in Job.objects.claim(self.worker, processes - len(running)):
+                    running[pool.submit(worker.run, pk)] = pk
+
+                if not running:
+                    if self.once:
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    pk = running.pop(future)
+                    try:
+                        self.stdout.write(f'Job {pk}: {future.result()}')
+                    except Exception as e:
+                        # Процесс пула завершился аварийно или задача не была выполнена
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        Job.objects.get(pk=pk).fail(f'Worker process failed: {e!r}')
+                        self.stderr.write(f'Job {pk}: worker process failed: {e!r}')
+                if broken:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(processes, mp_context=context, initializer=worker.setup)
+        finally:
+            pool.shutdown(wait=True)
@@ -0,0 +1,322 @@
+from datetime import timedelta
+
+from django.db import models
+from django.db.models import Count, Prefetch, Sum, F, OuterRef, Subquery, Case, When, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class CounterQuerySetMixin:
+    """ Хранимые счётчики связей many-to-many (networks.signals.update_counters) """
+
+    def refresh_counter(self, counter, field):
+        """
+        Пересчёт счётчика counter по таблице связи field одним UPDATE с подзапросом.
+        Изменяются только расходящиеся строки; результат - их количество.
+        """
+        field = self.model._meta.get_field(field)
+        column = field.m2m_field_name()
+        links = field.remote_field.through.objects.filter(**{column: OuterRef('pk')}).order_by()
+        actual = Coalesce(Subquery(links.values(column).annotate(count=Count('*')).values('count')), 0)
+        return self.exclude(**{counter: actual}).update(**{counter: actual})
+
+
+class NetworkNodeQuerySet(CounterQuerySetMixin, models.QuerySet):
+    """ Набор запросов к узлам сети с предзагрузкой данных под конкретные сериалайзеры """
+
+    def for_list(self):
+        """ Данные для вывода списка организаций (NetworkNodeSerializer); количество продуктов хранится в строке """
+        from networks.models import Contacts
+
+        contacts = Contacts.objects.only('id', 'department', 'email', 'country', 'city', 'street', 'building')
+        return self.order_by('pk').prefetch_related(Prefetch('contacts', queryset=contacts))
+
+    def refresh_products_count(self):
+        return self.refresh_counter('products_count', 'products')
+
+    def for_detail(self):
+        """ Данные для вывода отдельной организации (NetworkNodeDetailSerializer) """
+        from networks.models import Contacts, Product
+
+        contacts = Contacts.objects.only('id', 'department', 'email', 'country', 'city', 'street', 'building')
+        products = Product.objects.only('id', 'name', 'model', 'release_date')
+        return self.prefetch_related(
+            Prefetch('contacts', queryset=contacts),
+            Prefetch('products', queryset=products),
+        )
+
+    def ancestors_of(self, node):
+        """ Поставщики организации по таблице замыкания: один запрос при любой глубине цепочки """
+        return self.filter(descendant_links__descendant=node, descendant_links__depth__gt=0)
+
+    def descendants_of(self, node):
+        """ Клиенты организации на всех уровнях ниже по таблице замыкания """
+        return self.filter(ancestor_links__ancestor=node, ancestor_links__depth__gt=0)
+
+    def for_admin(self):
+        """ Данные для списка организаций в админ-панели """
+        return self.select_related('supplier')
+
+    def lock_debt(self, pks, batch_size=1000):
+        """
+        Блокировка строк организаций до конца транзакции и их текущие уровень и задолженность
+        {id: (уровень, сумма)}. Строки блокируются в порядке id, поэтому параллельные проводки ждут друг друга
+        без взаимных блокировок.
+        """
+        pks = sorted(set(pks))
+        balances = {}
+        for start in range(0, len(pks), batch_size):
+            balances.update(
+                (pk, (level, debt_amount))
+                for pk, level, debt_amount in self.select_for_update().filter(
+                    pk__in=pks[start:start + batch_size]).order_by('pk').values_list('pk', 'level', 'debt_amount')
+            )
+        return balances
+
+    def add_debt(self, deltas, batch_size=1000, lock=True):
+        """
+        Изменение задолженности на суммы {id: сумма} выражением F() под блокировкой строк, один UPDATE на часть.
+        lock=False - строки уже заблокированы lock_debt в текущей транзакции.
+        """
+        if lock:
+            self.lock_debt(deltas, batch_size)
+        pks = sorted(deltas)
+        for start in range(0, len(pks), batch_size):
+            chunk = pks[start:start + batch_size]
+            self.filter(pk__in=chunk).update(debt_amount=F('debt_amount') + Case(
+                *(When(pk=pk, then=Value(deltas[pk])) for pk in chunk),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ))
+
+    def created_between(self, created_after=None, created_before=None):
+        """ Организации, созданные в интервале [created_after, created_before) """
+        queryset = self
+        if created_after is not None:
+            queryset = queryset.filter(creation_time__gte=created_after)
+        if created_before is not None:
+            queryset = queryset.filter(creation_time__lt=created_before)
+        return queryset
+
+    def debt_by_level(self):
+        """ Количество организаций и задолженность по уровням: один запрос с группировкой """
+        return self.values('level').annotate(nodes=Count('pk'), total_debt=Sum('debt_amount')).order_by('level')
+
+    def refresh_location(self):
+        """ Место организаций - место их первого контакта: один UPDATE с подзапросом по связям контактов """
+        from networks.models import Contacts
+
+        location = Contacts.objects.filter(organisation=OuterRef('pk')).order_by('pk').values('location')[:1]
+        return self.update(location=Subquery(location))
+
+    def debt_by_country(self):
+        """
+        Задолженность по странам: организация учитывается один раз, в стране своего первого контакта (location).
+        Группировка по индексу (location, debt_amount) с соединением с небольшим справочником мест.
+        """
+        return self.debt_by_location('country')
+
+    def debt_by_city(self):
+        """ Задолженность по городам (стране и городу первого контакта) """
+        return self.debt_by_location('country', 'city')
+
+    def debt_by_location(self, *fields):
+        groups = {field: F(f'location__{field}') for field in fields}
+        return self.values(**groups).annotate(nodes=Count('*'), total_debt=Sum('debt_amount')).order_by(
+            *(F(field).asc(nulls_last=True) for field in fields)
+        )
+
+    def debt_by_factory(self):
+        """ Задолженность всех нижестоящих клиентов каждого завода: группировка по таблице замыкания """
+        return self.filter(ancestor_links__ancestor__level=0, ancestor_links__depth__gt=0).values(
+            factory_id=F('ancestor_links__ancestor_id'), factory_name=F('ancestor_links__ancestor__name'),
+        ).annotate(nodes=Count('pk'), total_debt=Sum('debt_amount')).order_by('factory_id')
+
+
+class LocationQuerySet(models.QuerySet):
+    """ Справочник мест: пары страна-город без повторов """
+
+    def resolve(self, pairs, batch_size=500):
+        """ id мест {(страна, город): id} для пар pairs; недостающие места создаются """
+        pairs = set(pairs)
+        locations = self.find(pairs, batch_size)
+        missing = pairs - locations.keys()
+        if missing:
+            # Место, созданное параллельно, пропускается и читается вместе с остальными
+            self.bulk_create([self.model(country=country, city=city) for country, city in missing],
+                             batch_size=batch_size, ignore_conflicts=True)
+            locations.update(self.find(missing, batch_size))
+        return locations
+
+    def find(self, pairs, batch_size=500):
+        """ id существующих мест {(страна, город): id} для пар pairs, один запрос на batch_size пар """
+        pairs = sorted(set(pairs))
+        locations = {}
+        for start in range(0, len(pairs), batch_size):
+            batch = set(pairs[start:start + batch_size])
+            rows = self.filter(country__in={country for country, _ in batch},
+                               city__in={city for _, city in batch}).values_list('country', 'city', 'pk')
+            locations.update(((country, city), pk) for country, city, pk in rows if (country, city) in batch)
+        return locations
+
+
+class ProductQuerySet(CounterQuerySetMixin, models.QuerySet):
+    """ Набор запросов к продуктам с предзагрузкой каналов продаж """
+
+    def for_list(self):
+        """
+        Данные для вывода продуктов (ProductSerializer): названия каналов продаж, их количество хранится в строке
+        """
+        from networks.models import NetworkNode
+
+        sales_channels = NetworkNode.objects.only('id', 'name')
+        return self.order_by('name').prefetch_related(Prefetch('sales_channel', queryset=sales_channels))
+
+    def refresh_sales_channels_count(self):
+        return self.refresh_counter('sales_channels_count', 'sales_channel')
+
+
+class DebtTransactionQuerySet(models.QuerySet):
+    """ Журнал задолженности """
+
+    def balances(self):
+        """ Сумма проводок каждой организации в порядке id: [(id организации, сумма), ...] """
+        return self.order_by('network_node').values('network_node').annotate(
+            balance=Sum('amount')).values_list('network_node', 'balance')
+
+
+class SupplyLinkQuerySet(models.QuerySet):
+    """ Операции над таблицей замыкания иерархии поставок """
+
+    batch_size = 1000
+
+    def creates_cycle(self, node_id, supplier_id):
+        """ Назначение поставщика замкнёт цепочку, если поставщик - сама организация или один из её клиентов """
+        return self.filter(ancestor_id=node_id, descendant_id=supplier_id).exists()
+
+    def detach_subtree(self, node):
+        """ Отрыв организации вместе со всеми её клиентами от прежних поставщиков """
+        subtree = self.filter(ancestor=node).values('descendant')
+        self.filter(descendant__in=subtree).exclude(ancestor__in=subtree).delete()
+
+    def attach_subtree(self, node, supplier_id):
+        """ Привязка организации вместе со всеми её клиентами ко всем поставщикам нового поставщика """
+        if supplier_id is None:
+            return
+        ancestors = list(self.filter(descendant_id=supplier_id).values_list('ancestor_id', 'depth'))
+        subtree = list(self.filter(ancestor=node).values_list('descendant_id', 'depth'))
+        self.bulk_create(
+            [
+                self.model(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+                for ancestor_id, up in ancestors
+                for descendant_id, down in subtree
+            ],
+            batch_size=self.batch_size,
+        )
+
+    def detach_clients(self, node):
+        """ Отрыв клиентов удаляемой организации от её цепочки поставщиков """
+        clients = self.filter(ancestor=node, depth__gt=0).values('descendant')
+        suppliers = self.filter(descendant=node).values('ancestor')
+        self.filter(descendant__in=clients, ancestor__in=suppliers).delete()
+
+    def move_subtrees(self, pks):
+        """
+        Перепривязка организаций pks вместе со всеми их клиентами после обновления поля supplier.
+        Связи объединения поддеревьев удаляются, затем строятся заново от организаций, новый поставщик
+        которых остался вне этих поддеревьев: организация может перейти к клиенту другой перенесённой организации.
+        """
+        from networks.models import NetworkNode
+
+        subtree = set()
+        for start in range(0, len(pks), self.batch_size):
+            subtree.update(self.filter(ancestor_id__in=pks[start:start + self.batch_size]).values_list(
+                'descendant_id', flat=True))
+        roots = {}
+        for start in range(0, len(pks), self.batch_size):
+            roots.update(
+                (pk, supplier_id) for pk, supplier_id in NetworkNode.objects.filter(
+                    pk__in=pks[start:start + self.batch_size]).values_list('id', 'supplier_id')
+                if supplier_id not in subtree
+            )
+        subtree = sorted(subtree)
+        for start in range(0, len(subtree), self.batch_size):
+            self.filter(descendant_id__in=subtree[start:start + self.batch_size]).delete()
+
+        suppliers = sorted({supplier_id for supplier_id in roots.values() if supplier_id is not None})
+        ancestors = {}
+        for start in range(0, len(suppliers), self.batch_size):
+            for ancestor_id, descendant_id, depth in self.filter(
+                    descendant_id__in=suppliers[start:start + self.batch_size]).values_list(
+                    'ancestor_id', 'descendant_id', 'depth'):
+                ancestors.setdefault(descendant_id, []).append((ancestor_id, depth + 1))
+        self.build({pk: ancestors.get(supplier_id, []) for pk, supplier_id in roots.items()})
+
+    def rebuild(self):
+        """ Полное перестроение таблицы замыкания по полю supplier, уровень за уровнем от заводов """
+        from networks.models import NetworkNode
+
+        self.all().delete()
+        self.build({pk: [] for pk in NetworkNode.objects.filter(supplier__isnull=True).values_list('id', flat=True)})
+
+    def build(self, level):
+        """
+        Связи организаций level и всех их клиентов уровень за уровнем по полю supplier.
+        level - поставщики каждой организации верхнего уровня: {id: [(id поставщика, глубина), ...]}
+        """
+        from networks.models import NetworkNode
+
+        while level:
+            self.bulk_create(
+                (
+                    self.model(ancestor_id=ancestor_id, descendant_id=pk, depth=depth)
+                    for pk, ancestors in level.items()
+                    for ancestor_id, depth in [(pk, 0), *ancestors]
+                ),
+                batch_size=self.batch_size,
+            )
+            suppliers = list(level)
+            clients = {}
+            for start in range(0, len(suppliers), self.batch_size):
+                for pk, supplier_id in NetworkNode.objects.filter(
+                        supplier__in=suppliers[start:start + self.batch_size]).values_list('id', 'supplier_id'):
+                    clients[pk] = [(supplier_id, 1), *((a, depth + 1) for a, depth in level[supplier_id])]
+            level = clients
+
+
+class JobQuerySet(models.QuerySet):
+    """ Очередь фоновых задач: таблица задач служит брокером для обработчиков run_jobs """
+
+    def due(self):
+        """ Задачи в очереди, время запуска которых наступило, в порядке постановки """
+        return self.filter(status=self.model.QUEUED, run_after__lte=timezone.now()).order_by('pk')
+
+    def claim(self, worker, limit=1):
+        """
+        Захват до limit задач обработчиком worker; результат - список id захваченных задач.
+        Задача захватывается условным UPDATE по статусу, поэтому её не выполнят два обработчика сразу.
+        """
+        claimed = []
+        for pk in self.due().values_list('pk', flat=True)[:limit * 2]:
+            now = timezone.now()
+            if self.filter(pk=pk, status=self.model.QUEUED).update(
+                    status=self.model.RUNNING, worker=worker, attempts=F('attempts') + 1,
+                    started_at=now, heartbeat_at=now, finished_at=None):
+                claimed.append(pk)
+                if len(claimed) == limit:
+                    break
+        return claimed
+
+    def heartbeat(self, pks, worker):
+        """ Отметка о ходе выполнения задач pks, пока их выполняет обработчик worker """
+        return self.filter(pk__in=pks, status=self.model.RUNNING, worker=worker).update(heartbeat_at=timezone.now())
+
+    def stale(self, timeout):
+        """ Выполняемые задачи без отметки о ходе выполнения дольше timeout секунд: обработчик остановлен """
+        return self.filter(status=self.model.RUNNING, heartbeat_at__lt=timezone.now() - timedelta(seconds=timeout))
+
+    def retry(self):
+        """ Повторная постановка завершившихся с ошибкой задач в очередь с новым счётчиком попыток """
+        return self.filter(status=self.model.FAILED).update(
+            status=self.model.QUEUED, attempts=0, run_after=timezone.now(), done=0, total=None, result=None,
+            error='', worker='', finished_at=None,
+        )
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.14 on 2026-10-17 18:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_supply_links(apps, schema_editor):
+    """ Заполнение таблицы замыкания для уже существующих узлов сети, уровень за уровнем от заводов """
+    NetworkNode = apps.get_model('networks', 'NetworkNode')
+    SupplyLink = apps.get_model('networks', 'SupplyLink')
+
+    level = {pk: [] for pk in NetworkNode.objects.filter(supplier__isnull=True).values_list('id', flat=True)}
+    while level:
+        SupplyLink.objects.bulk_create(
+            (
+                SupplyLink(ancestor_id=ancestor_id, descendant_id=pk, depth=depth)
+                for pk, ancestors in level.items()
+                for ancestor_id, depth in [(pk, 0), *ancestors]
+            ),
+            batch_size=1000,
+        )
+        clients = {}
+        for pk, supplier_id in NetworkNode.objects.filter(supplier__in=list(level)).values_list('id', 'supplier_id'):
+            clients[pk] = [(supplier_id, 1), *((a, depth + 1) for a, depth in level[supplier_id])]
+        level = clients
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('networks', '0002_alter_contacts_department'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='contacts',
+            options={'ordering': ('network_node',), 'verbose_name': 'Contacts', 'verbose_name_plural': 'Contacts'},
+        ),
+        migrations.AlterModelOptions(
+            name='networknode',
+            options={'ordering': ('pk',), 'verbose_name': 'Network Node', 'verbose_name_plural': 'Network Nodes'},
+        ),
+        migrations.AlterModelOptions(
+            name='product',
+            options={'ordering': ('name',), 'verbose_name': 'Product', 'verbose_name_plural': 'Products'},
+        ),
+        migrations.AlterField(
+            model_name='networknode',
+            name='debt_amount',
+            field=models.DecimalField(decimal_places=2, default='0.00', max_digits=10, verbose_name='Debt'),
+        ),
+        migrations.CreateModel(
+            name='SupplyLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='Depth')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='networks.networknode', verbose_name='Supplier')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='networks.networknode', verbose_name='Client')),
+            ],
+            options={
+                'verbose_name': 'Supply Chain Link',
+                'verbose_name_plural': 'Supply Chain Links',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='supply_link_descendant_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='supplylink',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_supply_link'),
+        ),
+        migrations.RunPython(build_supply_links, migrations.RunPython.noop),
+    ]
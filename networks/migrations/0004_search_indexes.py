@@ -0,0 +1,50 @@
+# Generated by Django 5.0.14 on 2026-10-17 18:10
+
+from django.db import migrations, models
+
+# Триграммные GIN-индексы для поиска icontains: PostgreSQL выполняет его как UPPER(column::text) LIKE UPPER(%s)
+TRIGRAM_INDEXES = [
+    ('contacts_country_trgm_idx', 'networks_contacts', 'country'),
+    ('contacts_city_trgm_idx', 'networks_contacts', 'city'),
+    ('networknode_name_trgm_idx', 'networks_networknode', 'name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('networks', '0003_supplylink'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contacts',
+            index=models.Index(fields=['country'], name='contacts_country_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contacts',
+            index=models.Index(fields=['city'], name='contacts_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='networknode',
+            index=models.Index(fields=['level'], name='networknode_level_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.14 on 2026-10-17 18:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    """ Проводки начальной задолженности для существующих организаций, чтобы журнал сходился с debt_amount """
+    NetworkNode = apps.get_model('networks', 'NetworkNode')
+    DebtTransaction = apps.get_model('networks', 'DebtTransaction')
+
+    entries = []
+    for pk, debt_amount in NetworkNode.objects.exclude(debt_amount=0).order_by('pk').values_list(
+            'id', 'debt_amount').iterator(chunk_size=2000):
+        entries.append(DebtTransaction(network_node_id=pk, amount=debt_amount, comment='Opening balance'))
+        if len(entries) == 1000:
+            DebtTransaction.objects.bulk_create(entries)
+            entries = []
+    DebtTransaction.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('networks', '0004_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebtTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Amount')),
+                ('comment', models.CharField(blank=True, default='', max_length=255, verbose_name='Comment')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('network_node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='debt_transactions', to='networks.networknode', verbose_name='Network Node')),
+            ],
+            options={
+                'verbose_name': 'Debt Transaction',
+                'verbose_name_plural': 'Debt Transactions',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
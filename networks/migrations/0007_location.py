@@ -0,0 +1,45 @@
+# Generated by Django 5.0.14 on 2026-10-17 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('networks', '0006_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(max_length=85, verbose_name='Country')),
+                ('city', models.CharField(max_length=85, verbose_name='City')),
+            ],
+            options={
+                'verbose_name': 'Location',
+                'verbose_name_plural': 'Locations',
+                'ordering': ('country', 'city'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='location',
+            constraint=models.UniqueConstraint(fields=('country', 'city'), name='unique_location'),
+        ),
+        migrations.AddField(
+            model_name='contacts',
+            name='location',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='contacts', to='networks.location', verbose_name='Location'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='location',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='network_nodes', to='networks.location', verbose_name='Location'),
+        ),
+        migrations.AddIndex(
+            model_name='networknode',
+            index=models.Index(fields=['location', 'debt_amount'], name='networknode_location_debt_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def batches(queryset):
+    """ Границы (первый id, последний id) частей таблицы по BATCH_SIZE строк по возрастанию id """
+    last = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        yield pks[0], pks[-1]
+        last = pks[-1]
+
+
+def backfill_locations(apps, schema_editor):
+    """
+    Справочник мест и ссылки на них контактов и организаций. Таблицы обходятся частями по BATCH_SIZE строк,
+    каждая часть - отдельная транзакция, поэтому заполнение не держит блокировки всей таблицы.
+    """
+    Location = apps.get_model('networks', 'Location')
+    Contacts = apps.get_model('networks', 'Contacts')
+    NetworkNode = apps.get_model('networks', 'NetworkNode')
+
+    for first, last in batches(Contacts.objects.all()):
+        contacts = Contacts.objects.filter(pk__range=(first, last))
+        Location.objects.bulk_create(
+            [Location(country=country, city=city) for country, city in set(contacts.values_list('country', 'city'))],
+            ignore_conflicts=True,
+        )
+        location = Location.objects.filter(country=OuterRef('country'), city=OuterRef('city')).values('pk')
+        contacts.update(location=Subquery(location[:1]))
+
+    location = Contacts.objects.filter(organisation=OuterRef('pk')).order_by('pk').values('location')
+    for first, last in batches(NetworkNode.objects.all()):
+        NetworkNode.objects.filter(pk__range=(first, last)).update(location=Subquery(location[:1]))
+
+
+class Migration(migrations.Migration):
+    # Каждая часть заполнения фиксируется отдельно
+    atomic = False
+
+    dependencies = [
+        ('networks', '0007_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-17 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('networks', '0008_backfill_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networknode',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Number of products'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sales_channels_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Number of sales channels'),
+        ),
+        migrations.AddIndex(
+            model_name='networknode',
+            index=models.Index(fields=['products_count', 'id'], name='networknode_products_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sales_channels_count', 'id'], name='product_channels_count_idx'),
+        ),
+    ]
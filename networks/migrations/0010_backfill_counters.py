@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 5000
+
+
+def batches(queryset):
+    """ Границы (первый id, последний id) частей таблицы по BATCH_SIZE строк по возрастанию id """
+    last = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        yield pks[0], pks[-1]
+        last = pks[-1]
+
+
+def backfill_counters(apps, schema_editor):
+    """ Счётчики связей существующих организаций и продуктов, частями по BATCH_SIZE строк """
+    NetworkNode = apps.get_model('networks', 'NetworkNode')
+    Product = apps.get_model('networks', 'Product')
+
+    for model, field, counter in ((NetworkNode, 'products', 'products_count'),
+                                  (Product, 'sales_channel', 'sales_channels_count')):
+        field = model._meta.get_field(field)
+        column = field.m2m_field_name()
+        links = field.remote_field.through.objects.filter(**{column: OuterRef('pk')}).order_by()
+        actual = Coalesce(Subquery(links.values(column).annotate(count=Count('*')).values('count')), 0)
+        for first, last in batches(model.objects.all()):
+            model.objects.filter(pk__range=(first, last)).update(**{counter: actual})
+
+
+class Migration(migrations.Migration):
+    # Каждая часть заполнения фиксируется отдельно
+    atomic = False
+
+    dependencies = [
+        ('networks', '0009_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
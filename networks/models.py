@@ -1,5 +1,35 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from networks.managers import NetworkNodeQuerySet, ProductQuerySet, SupplyLinkQuerySet, DebtTransactionQuerySet, \
+    JobQuerySet, LocationQuerySet
+
+
+class Location(models.Model):
+    """
+    Место - страна и город без повторов. Контакты ссылаются на своё место, организации - на место первого
+    контакта, поэтому фильтры и сводки по странам и городам не читают строки контактов.
+    """
+
+    country = models.CharField(max_length=85, verbose_name='Country')
+    city = models.CharField(max_length=85, verbose_name='City')
+
+    objects = LocationQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.country}, {self.city}"
+
+    class Meta:
+        verbose_name = 'Location'
+        verbose_name_plural = 'Locations'
+        ordering = ('country', 'city')
+        constraints = [
+            models.UniqueConstraint(fields=['country', 'city'], name='unique_location'),
+        ]
 
 
 class Contacts(models.Model):
@@ -11,6 +41,8 @@ class Contacts(models.Model):
     building = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='"Bld.')
     network_node = models.ForeignKey('NetworkNode', null=True, blank=True, on_delete=models.CASCADE,
                                      related_name='data')
+    location = models.ForeignKey(Location, null=True, blank=True, editable=False, on_delete=models.PROTECT,
+                                 related_name='contacts', verbose_name='Location')
 
     def clean(self):
         super().clean()
@@ -19,6 +51,17 @@ class Contacts(models.Model):
                 'building': 'Number of building should not exceed 5 characters.'
             })
 
+    def save(self, *args, **kwargs):
+        """ Место контакта по стране и городу; при смене места пересчитывается место организаций (signals) """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'country', 'city'} & set(update_fields):
+            location_id = self.location_id
+            self.location = Location.objects.get_or_create(country=self.country, city=self.city)[0]
+            self.location_changed = not self._state.adding and self.location_id != location_id
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'location'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.country}, {self.city} - {self.email}"
 
@@ -26,6 +69,10 @@ class Contacts(models.Model):
         verbose_name = 'Contacts'
         verbose_name_plural = 'Contacts'
         ordering = ('network_node',)
+        indexes = [
+            models.Index(fields=['country'], name='contacts_country_idx'),
+            models.Index(fields=['city'], name='contacts_city_idx'),
+        ]
 
 
 class Product(models.Model):
@@ -33,6 +80,11 @@ class Product(models.Model):
     model = models.CharField(max_length=255, verbose_name='Model')
     release_date = models.DateField(null=True, blank=True, verbose_name='Release Date')
     sales_channel = models.ManyToManyField('NetworkNode', blank=True, related_name='product')
+    # Количество каналов продаж, поддерживается сигналами изменения связей (networks.signals.update_counters)
+    sales_channels_count = models.PositiveIntegerField(default=0, editable=False,
+                                                       verbose_name='Number of sales channels')
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -41,6 +93,9 @@ class Product(models.Model):
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
         ordering = ('name',)
+        indexes = [
+            models.Index(fields=['sales_channels_count', 'id'], name='product_channels_count_idx'),
+        ]
 
 
 class NetworkNode(models.Model):
@@ -58,6 +113,13 @@ class NetworkNode(models.Model):
     debt_amount = models.DecimalField(max_digits=10, decimal_places=2, default='0.00', verbose_name='Debt')
     creation_time = models.DateTimeField(auto_now_add=True, verbose_name='Creation Time')
     level = models.IntegerField(choices=LEVELS_CHOICES, default=1)
+    # Место первого контакта, поддерживается сигналами изменения контактов (refresh_location)
+    location = models.ForeignKey(Location, null=True, blank=True, editable=False, on_delete=models.SET_NULL,
+                                 db_index=False, related_name='network_nodes', verbose_name='Location')
+    # Количество продуктов, поддерживается сигналами изменения связей (networks.signals.update_counters)
+    products_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Number of products')
+
+    objects = NetworkNodeQuerySet.as_manager()
 
     def clean(self):
         """ Валидация данных при работе через админ-панель """
@@ -67,6 +129,10 @@ class NetworkNode(models.Model):
         if self.supplier == self:
             raise ValidationError("An organisation cannot be its own supplier.")
 
+        """ Проверка, что поставщик не является клиентом организации на любом нижестоящем уровне """
+        if self.pk and self.supplier_id and SupplyLink.objects.creates_cycle(self.pk, self.supplier_id):
+            raise ValidationError("An organisation cannot be supplied by its own client.")
+
         """ Проверка, что завод не может иметь задолженности """
         if self.level == 0:
             if self.debt_amount:
@@ -78,9 +144,38 @@ class NetworkNode(models.Model):
         elif self.level in (1, 2) and not self.supplier:
             raise ValidationError("Retail or Consumer must have a supplier.")
 
+    def get_ancestors(self):
+        """ Все вышестоящие поставщики организации """
+        return NetworkNode.objects.ancestors_of(self)
+
+    def get_descendants(self):
+        """ Все нижестоящие клиенты организации """
+        return NetworkNode.objects.descendants_of(self)
+
     def save(self, *args, **kwargs):
         self.full_clean()  # Вызов полной валидации
-        super().save(*args, **kwargs)
+
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        track_supplier = not adding and (update_fields is None or 'supplier' in update_fields)
+
+        with transaction.atomic():
+            old_supplier_id = None
+            if track_supplier:
+                old_supplier_id = NetworkNode.objects.filter(pk=self.pk).values_list('supplier_id', flat=True).first()
+
+            super().save(*args, **kwargs)
+
+            # Поддержка иерархии поставок в актуальном состоянии
+            if adding:
+                SupplyLink.objects.create(ancestor=self, descendant=self, depth=0)
+                SupplyLink.objects.attach_subtree(self, self.supplier_id)
+                # Начальная задолженность - первая проводка журнала
+                if self.debt_amount:
+                    DebtTransaction.objects.bulk_create([DebtTransaction.opening(self.pk, self.debt_amount)])
+            elif track_supplier and old_supplier_id != self.supplier_id:
+                SupplyLink.objects.detach_subtree(self)
+                SupplyLink.objects.attach_subtree(self, self.supplier_id)
 
     def __str__(self):
         return self.name
@@ -89,3 +184,168 @@ class NetworkNode(models.Model):
         verbose_name = 'Network Node'
         verbose_name_plural = 'Network Nodes'
         ordering = ('pk',)
+        indexes = [
+            models.Index(fields=['level'], name='networknode_level_idx'),
+            # Сводки по местам читают только индекс
+            models.Index(fields=['location', 'debt_amount'], name='networknode_location_debt_idx'),
+            models.Index(fields=['products_count', 'id'], name='networknode_products_count_idx'),
+        ]
+
+
+class SupplyLink(models.Model):
+    """ Таблица замыкания иерархии поставок: связь каждой организации со всеми её поставщиками """
+
+    ancestor = models.ForeignKey(NetworkNode, on_delete=models.CASCADE, related_name='descendant_links',
+                                 verbose_name='Supplier')
+    descendant = models.ForeignKey(NetworkNode, on_delete=models.CASCADE, related_name='ancestor_links',
+                                   verbose_name='Client')
+    depth = models.PositiveIntegerField(verbose_name='Depth')
+
+    objects = SupplyLinkQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    class Meta:
+        verbose_name = 'Supply Chain Link'
+        verbose_name_plural = 'Supply Chain Links'
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_supply_link'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='supply_link_descendant_idx'),
+        ]
+
+
+class DebtTransaction(models.Model):
+    """
+    Проводка журнала задолженности. Журнал только дополняется: задолженность организации (debt_amount) -
+    сумма её проводок, изменяется проводками через networks.ledger.DebtPosting.
+    """
+
+    OPENING_COMMENT = 'Opening balance'
+
+    network_node = models.ForeignKey(NetworkNode, on_delete=models.CASCADE, related_name='debt_transactions',
+                                     verbose_name='Network Node')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Amount')
+    comment = models.CharField(max_length=255, blank=True, default='', verbose_name='Comment')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+
+    objects = DebtTransactionQuerySet.as_manager()
+
+    @classmethod
+    def opening(cls, network_node_id, amount):
+        """ Проводка начальной задолженности организации, созданной с ненулевым debt_amount """
+        return cls(network_node_id=network_node_id, amount=amount, comment=cls.OPENING_COMMENT)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Debt transactions cannot be changed.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.network_node_id}: {self.amount}"
+
+    class Meta:
+        verbose_name = 'Debt Transaction'
+        verbose_name_plural = 'Debt Transactions'
+        ordering = ('pk',)
+
+
+class Job(models.Model):
+    """
+    Фоновая задача: выгрузка, пересчёт или массовое изменение, выполняемое обработчиком run_jobs.
+    Задачи ставятся в очередь networks.jobs.enqueue, параметры и результат хранятся в JSON.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    task = models.CharField(max_length=100, verbose_name='Task')
+    params = models.JSONField(default=dict, blank=True, verbose_name='Parameters')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, verbose_name='Status')
+    done = models.PositiveBigIntegerField(default=0, verbose_name='Done')
+    total = models.PositiveBigIntegerField(null=True, blank=True, verbose_name='Total')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name='Max attempts')
+    result = models.JSONField(null=True, blank=True, verbose_name='Result')
+    error = models.TextField(blank=True, default='', verbose_name='Error')
+    worker = models.CharField(max_length=100, blank=True, default='', verbose_name='Worker')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='jobs', verbose_name='Created By')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='Run After')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Started At')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name='Heartbeat At')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Finished At')
+
+    objects = JobQuerySet.as_manager()
+
+    @property
+    def progress(self):
+        """ Доля выполненной работы в процентах или None, если объём работы неизвестен """
+        if self.status == self.SUCCEEDED:
+            return 100
+        if not self.total:
+            return None
+        return min(100, self.done * 100 // self.total)
+
+    def report(self, done, total=None):
+        """
+        Отметка о ходе выполнения: done единиц работы из total. Записывается отдельным UPDATE и видна
+        другим соединениям сразу, если задача не выполняет её внутри своей транзакции.
+        """
+        self.done = done
+        self.heartbeat_at = timezone.now()
+        fields = {'done': done, 'heartbeat_at': self.heartbeat_at}
+        if total is not None:
+            self.total = fields['total'] = total
+        Job.objects.filter(pk=self.pk).update(**fields)
+
+    def succeed(self, result):
+        return self.finish(status=self.SUCCEEDED, result=result, error='', finished_at=timezone.now())
+
+    def fail(self, error, retry=True):
+        """
+        Ошибка выполнения: задача возвращается в очередь с задержкой JOBS_RETRY_DELAY * 2 ** (попытка - 1) секунд,
+        пока не исчерпаны попытки и ошибка допускает повтор, иначе завершается с ошибкой
+        """
+        now = timezone.now()
+        if retry and self.attempts < self.max_attempts:
+            delay = timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** max(self.attempts - 1, 0))
+            return self.finish(status=self.QUEUED, error=error, worker='', run_after=now + delay)
+        return self.finish(status=self.FAILED, error=error, worker='', finished_at=now)
+
+    def finish(self, **fields):
+        """
+        Запись итога попытки условным UPDATE по её захвату (статус, обработчик, номер попытки): задачу, которую
+        вернули в очередь и захватили снова, пока попытка ещё выполнялась, попытка не перезаписывает.
+        Результат - записан ли итог; если нет, в памяти остаётся состояние из базы данных.
+        """
+        updated = Job.objects.filter(pk=self.pk, status=self.RUNNING, worker=self.worker,
+                                     attempts=self.attempts).update(**fields)
+        if not updated:
+            self.refresh_from_db()
+            return False
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+    def __str__(self):
+        return f"#{self.pk} {self.task}"
+
+    class Meta:
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        ordering = ('-pk',)
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
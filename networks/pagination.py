@@ -1,7 +1,161 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPaginator(BasePagination):
+    """
+    Пагинация по ключу (keyset): следующая страница выбирается условием по значениям ключа последней записи.
+    Не выполняет COUNT(*) и OFFSET, страницы не сдвигаются при добавлении записей.
+    Ключ задаётся атрибутом представления keyset_fields: ('pk',), ('name', 'pk') или ('-products_count', '-pk'),
+    поле с минусом упорядочивается по убыванию. Полем ключа может быть и аннотация набора запросов.
+    """
+
+    page_size = 10
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = tuple(getattr(view, 'keyset_fields', ('pk',)))
+        position, reverse = self.decode_cursor(request, queryset)
+
+        ordering = [self.reverse_field(field) for field in self.fields] if reverse else list(self.fields)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position, reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_position = self.get_position(rows[-1]) if rows and (reverse or has_more) else None
+        self.previous_position = self.get_position(rows[0]) if rows and (has_more if reverse else position) else None
+        return rows
+
+    def after(self, position, reverse):
+        """ Условие "после позиции" для составного ключа: (a > x) OR (a = x AND b > y) """
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            equal = {self.fields[j].lstrip('-'): position[j] for j in range(i)}
+            lookup = 'lt' if reverse != field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field.lstrip("-")}__{lookup}': position[i]})
+        return condition
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.fields]
+
+    def decode_cursor(self, request, queryset):
+        """ Позиция и направление из курсора; значения ключа приводятся к типам полей модели или аннотаций """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = cursor['p'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.model_field(queryset, field).to_python(value) for field, value in zip(self.fields, position)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    @staticmethod
+    def model_field(queryset, field):
+        name = field.lstrip('-')
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        model = queryset.model
+        return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+    def encode_cursor(self, position, reverse):
+        cursor = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, urlsafe_b64encode(cursor.encode()).decode('ascii'))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
 
 
 class CustomPaginator(PageNumberPagination):
+    """
+    Постраничный вывод по номеру страницы (параметр page_size).
+    Пагинация по ключу включается для запроса параметром ?pagination=cursor или переданным курсором ?cursor=.
+    """
+
     page_size = 10
     page_query_param = 'page_size'
     max_page_size = 15
+    pagination_query_param = 'pagination'
+    keyset_class = KeysetPaginator
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.pagination_query_param) == 'cursor'
+                or self.keyset_class.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            self.keyset.page_size = self.page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters += [
+            {
+                'name': self.pagination_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "cursor" to use keyset pagination without a total count.',
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            {
+                'name': self.keyset_class.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque keyset pagination cursor from the next/previous link.',
+                'schema': {'type': 'string'},
+            },
+        ]
+        return parameters
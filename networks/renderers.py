@@ -0,0 +1,20 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from networks.fastjson import dumps
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на networks.fastjson.dumps (orjson, если установлен) с тем же выводом.
+    Отступы и нестандартные настройки JSON (UNICODE_JSON, COMPACT_JSON, STRICT_JSON, encoder_class)
+    выводятся рендерером DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.ensure_ascii or not self.compact or not self.strict or self.encoder_class is not JSONEncoder or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
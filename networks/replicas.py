@@ -0,0 +1,119 @@
+"""
+Чтение с реплик базы данных.
+
+Реплики - псевдонимы DATABASE_REPLICAS в DATABASES (POSTGRES_REPLICA_HOSTS). ReplicaRouter направляет чтение
+на случайную реплику только внутри безопасного запроса (GET, HEAD, OPTIONS), отмеченного ReplicaMiddleware:
+списки и карточки API, списки админ-панели. Запись, изменяющие запросы, сессии, фоновые задачи и команды
+работают с основной базой данных.
+
+Реплика отстаёт от основной базы данных, поэтому после изменяющего запроса клиент REPLICA_STICKY_SECONDS секунд
+читает с основной базы данных и видит свои изменения. Клиент определяется по заголовку Authorization,
+без него - по cookie сессии или адресу; отметка хранится в кэше (общем для процессов при REDIS_URL).
+"""
+
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+@contextmanager
+def use_primary():
+    """ Чтение с основной базы данных внутри блока, например перед изменением прочитанных данных """
+    token = read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        read_from_replica.reset(token)
+
+
+def sticky_key(request):
+    """ Ключ отметки "читать с основной базы данных" для клиента запроса """
+    client = (request.headers.get('Authorization')
+              or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+              or request.META.get('REMOTE_ADDR', ''))
+    return 'replicas:primary:' + hashlib.md5(client.encode()).hexdigest()
+
+
+class ReplicaRouter:
+    """ Чтение безопасных запросов с реплик, всё остальное - с основной базы данных """
+
+    # Сессии читаются сразу после записи при входе в админ-панель
+    primary_apps = {'sessions'}
+
+    def db_for_read(self, model, **hints):
+        if (not settings.DATABASE_REPLICAS or not read_from_replica.get()
+                or model._meta.app_label in self.primary_apps):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база данных
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с основной базы данных репликацией
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    """
+    Чтение с реплик на время безопасного запроса клиента без недавних изменений и отметка клиента
+    после изменяющего запроса. Работает в синхронной (WSGI) и асинхронной (ASGI) цепочке middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            cache.set(sticky_key(request), True, settings.REPLICA_STICKY_SECONDS)
+            return response
+
+        token = read_from_replica.set(not cache.get(sticky_key(request)))
+        try:
+            return self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            response = await self.get_response(request)
+            await cache.aset(sticky_key(request), True, settings.REPLICA_STICKY_SECONDS)
+            return response
+
+        # Значение переменной контекста передаётся в потоки sync_to_async асинхронного ORM
+        token = read_from_replica.set(not await cache.aget(sticky_key(request)))
+        try:
+            return await self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
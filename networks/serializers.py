@@ -1,10 +1,13 @@
 from rest_framework import serializers
 
-from networks.models import NetworkNode, Product, Contacts
-from networks.validators import SupplierValidator, FactoryDebtValidator
+from networks.actions import SupplierReassignment, LevelChange
+from networks.instrumentation import TimedSerializerMixin
+from networks.models import NetworkNode, Product, Contacts, DebtTransaction, Job
+from networks.representation import CompiledListSerializer
+from networks.validators import SupplierValidator, FactoryDebtValidator, SupplyCycleValidator
 
 
-class ContactsSerializer(serializers.ModelSerializer):
+class ContactsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Сериалайзер для вывода контактов списком """
 
     class Meta:
@@ -57,23 +60,19 @@ class ProductSerializerCustom(ProductSerializerBase):
         fields = ProductSerializerBase.Meta.fields + ['release_date']
 
 
-class ProductSerializer(ProductSerializerBase):
+class ProductSerializer(TimedSerializerMixin, ProductSerializerBase):
     """ Сериалайзер для вывода информации о товарах в списке """
 
-    number_of_sales_channels = serializers.IntegerField(read_only=True)
+    # Количество каналов продаж хранится в строке продукта (sales_channels_count)
+    number_of_sales_channels = serializers.IntegerField(source='sales_channels_count', read_only=True)
     sales_channel = NetworkNodeSerializerBrif(many=True, read_only=True)
 
     class Meta(ProductSerializerBase.Meta):
         fields = ProductSerializerCustom.Meta.fields + ['number_of_sales_channels', 'sales_channel']
+        list_serializer_class = CompiledListSerializer
 
-    def to_representation(self, instance):
-        """ Добавление поля количества каналов продаж для каждого товара """
-        representation = super().to_representation(instance)
-        representation['number_of_sales_channels'] = instance.sales_channel.count()
-        return representation
 
-
-class NetworkNodeCreateSerializer(serializers.ModelSerializer):
+class NetworkNodeCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Сериалайзер для создания новой записи организации """
 
     contacts = serializers.PrimaryKeyRelatedField(many=True, queryset=Contacts.objects.all())
@@ -82,21 +81,56 @@ class NetworkNodeCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = NetworkNode
         fields = ['name', 'contacts', 'products', 'supplier', 'debt_amount', 'creation_time', 'level']
-        validators = [SupplierValidator(), FactoryDebtValidator()]
+        validators = [SupplierValidator(), FactoryDebtValidator(), SupplyCycleValidator()]
+
+
+class NetworkNodeBulkSerializer(serializers.Serializer):
+    """ Сериалайзер записи пакетной загрузки организаций; связи проверяются для всего пакета в NetworkNodeBulkUpsert """
+
+    name = serializers.CharField(max_length=255)
+    level = serializers.ChoiceField(choices=NetworkNode.LEVELS_CHOICES, required=False)
+    supplier = serializers.IntegerField(required=False, allow_null=True)
+    supplier_name = serializers.CharField(max_length=255, required=False)
+    debt_amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    contacts = serializers.ListField(child=serializers.IntegerField(), required=False)
+    products = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class DebtTransactionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """ Сериалайзер для вывода проводок журнала задолженности """
+
+    class Meta:
+        model = DebtTransaction
+        fields = ['id', 'network_node', 'amount', 'comment', 'created_at']
 
 
-class NetworkNodeSerializer(serializers.ModelSerializer):
+class DebtTransactionFilterSerializer(serializers.Serializer):
+    """ Параметры списка журнала задолженности: проводки одной организации """
+
+    network_node = serializers.IntegerField(required=False)
+
+
+class DebtPostingSerializer(serializers.Serializer):
+    """ Сериалайзер проводки пакета; организации проверяются для всего пакета в DebtPosting """
+
+    network_node = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    comment = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+
+class NetworkNodeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Сериалайзер для вывода информации об организациях в списке """
 
     contacts = ContactsSerializerBrief(many=True)
-    items_quantity = serializers.IntegerField(read_only=True)
+    items_quantity = serializers.IntegerField(source='products_count', read_only=True)
 
     class Meta:
         model = NetworkNode
         fields = ['id', 'name', 'contacts', 'items_quantity', 'supplier', 'debt_amount', 'level']
+        list_serializer_class = CompiledListSerializer
 
 
-class NetworkNodeDetailSerializer(serializers.ModelSerializer):
+class NetworkNodeDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Сериалайзер для вывода и обновления информации об отдельной организации """
 
     contacts = ContactsSerializerCustom(many=True, read_only=True)
@@ -105,13 +139,142 @@ class NetworkNodeDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = NetworkNode
         fields = ['id', 'name', 'contacts', 'products', 'supplier', 'debt_amount', 'creation_time', 'level']
-        validators = [SupplierValidator()]
+        validators = [SupplierValidator(), SupplyCycleValidator()]
 
     def validate_supplier(self, value):
         """ Проверка, что организация не ссылается на себя как на своего поставщика """
         if self.instance == value:
             raise serializers.ValidationError("An organisation cannot be its own supplier.")
+        return value
 
     def validate_debt_amount(self, value):
         """Запрет на изменения поля 'debt_amount' по API"""
         raise serializers.ValidationError("This field is restricted to be changed.")
+
+
+class DebtAnalyticsFilterSerializer(serializers.Serializer):
+    """ Параметры аналитики задолженности: интервал времени создания организаций [created_after, created_before) """
+
+    created_after = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+    created_before = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+
+
+class DebtGroupSerializer(serializers.Serializer):
+    """ Количество организаций и сумма задолженности группы """
+
+    nodes = serializers.IntegerField()
+    total_debt = serializers.DecimalField(max_digits=None, decimal_places=2)
+
+
+class DebtByLevelSerializer(DebtGroupSerializer):
+    level = serializers.IntegerField()
+
+
+class DebtByCountrySerializer(DebtGroupSerializer):
+    country = serializers.CharField(allow_null=True)
+
+
+class DebtByCitySerializer(DebtByCountrySerializer):
+    city = serializers.CharField(allow_null=True)
+
+
+class LocationAnalyticsFilterSerializer(DebtAnalyticsFilterSerializer):
+    """ Параметры сводки по местам: группировка по странам или городам и необязательная страна """
+
+    group_by = serializers.ChoiceField(choices=['country', 'city'], default='country')
+    country = serializers.CharField(required=False)
+
+
+class DebtByFactorySerializer(DebtGroupSerializer):
+    factory_id = serializers.IntegerField()
+    factory_name = serializers.CharField()
+
+
+class DebtAnalyticsSerializer(DebtGroupSerializer):
+    """ Сериалайзер аналитики задолженности: итог, по уровням, по странам и по заводам с учётом всех клиентов """
+
+    by_level = DebtByLevelSerializer(many=True)
+    by_country = DebtByCountrySerializer(many=True)
+    by_factory = DebtByFactorySerializer(many=True)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """ Сериалайзер состояния фоновой задачи; progress - проценты или null, если объём работы неизвестен """
+
+    progress = serializers.IntegerField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Job
+        fields = ['id', 'task', 'params', 'status', 'progress', 'done', 'total', 'attempts', 'max_attempts',
+                  'result', 'error', 'created_at', 'run_after', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+
+class JobCreateSerializer(serializers.Serializer):
+    """ Постановка задачи в очередь: имя задачи и параметры, проверенные сериалайзером задачи """
+
+    task = serializers.ChoiceField(choices=[])
+    params = serializers.DictField(default=dict)
+
+    def __init__(self, *args, **kwargs):
+        from networks.jobs import TASKS
+
+        super().__init__(*args, **kwargs)
+        self.tasks = {name: task for name, task in TASKS.items() if task.serializer_class is not None}
+        self.fields['task'].choices = sorted(self.tasks)
+
+    def validate(self, attrs):
+        serializer = self.tasks[attrs['task']].serializer_class(data=attrs['params'])
+        if not serializer.is_valid():
+            raise serializers.ValidationError({'params': serializer.errors})
+        attrs['params'] = serializer.validated_data
+        return attrs
+
+
+class ExportJobSerializer(serializers.Serializer):
+    """ Параметры выгрузки сети в файл """
+
+    export_format = serializers.CharField(default='ndjson')
+
+    def validate_export_format(self, value):
+        from networks.export import EXPORT_FORMATS
+
+        if value not in EXPORT_FORMATS:
+            raise serializers.ValidationError(f'Supported formats: {", ".join(sorted(EXPORT_FORMATS))}.')
+        return value
+
+
+class ReconcileJobSerializer(serializers.Serializer):
+    """ Параметры сверки задолженности с журналом: только сверка, исправление задолженности или журнала """
+
+    mode = serializers.ChoiceField(choices=['check', 'fix', 'adjust_ledger'], default='check')
+
+
+class NodeSelectionJobSerializer(serializers.Serializer):
+    """ Выборка организаций массового изменения по id """
+
+    pks = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class LevelChangeJobSerializer(NodeSelectionJobSerializer):
+    """ Параметры смены уровня; правила уровней проверяются для выборки целиком до постановки в очередь """
+
+    level = serializers.ChoiceField(choices=NetworkNode.LEVELS_CHOICES)
+
+    def validate(self, attrs):
+        operation = LevelChange(attrs['pks'], attrs['level'])
+        if not operation.is_valid():
+            raise serializers.ValidationError(operation.errors)
+        return attrs
+
+
+class SupplierReassignmentJobSerializer(NodeSelectionJobSerializer):
+    """ Параметры смены поставщика; выборка проверяется целиком до постановки в очередь """
+
+    supplier_id = serializers.IntegerField()
+
+    def validate(self, attrs):
+        operation = SupplierReassignment(attrs['pks'], attrs['supplier_id'])
+        if not operation.is_valid():
+            raise serializers.ValidationError(operation.errors)
+        return attrs
@@ -0,0 +1,155 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_delete, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from networks.cache import invalidate_nodes
+from networks.models import NetworkNode, SupplyLink, Contacts, Product
+
+
+def invalidate_on_commit(pks):
+    """
+    Сброс кэша организаций pks после фиксации транзакции. Версия, записанная до фиксации, позволила бы
+    параллельному запросу сохранить ещё не изменённые строки под новой версией. Организации выбираются сразу:
+    после удаления связей их уже не найти.
+    """
+    pks = list(pks)
+    transaction.on_commit(lambda: invalidate_nodes(pks))
+
+
+@receiver(pre_delete, sender=NetworkNode)
+def detach_supply_clients(sender, instance, **kwargs):
+    """ Клиенты удаляемой организации остаются без поставщика (SET_NULL) и выходят из её цепочки """
+    SupplyLink.objects.detach_clients(instance)
+    # В карточках клиентов сбрасывается поставщик
+    invalidate_on_commit(instance.supplied_by.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=NetworkNode)
+@receiver(post_delete, sender=NetworkNode)
+def invalidate_network_node(sender, instance, **kwargs):
+    """ Сброс кэша карточки организации и списка """
+    invalidate_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Contacts)
+@receiver(pre_delete, sender=Contacts)
+def invalidate_contacts_nodes(sender, instance, **kwargs):
+    """ Сброс кэша организаций, в карточках и списке которых выводятся контакты """
+    invalidate_on_commit(instance.organisation.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def invalidate_product_nodes(sender, instance, **kwargs):
+    """ Сброс кэша организаций, в карточках которых выводится продукт """
+    invalidate_on_commit(instance.seller.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=NetworkNode.contacts.through)
+@receiver(m2m_changed, sender=NetworkNode.products.through)
+def invalidate_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Сброс кэша организаций при изменении их контактов или продуктов """
+    if action in ('post_add', 'post_remove'):
+        invalidate_on_commit(pk_set if reverse else [instance.pk])
+    elif action == 'pre_clear' and reverse:
+        related = instance.organisation if sender is NetworkNode.contacts.through else instance.seller
+        invalidate_on_commit(related.values_list('pk', flat=True))
+    elif action == 'pre_clear':
+        invalidate_on_commit([instance.pk])
+
+
+@receiver(m2m_changed, sender=NetworkNode.contacts.through)
+def refresh_node_locations(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Пересчёт места организаций (место первого контакта) при изменении их контактов """
+    if action in ('post_add', 'post_remove'):
+        NetworkNode.objects.filter(pk__in=pk_set if reverse else [instance.pk]).refresh_location()
+    elif action == 'pre_clear' and reverse:
+        instance.cleared_nodes = list(instance.organisation.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        pks = instance.__dict__.pop('cleared_nodes', []) if reverse else [instance.pk]
+        NetworkNode.objects.filter(pk__in=pks).refresh_location()
+
+
+@receiver(post_save, sender=Contacts)
+def refresh_contacts_nodes_location(sender, instance, **kwargs):
+    """ Пересчёт места организаций контакта при смене его страны или города """
+    if getattr(instance, 'location_changed', False):
+        NetworkNode.objects.filter(contacts=instance).refresh_location()
+
+
+@receiver(pre_delete, sender=Contacts)
+def remember_contacts_nodes(sender, instance, **kwargs):
+    # Связи удаляются вместе с контактом без сигнала m2m_changed
+    instance.deleted_nodes = list(instance.organisation.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Contacts)
+def refresh_deleted_contacts_nodes_location(sender, instance, **kwargs):
+    NetworkNode.objects.filter(pk__in=instance.__dict__.pop('deleted_nodes', [])).refresh_location()
+
+
+# Хранимые счётчики связей many-to-many: связь -> (поле связи, поле счётчика у модели связи)
+COUNTERS = {
+    NetworkNode.products.through: (NetworkNode._meta.get_field('products'), 'products_count'),
+    Product.sales_channel.through: (Product._meta.get_field('sales_channel'), 'sales_channels_count'),
+}
+
+
+def add_to_counter(field, counter, pks, delta):
+    """ Изменение счётчика строк pks выражением F(): параллельные изменения не теряются """
+    if pks and delta:
+        field.model.objects.filter(pk__in=pks).update(**{counter: F(counter) + delta})
+
+
+@receiver(m2m_changed, sender=NetworkNode.products.through)
+@receiver(m2m_changed, sender=Product.sales_channel.through)
+def update_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Счётчик связей изменяется на число действительно добавленных или удалённых связей: при добавлении pk_set
+    содержит только новые связи, удаляемые связи считаются до удаления. При изменении со стороны связанной
+    модели (product.seller.add(...)) счётчик каждой затронутой строки изменяется на 1.
+    """
+    field, counter = COUNTERS[sender]
+    source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+    links = sender.objects.filter(**{target if reverse else source: instance.pk})
+
+    if action == 'post_add':
+        if reverse:
+            add_to_counter(field, counter, pk_set, 1)
+        else:
+            add_to_counter(field, counter, [instance.pk], len(pk_set))
+            # Значение в памяти - для ответа на запрос, изменивший связи
+            setattr(instance, counter, getattr(instance, counter) + len(pk_set))
+    elif action in ('pre_remove', 'pre_clear'):
+        if action == 'pre_remove':
+            links = links.filter(**{f'{source if reverse else target}__in': pk_set})
+        if reverse:
+            instance.__dict__[f'{counter}_removed'] = list(links.values_list(f'{source}_id', flat=True))
+        else:
+            instance.__dict__[f'{counter}_removed'] = links.count()
+    elif action in ('post_remove', 'post_clear'):
+        removed = instance.__dict__.pop(f'{counter}_removed', None)
+        if reverse:
+            add_to_counter(field, counter, removed, -1)
+        elif removed:
+            add_to_counter(field, counter, [instance.pk], -removed)
+            setattr(instance, counter, getattr(instance, counter) - removed)
+
+
+@receiver(pre_delete, sender=NetworkNode)
+@receiver(pre_delete, sender=Product)
+def remember_counted_links(sender, instance, **kwargs):
+    # Связи удаляются вместе со строкой без сигнала m2m_changed
+    for through, (field, counter) in COUNTERS.items():
+        if field.related_model is sender:
+            links = through.objects.filter(**{field.m2m_reverse_field_name(): instance.pk})
+            instance.__dict__[f'{counter}_removed'] = list(links.values_list(f'{field.m2m_field_name()}_id', flat=True))
+
+
+@receiver(post_delete, sender=NetworkNode)
+@receiver(post_delete, sender=Product)
+def update_deleted_counters(sender, instance, **kwargs):
+    for field, counter in COUNTERS.values():
+        if field.related_model is sender:
+            add_to_counter(field, counter, instance.__dict__.pop(f'{counter}_removed', None), -1)
@@ -0,0 +1,107 @@
+"""
+Фоновые задачи сети: выгрузка в файл, пересчёты и массовые изменения больших выборок (networks.jobs).
+"""
+
+import os
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.permissions import IsAdminUser
+
+from networks.actions import SupplierReassignment, LevelChange, DebtReset
+from networks.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS
+from networks.jobs import JobError, task, result_path
+from networks.ledger import compare_balances, fix_balances, adjust_ledger
+from networks.models import NetworkNode, SupplyLink
+from networks.serializers import ExportJobSerializer, ReconcileJobSerializer, LevelChangeJobSerializer, \
+    SupplierReassignmentJobSerializer, NodeSelectionJobSerializer
+
+
+def run_operation(job, operation):
+    """
+    Выполнение операции networks.actions над выборкой. Выборка проверяется заново: данные могли измениться
+    после постановки в очередь, а ошибка проверки повтором не исправится.
+    """
+    job.report(0, len(operation.pks))
+    if not operation.is_valid():
+        raise JobError(' '.join(operation.errors))
+    updated = operation.save()
+    job.report(updated)
+    return {'updated': updated}
+
+
+@task('networks.export', serializer_class=ExportJobSerializer)
+def export(job, export_format='ndjson', pks=None):
+    """
+    Выгрузка сети (или организаций pks) в файл JOBS_RESULT_DIR/network-<id задачи>.<формат>.
+    Файл пишется во временный и переименовывается по завершении, поэтому неполный файл не скачивается.
+    """
+    stream, content_type = EXPORT_FORMATS[export_format]
+    nodes = NetworkNode.objects.all() if pks is None else NetworkNode.objects.filter(pk__in=pks)
+    job.report(0, nodes.count())
+
+    name = f'network-{job.pk}.{export_format}'
+    path = result_path(name)
+    os.makedirs(settings.JOBS_RESULT_DIR, exist_ok=True)
+    rows = 0
+    try:
+        with open(path + '.tmp', 'w', encoding='utf-8', newline='') as output:
+            chunks = stream(EXPORT_CHUNK_SIZE, pks)
+            if export_format == 'csv':
+                # Строка заголовка
+                output.write(next(chunks))
+            for chunk in chunks:
+                output.write(chunk)
+                rows += 1
+                if rows % EXPORT_CHUNK_SIZE == 0:
+                    job.report(rows)
+        os.replace(path + '.tmp', path)
+    except BaseException:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+        raise
+    job.report(rows)
+    return {'file': name, 'content_type': content_type, 'rows': rows}
+
+
+@task('networks.reconcile_debt', serializer_class=ReconcileJobSerializer, permission_classes=[IsAdminUser])
+def reconcile_debt(job, mode='check'):
+    """ Сверка задолженности с журналом (reconcile_debt) с исправлением задолженности или журнала """
+    job.report(0, NetworkNode.objects.count())
+    checked, mismatches = compare_balances(progress=job.report)
+    job.report(checked)
+    if mode == 'fix':
+        fix_balances(mismatches)
+    elif mode == 'adjust_ledger':
+        adjust_ledger(mismatches)
+    return {
+        'checked': checked,
+        'mismatches': len(mismatches),
+        'repaired': len(mismatches) if mode != 'check' else 0,
+        'sample': [[pk, f'{debt_amount:.2f}', f'{balance:.2f}'] for pk, debt_amount, balance in mismatches[:20]],
+    }
+
+
+@task('networks.rebuild_supply_chain', serializer_class=serializers.Serializer, permission_classes=[IsAdminUser])
+def rebuild_supply_chain(job):
+    """ Перестроение таблицы иерархии поставок (rebuild_supply_chain) """
+    with transaction.atomic():
+        SupplyLink.objects.rebuild()
+    return {'links': SupplyLink.objects.count()}
+
+
+@task('networks.reassign_supplier', serializer_class=SupplierReassignmentJobSerializer,
+      permission_classes=[IsAdminUser])
+def reassign_supplier(job, pks, supplier_id):
+    return run_operation(job, SupplierReassignment(pks, supplier_id))
+
+
+@task('networks.change_level', serializer_class=LevelChangeJobSerializer, permission_classes=[IsAdminUser])
+def change_level(job, pks, level):
+    return run_operation(job, LevelChange(pks, level))
+
+
+@task('networks.zero_out_debt', serializer_class=NodeSelectionJobSerializer, permission_classes=[IsAdminUser])
+def zero_out_debt(job, pks):
+    return run_operation(job, DebtReset(pks))
@@ -1,16 +1,69 @@
+import importlib
+import json
+import logging
+import tempfile
+import threading
+from base64 import urlsafe_b64encode
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.translation import gettext_lazy
 from rest_framework import status
+from rest_framework.exceptions import ParseError, ValidationError as APIValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
 from rest_framework.test import APITestCase, APIClient
-
-from networks.models import Product, Contacts, NetworkNode
-
-
-class NetworkNodeTestCase(APITestCase):
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from networks import fastjson
+from networks.admin_changelist import EstimatedCountPaginator
+from networks.cache import node_version_key
+from networks.backends.postgresql_pool.base import DatabaseWrapper as PooledDatabaseWrapper
+from networks.db_pool import ConnectionPool, PoolTimeout, get_pool, pools
+from networks.ledger import DebtPosting, MAX_DEBT
+from networks.managers import JobQuerySet
+from networks.jobs import TASKS, Task, enqueue, execute, requeue_stale, worker_name
+from networks.instrumentation import QueryBudgetExceeded, RequestMetrics, fingerprint
+from networks.models import Product, Contacts, NetworkNode, SupplyLink, DebtTransaction, Job, Location
+from networks.parsers import FastJSONParser
+from networks.renderers import FastJSONRenderer
+from networks.replicas import read_from_replica, use_primary
+from networks.representation import CompiledListSerializer
+from networks.serializers import NetworkNodeSerializer, ProductSerializer
+from networks.views import ProductViewSet
+
+
+class QueryBudgetTestMixin:
+    """ Тесты API падают с QueryBudgetExceeded, если представление превысило свой бюджет SQL-запросов """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(override_settings(NETWORKS_QUERY_BUDGET_STRICT=True))
+
+
+class NetworkNodeTestCase(QueryBudgetTestMixin, APITestCase):
     """ Тестирование модели узла сети """
 
     def setUp(self) -> None:
+        cache.clear()
         self.client = APIClient()
 
         # Создание и авторизация пользователей
@@ -131,6 +184,52 @@ class NetworkNodeTestCase(APITestCase):
         self.assertIn('Factory', network_names)
         self.assertIn('Retail', network_names)
 
+    def test_list_network_nodes_query_count(self):
+        """ Количество запросов при выводе списка не зависит от числа контактов у организаций """
+
+        for i in range(5):
+            contacts = Contacts.objects.create(email=f'shop{i}@retail.com', country='Russia', city='Kazan')
+            self.network_node1.contacts.add(contacts)
+            self.network_node2.contacts.add(contacts)
+
+        # COUNT для пагинации, выборка страницы и предзагрузка контактов
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('networks:networks-list-create'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results'][0]['contacts']), 6)
+        self.assertEqual(response.data['results'][0]['items_quantity'], 2)
+
+    def test_search_network_nodes(self):
+        """ Поиск по стране контактов: без повторов организаций при нескольких подходящих контактах """
+
+        self.network_node1.contacts.add(Contacts.objects.create(email='hr@factory.com', country='Russia', city='Tula'))
+        other = NetworkNode.objects.create(name='Other Factory', level=0)
+        other.contacts.add(Contacts.objects.create(email='info@other.com', country='Serbia', city='Belgrade'))
+
+        response = self.client.get(reverse('networks:networks-list-create'), {'search': 'uss'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([node['name'] for node in response.data['results']], ['Factory', 'Retail'])
+        self.assertEqual(response.data['results'][0]['items_quantity'], 2)
+
+    def test_read_network_node_query_count(self):
+        """ Количество запросов при просмотре организации не зависит от числа контактов и продуктов """
+
+        for i in range(5):
+            self.network_node1.contacts.add(
+                Contacts.objects.create(email=f'office{i}@factory.com', country='Russia', city='Tula')
+            )
+
+        # Выборка организации, предзагрузка контактов и продуктов
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('networks:network-detail', kwargs={'pk': self.network_node1.pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['contacts']), 6)
+        self.assertEqual(len(response.data['products']), 2)
+
     def test_delete_network_node(self):
         """ Тестирование удаления узла сети """
 
@@ -144,7 +243,7 @@ class NetworkNodeTestCase(APITestCase):
             NetworkNode.objects.get(id=self.network_node1.id)
 
 
-class ProductTestCase(APITestCase):
+class ProductTestCase(QueryBudgetTestMixin, APITestCase):
     """ Тестирование модели продукта """
 
     def setUp(self) -> None:
@@ -200,6 +299,23 @@ class ProductTestCase(APITestCase):
         self.assertIn('Product 1', product_names)
         self.assertIn('Product 2', product_names)
 
+    def test_list_products_query_count(self):
+        """ Количество каналов продаж и их названия выводятся без запросов на каждый продукт """
+
+        for i in range(3):
+            network_node = NetworkNode.objects.create(name=f'Factory {i}', level=0)
+            self.product1.sales_channel.add(network_node)
+            self.product2.sales_channel.add(network_node)
+
+        # COUNT для пагинации, выборка страницы и предзагрузка каналов продаж
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('networks:products-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for product in response.data['results']:
+            self.assertEqual(product['number_of_sales_channels'], 3)
+            self.assertEqual(len(product['sales_channel']), 3)
+
     def test_read_product(self):
         """ Тестирование просмотра продукта """
         response = self.client.get(reverse('networks:products-detail', kwargs={'pk': self.product2.id}))
@@ -221,7 +337,7 @@ class ProductTestCase(APITestCase):
             Product.objects.get(id=self.product1.id)
 
 
-class ContactsTestCase(APITestCase):
+class ContactsTestCase(QueryBudgetTestMixin, APITestCase):
     """ Тестирование модели контактов """
 
     def setUp(self) -> None:
@@ -295,3 +411,2093 @@ class ContactsTestCase(APITestCase):
 
         with self.assertRaises(Contacts.DoesNotExist):
             Contacts.objects.get(id=self.contacts1.id)
+
+
+class SupplyChainTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование иерархии поставок (таблица замыкания) """
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+        # Создание и авторизация пользователей
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        # Цепочка поставок: Factory -> Retail 1 -> ... -> Retail 5, а также второй завод
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.other_factory = NetworkNode.objects.create(name='Other Factory', level=0)
+        self.chain = [self.factory]
+        for i in range(1, 6):
+            self.chain.append(NetworkNode.objects.create(name=f'Retail {i}', supplier=self.chain[-1], level=1))
+
+    def links(self):
+        return set(SupplyLink.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_ancestors(self):
+        """ Вывод цепочки поставщиков от прямого поставщика к заводу """
+
+        url = reverse('networks:network-ancestors', kwargs={'pk': self.chain[-1].pk})
+        response = self.client.get(url, {'page_size': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        names = [node['name'] for node in response.data['results']]
+        self.assertEqual(names, ['Retail 4', 'Retail 3', 'Retail 2', 'Retail 1', 'Factory'])
+
+    def test_descendants(self):
+        """ Вывод всех клиентов организации на нижестоящих уровнях """
+
+        url = reverse('networks:network-descendants', kwargs={'pk': self.chain[2].pk})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [node['name'] for node in response.data['results']]
+        self.assertEqual(names, ['Retail 3', 'Retail 4', 'Retail 5'])
+
+    def test_hierarchy_cursor_order(self):
+        """ Пагинация по ключу сохраняет порядок иерархии по глубине """
+
+        NetworkNode.objects.create(name='Retail 3b', supplier=self.chain[2], level=1)
+
+        def names(url):
+            names = []
+            with mock.patch('networks.pagination.CustomPaginator.page_size', 2):
+                response = self.client.get(url, {'pagination': 'cursor'})
+                while True:
+                    names += [node['name'] for node in response.data['results']]
+                    if not response.data['next']:
+                        break
+                    response = self.client.get(response.data['next'])
+            return names
+
+        self.assertEqual(names(reverse('networks:network-ancestors', kwargs={'pk': self.chain[-1].pk})),
+                         ['Retail 4', 'Retail 3', 'Retail 2', 'Retail 1', 'Factory'])
+        self.assertEqual(names(reverse('networks:network-descendants', kwargs={'pk': self.chain[2].pk})),
+                         ['Retail 3', 'Retail 3b', 'Retail 4', 'Retail 5'])
+
+    def test_hierarchy_query_count(self):
+        """ Количество запросов не зависит от глубины цепочки """
+
+        # Проверка узла, COUNT для пагинации, выборка страницы и предзагрузка контактов
+        for pk in (self.chain[2].pk, self.chain[4].pk):
+            with self.assertNumQueries(4):
+                self.client.get(reverse('networks:network-ancestors', kwargs={'pk': pk}))
+            with self.assertNumQueries(4):
+                self.client.get(reverse('networks:network-descendants', kwargs={'pk': pk}))
+
+    def test_unknown_node(self):
+        """ Запрос иерархии несуществующего узла """
+
+        response = self.client.get(reverse('networks:network-ancestors', kwargs={'pk': 0}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_change_supplier(self):
+        """ Смена поставщика переносит всё поддерево клиентов """
+
+        self.chain[2].supplier = self.other_factory
+        self.chain[2].save()
+
+        self.assertEqual(list(self.chain[-1].get_ancestors().order_by('descendant_links__depth')),
+                         [self.chain[4], self.chain[3], self.chain[2], self.other_factory])
+        self.assertEqual(list(self.factory.get_descendants()), [self.chain[1]])
+
+        SupplyLink.objects.rebuild()
+        links = self.links()
+        self.chain[2].supplier = self.chain[1]
+        self.chain[2].save()
+        self.chain[2].supplier = self.other_factory
+        self.chain[2].save()
+        self.assertEqual(self.links(), links)
+
+    def test_delete_supplier(self):
+        """ Клиенты удалённой организации выходят из её цепочки поставок """
+
+        self.chain[2].delete()
+
+        self.assertEqual(list(self.chain[-1].get_ancestors()), [self.chain[3], self.chain[4]])
+        self.assertEqual(list(self.factory.get_descendants()), [self.chain[1]])
+
+    def test_rebuild(self):
+        """ Перестроение таблицы замыкания совпадает с поддерживаемым при сохранении состоянием """
+
+        links = self.links()
+        call_command('rebuild_supply_chain', stdout=StringIO())
+
+        self.assertEqual(self.links(), links)
+        self.assertEqual(len(links), 7 + sum(range(1, 6)))
+
+    def test_supplier_cycle(self):
+        """ Назначение поставщиком собственного клиента отклоняется: A -> B -> C -> A """
+
+        url = reverse('networks:network-detail', kwargs={'pk': self.chain[1].pk})
+        response = self.client.patch(url, data={'supplier': self.chain[-1].pk})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("An organisation cannot be supplied by its own client.", response.content.decode())
+
+        self.chain[1].supplier = self.chain[3]
+        with self.assertRaises(ValidationError):
+            self.chain[1].save()
+
+    def test_change_supplier_api(self):
+        """ Смена поставщика через API без образования цикла """
+
+        url = reverse('networks:network-detail', kwargs={'pk': self.chain[3].pk})
+        response = self.client.patch(url, data={'supplier': self.other_factory.pk})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['supplier'], self.other_factory.pk)
+        self.assertEqual(list(self.other_factory.get_descendants()), self.chain[3:])
+
+
+class NetworkNodeBulkTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование пакетного создания и обновления узлов сети """
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+        # Создание и авторизация пользователей
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        self.product = Product.objects.create(name='Product 1', model='M-1000', release_date='2020-09-05')
+        self.contacts = Contacts.objects.create(email='info@factory.com', country='Russia', city='Moscow')
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.url = reverse('networks:networks-bulk')
+
+    def links(self):
+        return set(SupplyLink.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def batch(self, size, prefix='Retail'):
+        """ Пакет: ретейлеры существующего завода и ИП, поставщики которых находятся в том же пакете """
+        items = []
+        for i in range(size):
+            items.append({'name': f'{prefix} {i}', 'level': 1, 'supplier': self.factory.pk,
+                          'contacts': [self.contacts.pk], 'products': [self.product.pk]})
+            items.append({'name': f'{prefix} {i} Consumer', 'level': 2, 'supplier_name': f'{prefix} {i}',
+                          'debt_amount': '10.50'})
+        return items
+
+    def test_bulk_create(self):
+        """ Создание пакета организаций с поставщиками из того же пакета """
+
+        response = self.client.post(self.url, data=self.batch(3), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'created': 6, 'updated': 0})
+
+        consumer = NetworkNode.objects.get(name='Retail 1 Consumer')
+        self.assertEqual(consumer.supplier.name, 'Retail 1')
+        self.assertEqual(str(consumer.debt_amount), '10.50')
+        self.assertEqual(list(consumer.supplier.contacts.all()), [self.contacts])
+        self.assertEqual(consumer.supplier.location, self.contacts.location)
+        self.assertIsNone(consumer.location)
+        self.assertEqual(list(consumer.get_ancestors().order_by('descendant_links__depth')),
+                         [consumer.supplier, self.factory])
+
+        links = self.links()
+        SupplyLink.objects.rebuild()
+        self.assertEqual(self.links(), links)
+
+    def test_bulk_create_ndjson(self):
+        """ Загрузка пакета потоком NDJSON """
+
+        body = '\n'.join(json.dumps(item) for item in self.batch(2)) + '\n'
+        response = self.client.post(self.url, data=body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'created': 4, 'updated': 0})
+
+    def test_bulk_query_count(self):
+        """ Количество запросов не зависит от размера пакета """
+
+        query_counts = []
+        for size, prefix in ((2, 'Small'), (20, 'Large')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, data=self.batch(size, prefix), format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_bulk_update(self):
+        """ Обновление существующих организаций: смена поставщика переносит поддерево клиентов """
+
+        self.client.post(self.url, data=self.batch(1), format='json')
+        other_factory = NetworkNode.objects.create(name='Other Factory', level=0)
+
+        data = [
+            {'name': 'Retail 0', 'supplier_name': 'Other Factory', 'products': []},
+            {'name': 'New Consumer', 'level': 2, 'supplier_name': 'Retail 0'},
+        ]
+        response = self.client.post(self.url, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'created': 1, 'updated': 1})
+
+        retail = NetworkNode.objects.get(name='Retail 0')
+        self.assertEqual(retail.supplier, other_factory)
+        self.assertFalse(retail.products.exists())
+        self.assertEqual(list(retail.contacts.all()), [self.contacts])
+        self.assertEqual({node.name for node in other_factory.get_descendants()},
+                         {'Retail 0', 'Retail 0 Consumer', 'New Consumer'})
+        self.assertFalse(self.factory.get_descendants().exists())
+        links = self.links()
+        SupplyLink.objects.rebuild()
+        self.assertEqual(self.links(), links)
+
+    def test_bulk_move_into_moved_subtree(self):
+        """ Перенос организации к клиенту другой организации, перенесённой раньше в том же пакете """
+
+        other_factory = NetworkNode.objects.create(name='Other Factory', level=0)
+        retail = NetworkNode.objects.create(name='Retail Z', level=1, supplier=self.factory)
+        consumer = NetworkNode.objects.create(name='Consumer Y', level=2, supplier=retail)
+        moved = NetworkNode.objects.create(name='Retail X', level=1, supplier=other_factory)
+        NetworkNode.objects.create(name='Consumer X', level=2, supplier=moved)
+
+        data = [
+            {'name': 'Retail Z', 'supplier': other_factory.pk},
+            {'name': 'Retail X', 'supplier': consumer.pk},
+        ]
+        response = self.client.post(self.url, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'created': 0, 'updated': 2})
+        self.assertEqual([node.name for node in moved.get_ancestors()], ['Other Factory', 'Retail Z', 'Consumer Y'])
+        self.assertFalse(self.factory.get_descendants().exists())
+        links = self.links()
+        SupplyLink.objects.rebuild()
+        self.assertEqual(self.links(), links)
+
+    def test_bulk_move_query_count(self):
+        """ Перенос организаций к другому поставщику: число запросов не зависит от числа перенесённых """
+
+        other_factory = NetworkNode.objects.create(name='Other Factory', level=0)
+        query_counts = []
+        for size, prefix in ((2, 'Small'), (20, 'Large')):
+            self.client.post(self.url, data=self.batch(size, prefix), format='json')
+            data = [{'name': f'{prefix} {i}', 'supplier': other_factory.pk} for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, data=data, format='json')
+            self.assertEqual(response.data, {'created': 0, 'updated': size})
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(other_factory.get_descendants().count(), 44)
+        self.assertFalse(self.factory.get_descendants().exists())
+        links = self.links()
+        SupplyLink.objects.rebuild()
+        self.assertEqual(self.links(), links)
+
+    def test_bulk_errors(self):
+        """ Ошибки возвращаются по каждой записи, пакет с ошибками не записывается """
+
+        data = [
+            {'name': 'Retail A', 'level': 1},
+            {'name': 'Factory B', 'level': 0, 'debt_amount': '1.00'},
+            {'name': 'Retail C', 'level': 1, 'supplier': self.factory.pk, 'contacts': [0]},
+            {'name': 'Retail C', 'level': 1, 'supplier': self.factory.pk},
+            {'name': 'Factory', 'debt_amount': '5.00'},
+            {'name': 'Retail D', 'level': 1, 'supplier': self.factory.pk},
+            {'level': 1},
+        ]
+        response = self.client.post(self.url, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['index'] for error in response.data['errors']], [6])
+
+        response = self.client.post(self.url, data=data[:-1], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = {error['index']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(set(errors), {0, 1, 2, 3, 4})
+        self.assertIn('Retail or Consumer must have a supplier.', errors[0]['non_field_errors'])
+        self.assertIn('The factory cannot be in debt as it has no supplier.', errors[1]['non_field_errors'])
+        self.assertIn('contacts', errors[2])
+        self.assertIn('name', errors[3])
+        self.assertIn('debt_amount', errors[4])
+        self.assertFalse(NetworkNode.objects.filter(name='Retail D').exists())
+
+    def test_bulk_cycle(self):
+        """ Цикл внутри пакета и через существующие организации отклоняется """
+
+        self.client.post(self.url, data=self.batch(1), format='json')
+
+        data = [
+            {'name': 'Retail 0', 'supplier_name': 'Retail X'},
+            {'name': 'Retail X', 'level': 1, 'supplier_name': 'Retail 0 Consumer'},
+        ]
+        response = self.client.post(self.url, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = {error['index']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(errors[0]['supplier'], ['An organisation cannot be supplied by its own client.'])
+        self.assertEqual(errors[1]['supplier'], ['An organisation cannot be supplied by its own client.'])
+
+
+class NetworkExportTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование потоковой выгрузки сети """
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+        # Создание и авторизация пользователей
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        self.product = Product.objects.create(name='Product 1', model='M-1000', release_date='2020-09-05')
+        self.contacts = Contacts.objects.create(email='info@factory.com', country='Russia', city='Moscow')
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.factory.contacts.add(self.contacts)
+        self.factory.products.add(self.product)
+        for i in range(4):
+            NetworkNode.objects.create(name=f'Retail {i}', level=1, supplier=self.factory, debt_amount='1.50')
+        self.url = reverse('networks:networks-export')
+
+    def test_export_ndjson(self):
+        """ Выгрузка в формате NDJSON """
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['contacts'][0]['email'], 'info@factory.com')
+        self.assertEqual(rows[0]['products'][0]['name'], 'Product 1')
+        self.assertEqual(rows[1]['supplier'], self.factory.pk)
+        self.assertEqual(rows[1]['debt_amount'], '1.50')
+
+    def test_export_csv(self):
+        """ Выгрузка в формате CSV """
+
+        response = self.client.get(self.url, {'export_format': 'csv'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,level,supplier,debt_amount,creation_time,contacts,products')
+        self.assertEqual(len(lines), 6)
+        self.assertIn('info@factory.com', lines[1])
+
+    def test_export_unknown_format(self):
+        """ Неизвестный формат выгрузки """
+
+        response = self.client.get(self.url, {'export_format': 'xml'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_command(self):
+        """ Выгрузка командой с чтением из базы данных частями """
+
+        output = StringIO()
+        call_command('export_network', chunk_size=2, stdout=output)
+
+        self.assertEqual(len(output.getvalue().splitlines()), 5)
+
+
+class KeysetPaginationTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование пагинации по ключу """
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+        # Создание и авторизация пользователей
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        # Продукты с повторяющимися названиями: ключ пагинации (name, pk)
+        Product.objects.bulk_create(
+            [Product(name=f'Product {i % 7}', model=f'M-{i}') for i in range(25)]
+        )
+        self.url = reverse('networks:products-list')
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([product['id'] for product in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_forward_and_backward(self):
+        """ Обход всех страниц вперёд и назад без пропусков и повторов """
+
+        expected = list(Product.objects.order_by('name', 'pk').values_list('pk', flat=True))
+
+        pages = self.walk(f'{self.url}?pagination=cursor', 'next')
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), expected)
+
+        response = self.client.get(f'{self.url}?pagination=cursor')
+        response = self.client.get(response.data['next'])
+        response = self.client.get(response.data['next'])
+        backward = self.walk(response.data['previous'], 'previous')
+        self.assertEqual(sum(reversed(backward), []), expected[:20])
+
+    def test_no_count_query(self):
+        """ Страница выбирается без COUNT(*) и OFFSET """
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'pagination': 'cursor'})
+
+        self.assertNotIn('count', response.data)
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('COUNT(*)', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_stable_pages_on_insert(self):
+        """ Добавление записей перед текущей позицией не сдвигает следующую страницу """
+
+        first = self.client.get(self.url, {'pagination': 'cursor'})
+        Product.objects.create(name='Product 0', model='M-new')
+        second = self.client.get(first.data['next'])
+
+        expected = list(Product.objects.order_by('name', 'pk').values_list('pk', flat=True))
+        start = expected.index(first.data['results'][-1]['id']) + 1
+        self.assertEqual([product['id'] for product in second.data['results']], expected[start:start + 10])
+
+    def test_network_nodes(self):
+        """ Пагинация по ключу для списка организаций """
+
+        NetworkNode.objects.bulk_create([NetworkNode(name=f'Factory {i}', level=0) for i in range(12)])
+
+        pages = self.walk(f"{reverse('networks:networks-list-create')}?pagination=cursor", 'next')
+
+        self.assertEqual(sum(pages, []), list(NetworkNode.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_invalid_cursor(self):
+        """ Повреждённый курсор """
+
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_wrong_types(self):
+        """ Курсор с позицией неверного типа - 404, а не ошибка сервера """
+
+        def cursor(position):
+            return urlsafe_b64encode(json.dumps({'p': position, 'r': 0}).encode()).decode('ascii')
+
+        urls = {
+            self.url: ['Product 1', 'abc'],
+            reverse('networks:networks-list-create'): ['Factory', {'a': 1}],
+            reverse('networks:jobs-list'): ['abc'],
+            reverse('networks:networks-debt-transactions'): [{'a': 1}],
+        }
+        for url, position in urls.items():
+            for wrong in (position, [None] * len(position)):
+                with self.subTest(url=url, position=wrong):
+                    response = self.client.get(url, {'cursor': cursor(wrong)})
+                    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_compatibility(self):
+        """ Пагинация по номеру страницы (параметр page_size) работает как прежде """
+
+        response = self.client.get(self.url, {'page_size': 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class NetworkNodeCacheTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование кэша ответов API узлов сети """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+
+        # Создание и авторизация пользователей
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        self.product = Product.objects.create(name='Product 1', model='M-1000', release_date='2020-09-05')
+        self.contacts = Contacts.objects.create(email='info@factory.com', country='Russia', city='Moscow')
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.factory.contacts.add(self.contacts)
+        self.factory.products.add(self.product)
+        self.retail = NetworkNode.objects.create(name='Retail', level=1, supplier=self.factory)
+
+        self.list_url = reverse('networks:networks-list-create')
+        self.detail_url = reverse('networks:network-detail', kwargs={'pk': self.factory.pk})
+
+    def test_cached_responses(self):
+        """ Повторный запрос списка и карточки обслуживается из кэша без запросов к базе данных """
+
+        for url in (self.list_url, self.detail_url):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.data, second.data)
+            self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_etag(self):
+        """ Совпадение If-None-Match возвращает 304 без тела """
+
+        etag = self.client.get(self.detail_url)['ETag']
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.detail_url, data={'name': 'Best Factory'})
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Best Factory')
+
+    def test_invalidation(self):
+        """ Изменения организаций, контактов и продуктов сбрасывают только затронутые записи кэша """
+
+        retail_url = reverse('networks:network-detail', kwargs={'pk': self.retail.pk})
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        self.client.get(retail_url)
+
+        self.contacts.city = 'Tula'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.contacts.save()
+        self.assertEqual(self.client.get(self.detail_url).data['contacts'][0]['city'], 'Tula')
+        self.assertIn('Tula', self.client.get(self.list_url).data['results'][0]['contacts'][0]['address'])
+        with self.assertNumQueries(0):
+            self.client.get(retail_url)
+
+        self.product.name = 'Product X'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get(self.detail_url).data['products'][0]['name'], 'Product X')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.retail.products.add(self.product)
+        self.assertEqual(self.client.get(self.list_url).data['results'][1]['items_quantity'], 1)
+        self.assertEqual(len(self.client.get(retail_url).data['products']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.client.get(retail_url).data['products'], [])
+
+    def test_invalidation_on_commit(self):
+        """ Версии кэша изменяются только после фиксации транзакции, изменившей организацию """
+
+        self.client.get(self.detail_url)
+        version = cache.get(node_version_key(self.factory.pk))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                self.factory.name = 'Best Factory'
+                self.factory.save()
+                self.contacts.save()
+                self.product.save()
+            # Запрос до фиксации читает прежнюю версию и сохраняет ответ под ней
+            self.assertEqual(cache.get(node_version_key(self.factory.pk)), version)
+
+        self.assertEqual(len(callbacks), 3)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(node_version_key(self.factory.pk)), version)
+        self.assertEqual(self.client.get(self.detail_url).data['name'], 'Best Factory')
+
+
+class GenerateNetworkTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование генератора синтетической сети """
+
+    def test_generate_network(self):
+        """ Генерация сети пакетами с согласованной таблицей замыкания """
+
+        call_command('generate_network', factories=2, retailers=5, consumers=12, products=4, batch_size=5,
+                     stdout=StringIO())
+
+        self.assertEqual(NetworkNode.objects.filter(level=0, supplier__isnull=True).count(), 2)
+        self.assertEqual(NetworkNode.objects.filter(level=1, supplier__level=0).count(), 5)
+        self.assertEqual(NetworkNode.objects.filter(level=2, supplier__level=1).count(), 12)
+        self.assertEqual(Contacts.objects.count(), 19)
+        self.assertEqual(NetworkNode.products.through.objects.count(), 19 * 3)
+
+        links = set(SupplyLink.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        SupplyLink.objects.rebuild()
+        self.assertEqual(set(SupplyLink.objects.values_list('ancestor_id', 'descendant_id', 'depth')), links)
+
+
+class QueryInstrumentationTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование метрик запросов к API и бюджетов SQL-запросов """
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        for i in range(3):
+            product = Product.objects.create(name=f'Product {i}', model=f'M-{i}')
+            product.sales_channel.add(self.factory)
+
+    def test_server_timing(self):
+        """ Тестирование заголовка Server-Timing """
+
+        response = self.client.get(reverse('networks:products-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'desc="{response.wsgi_request.query_metrics.queries} queries"', timing)
+        self.assertIn('dup;desc="0 duplicated queries"', timing)
+        self.assertIn('ser;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_query_budget_exceeded(self):
+        """ Тестирование падения теста при превышении бюджета и поиска повторяющихся запросов (N+1) """
+
+        # Без предзагрузки каналы продаж запрашиваются для каждого товара
+        with mock.patch.object(ProductViewSet, 'queryset', Product.objects.order_by('name')):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'budget is 4'):
+                self.client.get(reverse('networks:products-list'))
+
+            with self.settings(NETWORKS_QUERY_BUDGET_STRICT=False):
+                with self.assertLogs('networks.instrumentation', 'WARNING') as logs:
+                    response = self.client.get(reverse('networks:products-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('dup;desc="2 duplicated queries"', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'networks.views.ProductViewSet')
+        self.assertEqual(record['query_budget'], 4)
+        self.assertEqual([item['count'] for item in record['duplicates']], [3])
+
+    def test_log_record_built_only_when_emitted(self):
+        """ Запись лога не строится, если уровень INFO отключён и бюджет не превышен """
+
+        url = reverse('networks:products-list')
+        with mock.patch.object(RequestMetrics, 'as_log', autospec=True, side_effect=RequestMetrics.as_log) as as_log:
+            with mock.patch.object(logging.getLogger('networks.instrumentation'), 'level', logging.WARNING):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+            as_log.assert_not_called()
+
+            with self.assertLogs('networks.instrumentation', 'INFO'):
+                self.client.get(url)
+            as_log.assert_called_once()
+
+    def test_fingerprint(self):
+        """ Тестирование отпечатка запроса без значений """
+
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a IN (%s, %s, %s) AND b = 'x' LIMIT 21"),
+            fingerprint("SELECT * FROM t WHERE a IN (%s) AND b = 'y' LIMIT 10"),
+        )
+
+
+class DebtAnalyticsTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование аналитики задолженности """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        self.factory1 = NetworkNode.objects.create(name='Factory 1', level=0)
+        self.factory2 = NetworkNode.objects.create(name='Factory 2', level=0)
+        self.retailer1 = NetworkNode.objects.create(name='Retail 1', level=1, supplier=self.factory1,
+                                                    debt_amount='100.00')
+        self.retailer2 = NetworkNode.objects.create(name='Retail 2', level=1, supplier=self.factory2,
+                                                    debt_amount='30.00')
+        self.consumer = NetworkNode.objects.create(name='Consumer', level=2, supplier=self.retailer1,
+                                                   debt_amount='50.50')
+
+        # Два контакта в одной стране не удваивают задолженность организации
+        self.retailer1.contacts.add(
+            Contacts.objects.create(email='a@retail.com', country='Russia', city='Moscow'),
+            Contacts.objects.create(email='b@retail.com', country='Russia', city='Kazan'),
+        )
+        self.consumer.contacts.add(Contacts.objects.create(email='c@consumer.com', country='Serbia', city='Nis'))
+
+    def test_debt_analytics(self):
+        """ Тестирование сводок по уровням, странам и заводам """
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('networks:networks-debt-analytics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['nodes'], 5)
+        self.assertEqual(response.data['total_debt'], '180.50')
+        self.assertEqual(
+            [(row['level'], row['nodes'], row['total_debt']) for row in response.data['by_level']],
+            [(0, 2, '0.00'), (1, 2, '130.00'), (2, 1, '50.50')],
+        )
+        self.assertEqual(
+            [(row['country'], row['nodes'], row['total_debt']) for row in response.data['by_country']],
+            [('Russia', 1, '100.00'), ('Serbia', 1, '50.50'), (None, 3, '30.00')],
+        )
+        self.assertEqual(
+            [(row['factory_name'], row['nodes'], row['total_debt']) for row in response.data['by_factory']],
+            [('Factory 1', 2, '150.50'), ('Factory 2', 1, '30.00')],
+        )
+
+    def test_debt_analytics_creation_time(self):
+        """ Тестирование ограничения организаций временем создания """
+
+        NetworkNode.objects.filter(pk=self.consumer.pk).update(creation_time='2020-01-01T00:00:00Z')
+
+        response = self.client.get(reverse('networks:networks-debt-analytics'), {'created_after': '2021-01-01'})
+        self.assertEqual(response.data['total_debt'], '130.00')
+        self.assertEqual([row['total_debt'] for row in response.data['by_factory']], ['100.00', '30.00'])
+
+        response = self.client.get(reverse('networks:networks-debt-analytics'), {'created_before': '2021-01-01'})
+        self.assertEqual(response.data['nodes'], 1)
+        self.assertEqual(response.data['total_debt'], '50.50')
+
+        response = self.client.get(reverse('networks:networks-debt-analytics'), {'created_after': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_debt_analytics_cache(self):
+        """ Тестирование кэширования аналитики и сброса при изменении организаций """
+
+        self.client.get(reverse('networks:networks-debt-analytics'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('networks:networks-debt-analytics'))
+        self.assertEqual(response.data['total_debt'], '180.50')
+
+        self.consumer.debt_amount = '0.50'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.consumer.save()
+        response = self.client.get(reverse('networks:networks-debt-analytics'))
+        self.assertEqual(response.data['total_debt'], '130.50')
+
+
+class DebtLedgerTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование журнала задолженности """
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.retailer = NetworkNode.objects.create(name='Retail', level=1, supplier=self.factory,
+                                                   debt_amount='10.00')
+        self.consumer = NetworkNode.objects.create(name='Consumer', level=2, supplier=self.retailer)
+
+    def test_opening_balance(self):
+        """ Тестирование проводки начальной задолженности при создании организации """
+
+        self.assertEqual(
+            list(DebtTransaction.objects.values_list('network_node', 'amount', 'comment')),
+            [(self.retailer.pk, Decimal('10.00'), 'Opening balance')],
+        )
+
+    def test_post_transactions(self):
+        """ Тестирование пакетной проводки """
+
+        data = [
+            {'network_node': self.retailer.pk, 'amount': '100.00', 'comment': 'Invoice 1'},
+            {'network_node': self.retailer.pk, 'amount': '-40.50', 'comment': 'Payment'},
+            {'network_node': self.consumer.pk, 'amount': '7.25'},
+        ]
+        response = self.client.post(reverse('networks:networks-debt-transactions'), data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'posted': 3, 'nodes': 2})
+        self.retailer.refresh_from_db()
+        self.consumer.refresh_from_db()
+        self.assertEqual(self.retailer.debt_amount, Decimal('69.50'))
+        self.assertEqual(self.consumer.debt_amount, Decimal('7.25'))
+
+        response = self.client.get(reverse('networks:networks-debt-transactions'),
+                                   {'network_node': self.retailer.pk})
+        self.assertEqual([item['amount'] for item in response.data['results']], ['10.00', '100.00', '-40.50'])
+
+    def test_list_transactions_invalid_filter(self):
+        """ Нечисловой id организации в фильтре журнала - ошибка 400 """
+
+        response = self.client.get(reverse('networks:networks-debt-transactions'), {'network_node': 'abc'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('network_node', response.data)
+
+    def test_post_transactions_errors(self):
+        """ Тестирование проверки пакета: пакет с ошибками не записывается """
+
+        data = [
+            {'network_node': self.retailer.pk, 'amount': '5.00'},
+            {'network_node': self.factory.pk, 'amount': '5.00'},
+            {'network_node': 0, 'amount': '5.00'},
+            {'network_node': self.consumer.pk, 'amount': '0.00'},
+            {'network_node': self.retailer.pk, 'amount': '99999999.99'},
+        ]
+        response = self.client.post(reverse('networks:networks-debt-transactions'), data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = {item['index']: item['errors'] for item in response.data['errors']}
+        self.assertEqual(sorted(errors), [0, 1, 2, 3, 4])
+        # Итоговая задолженность организации превышает допустимую
+        self.assertIn('amount', errors[0])
+        self.assertIn('network_node', errors[1])
+        self.assertIn('network_node', errors[2])
+        self.assertIn('amount', errors[3])
+        self.assertIn('amount', errors[4])
+        self.assertEqual(DebtTransaction.objects.count(), 1)
+        self.retailer.refresh_from_db()
+        self.assertEqual(self.retailer.debt_amount, Decimal('10.00'))
+
+    def test_posting_rechecked_under_lock(self):
+        """ Изменения после проверки пакета (параллельная проводка, смена уровня) проверяются перед записью """
+
+        posting = DebtPosting([{'network_node': self.retailer.pk, 'amount': MAX_DEBT - Decimal('20.00')}])
+        self.assertTrue(posting.is_valid())
+        DebtPosting([{'network_node': self.retailer.pk, 'amount': Decimal('15.00')}]).save()
+        with self.assertRaises(APIValidationError) as error:
+            posting.save()
+        self.assertIn('amount', error.exception.detail['errors'][0]['errors'])
+
+        posting = DebtPosting([{'network_node': self.consumer.pk, 'amount': Decimal('5.00')}])
+        self.assertTrue(posting.is_valid())
+        NetworkNode.objects.filter(pk=self.consumer.pk).update(level=0)
+        with self.assertRaises(APIValidationError) as error:
+            posting.save()
+        self.assertIn('network_node', error.exception.detail['errors'][0]['errors'])
+
+        self.retailer.refresh_from_db()
+        self.consumer.refresh_from_db()
+        self.assertEqual(self.retailer.debt_amount, Decimal('25.00'))
+        self.assertEqual(self.consumer.debt_amount, Decimal('0.00'))
+        self.assertEqual(DebtTransaction.objects.count(), 2)
+
+    def test_transactions_are_append_only(self):
+        """ Тестирование запрета изменения проводок """
+
+        transaction = DebtTransaction.objects.get()
+        transaction.amount = '1.00'
+        with self.assertRaises(ValidationError):
+            transaction.save()
+
+    def test_admin_zero_out_debt(self):
+        """ Тестирование обнуления задолженности в админ-панели проводками журнала """
+
+        admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:networks_networknode_changelist'), {
+            'action': 'zero_out_debt',
+            '_selected_action': [self.retailer.pk, self.consumer.pk],
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.retailer.refresh_from_db()
+        self.assertEqual(self.retailer.debt_amount, Decimal('0.00'))
+        self.assertEqual(
+            list(DebtTransaction.objects.filter(network_node=self.retailer).values_list('amount', flat=True)),
+            [Decimal('10.00'), Decimal('-10.00')],
+        )
+        self.assertEqual(DebtTransaction.objects.filter(network_node=self.consumer).count(), 0)
+
+    def test_reconcile_debt(self):
+        """ Тестирование сверки задолженности с журналом """
+
+        NetworkNode.objects.filter(pk=self.retailer.pk).update(debt_amount='12.00')
+        NetworkNode.objects.filter(pk=self.consumer.pk).update(debt_amount='3.00')
+
+        out = StringIO()
+        call_command('reconcile_debt', stdout=out)
+        self.assertIn('mismatches: 2', out.getvalue())
+
+        call_command('reconcile_debt', '--fix', stdout=StringIO())
+        self.assertEqual(
+            dict(NetworkNode.objects.values_list('pk', 'debt_amount')),
+            {self.factory.pk: Decimal('0.00'), self.retailer.pk: Decimal('10.00'), self.consumer.pk: Decimal('0.00')},
+        )
+
+        NetworkNode.objects.filter(pk=self.consumer.pk).update(debt_amount='3.00')
+        call_command('reconcile_debt', '--adjust-ledger', stdout=StringIO())
+        self.assertEqual(dict(DebtTransaction.objects.balances()),
+                         {self.retailer.pk: Decimal('10.00'), self.consumer.pk: Decimal('3.00')})
+
+        out = StringIO()
+        call_command('reconcile_debt', stdout=out)
+        self.assertIn('Checked 3 network nodes, mismatches: 0', out.getvalue())
+
+
+class AsyncReadViewsTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование асинхронных эндпоинтов чтения: ответы совпадают с синхронными """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        product = Product.objects.create(name='Product', model='M-1')
+        product.sales_channel.add(self.factory)
+        for i in range(12):
+            node = NetworkNode.objects.create(name=f'Retail {i}', level=1, supplier=self.factory)
+            node.contacts.add(Contacts.objects.create(email=f'info{i}@retail.com',
+                                                      country='Serbia' if i % 2 else 'Russia',
+                                                      city='City', street='Street', building=i + 1))
+            node.products.add(product)
+
+    def assertSameResponse(self, sync_url, async_url):
+        sync_response = self.client.get(sync_url)
+        async_response = self.client.get(async_url)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content.replace(b'/async/', b'/'), sync_response.content)
+        return async_response
+
+    def test_same_responses(self):
+        """ Тестирование совпадения ответов списков, страниц, поиска и карточек """
+
+        node = NetworkNode.objects.get(name='Retail 3')
+        product = Product.objects.get()
+        contacts = Contacts.objects.first()
+        networks, async_networks = reverse('networks:networks-list-create'), reverse('networks:async-networks-list')
+        pairs = [
+            (networks, async_networks),
+            (networks + '?page_size=2', async_networks + '?page_size=2'),
+            (networks + '?page_size=9', async_networks + '?page_size=9'),
+            (networks + '?search=serb', async_networks + '?search=serb'),
+            (reverse('networks:network-detail', kwargs={'pk': node.pk}),
+             reverse('networks:async-network-detail', kwargs={'pk': node.pk})),
+            (reverse('networks:network-detail', kwargs={'pk': 0}),
+             reverse('networks:async-network-detail', kwargs={'pk': 0})),
+            (reverse('networks:products-list'), reverse('networks:async-products-list')),
+            (reverse('networks:products-detail', kwargs={'pk': product.pk}),
+             reverse('networks:async-products-detail', kwargs={'pk': product.pk})),
+            (reverse('networks:contacts-list') + '?page_size=2',
+             reverse('networks:async-contacts-list') + '?page_size=2'),
+            (reverse('networks:contacts-detail', kwargs={'pk': contacts.pk}),
+             reverse('networks:async-contacts-detail', kwargs={'pk': contacts.pk})),
+        ]
+        for sync_url, async_url in pairs:
+            with self.subTest(async_url):
+                self.assertSameResponse(sync_url, async_url)
+
+    def test_authentication(self):
+        """ Тестирование доступа без токена и с неактивным пользователем """
+
+        self.client.credentials()
+        response = self.assertSameResponse(reverse('networks:networks-list-create'),
+                                           reverse('networks:async-networks-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('WWW-Authenticate', response)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.user.is_active = False
+        self.user.save()
+        response = self.assertSameResponse(reverse('networks:products-list'), reverse('networks:async-products-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_asgi_request(self):
+        """ Тестирование запроса через ASGI: асинхронная цепочка middleware учитывает SQL-запросы """
+
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.user).access_token))()
+        response = await self.async_client.get(reverse('networks:async-networks-list'),
+                                               headers={'Authorization': f'Bearer {token}'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 13)
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+
+
+class CompiledListSerializerTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование быстрого пути сериализации списков: JSON совпадает с обычной сериализацией DRF """
+
+    def setUp(self) -> None:
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.retailer = NetworkNode.objects.create(name='Retail "Ёлка"', level=1, supplier=self.factory,
+                                                   debt_amount='1234.5')
+        self.retailer.contacts.add(
+            Contacts.objects.create(email='info@retail.com', country='Russia', city='Moscow'),
+            Contacts.objects.create(email='sales@retail.com', country='Serbia', city='Nis', street='Main',
+                                    building=12, department='Sales'),
+        )
+        product = Product.objects.create(name='Product', model='M-1', release_date='2020-09-05')
+        product.sales_channel.add(self.factory, self.retailer)
+        self.retailer.products.add(product)
+        Product.objects.create(name='Product 2', model='M-2')
+
+    def assertSameJSON(self, serializer_class, objects):
+        compiled = serializer_class(objects, many=True)
+        self.assertIsInstance(compiled, CompiledListSerializer)
+        regular = ListSerializer(child=serializer_class(), instance=objects)
+        self.assertEqual(JSONRenderer().render(compiled.data), JSONRenderer().render(regular.data))
+
+    def test_network_nodes(self):
+        """ Тестирование списка узлов сети: вложенные контакты, Decimal, поставщик и уровень """
+
+        self.assertSameJSON(NetworkNodeSerializer, list(NetworkNode.objects.for_list()))
+        # Количество продуктов хранится в строке и не зависит от предзагрузки
+        self.assertSameJSON(NetworkNodeSerializer, list(NetworkNode.objects.all()))
+
+    def test_products(self):
+        """ Тестирование списка продуктов: каналы продаж, количество каналов и даты """
+
+        self.assertSameJSON(ProductSerializer, list(Product.objects.for_list()))
+        self.assertSameJSON(ProductSerializer, list(Product.objects.all()))
+
+
+class FastJSONTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование рендерера и парсера JSON на orjson: результат совпадает с JSONRenderer и JSONParser DRF """
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+        # Создание и авторизация пользователей
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def backends(self):
+        """ Проверка с orjson и с запасным вариантом на стандартной библиотеке json """
+        for backend in (fastjson.orjson, None):
+            with self.subTest(orjson=backend is not None), mock.patch.object(fastjson, 'orjson', backend):
+                yield
+
+    def parse(self, content, parser=None, encoding='utf-8'):
+        return (parser or FastJSONParser()).parse(BytesIO(content), parser_context={'encoding': encoding})
+
+    def test_render_types(self):
+        """ Decimal, даты и время, ленивые строки, UUID, не ASCII, U+2028, ключи не строки, длинные целые """
+        data = ReturnDict([
+            ('debt', Decimal('1234.50')),
+            ('created', datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)),
+            ('naive', datetime(2024, 5, 1, 12, 30)),
+            ('date', date(2020, 9, 5)),
+            ('time', time(8, 15, 30, 500)),
+            ('duration', timedelta(hours=1, microseconds=5)),
+            ('lazy', gettext_lazy('This field is required.')),
+            ('uuid', UUID('12345678-1234-5678-1234-567812345678')),
+            ('name', 'Розница "Ёлка" \u2028\u2029 <b>'),
+            ('by_level', {0: '10.00', 1: None}),
+            ('big', 2 ** 70),
+            ('flags', [True, False, None, 0, -1.5]),
+            ('nested', ReturnList([{'contacts': ()}], serializer=None)),
+        ], serializer=None)
+
+        expected = JSONRenderer().render(data)
+        for _ in self.backends():
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+            self.assertEqual(fastjson.loads(FastJSONRenderer().render(data).decode()), json.loads(expected))
+
+    def test_render_fallback_to_drf(self):
+        """ Отступы и пустой ответ - как у JSONRenderer DRF """
+        data = {'name': 'Ёлка', 'items': [1, 2]}
+
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=4'),
+                         JSONRenderer().render(data, 'application/json; indent=4'))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_api_responses(self):
+        """ Ответы API рендерятся быстрым рендерером и совпадают с выводом JSONRenderer DRF """
+        factory = NetworkNode.objects.create(name='Factory', level=0)
+        retailer = NetworkNode.objects.create(name='Ёлка', level=1, supplier=factory, debt_amount='99.99')
+        retailer.contacts.add(Contacts.objects.create(email='info@retail.com', country='Россия', city='Москва'))
+        Product.objects.create(name='Product', model='M-1', release_date='2020-09-05')
+
+        for url in (reverse('networks:networks-list-create'), reverse('networks:network-detail', args=[retailer.pk]),
+                    reverse('networks:products-list'), reverse('networks:networks-debt-analytics')):
+            response = self.client.get(url)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+            self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_parse(self):
+        """ Разбор совпадает с JSONParser DRF, в том числе для других кодировок """
+        contents = [
+            ('{"name": "Ёлка", "debt_amount": "10.50", "level": 1, "supplier": null}'.encode(), 'utf-8'),
+            (b'[1.5, 9223372036854775807, -1e+16, true, "\\u0451"]', 'utf-8'),
+            ('{"city": "Zürich"}'.encode('latin-1'), 'latin-1'),
+        ]
+        for content, encoding in contents:
+            expected = self.parse(content, JSONParser(), encoding)
+            for _ in self.backends():
+                self.assertEqual(self.parse(content, encoding=encoding), expected)
+
+    def test_parse_errors(self):
+        """ Ошибки разбора, NaN и неверная кодировка - ParseError """
+        for content in (b'{"name": ', b'[NaN]', b'{"a": Infinity}', b'\xff\xfe', b''):
+            for _ in self.backends():
+                with self.assertRaises(ParseError):
+                    self.parse(content)
+
+    def test_parse_api_error(self):
+        """ Неверный JSON в запросе API - ответ 400 с сообщением JSON parse error """
+        response = self.client.post(reverse('networks:products-list'), data=b'{"name": ',
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(response.data['detail'].startswith('JSON parse error'))
+
+
+class AdminActionsTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование действий админ-панели над множествами организаций """
+
+    def setUp(self) -> None:
+        self.admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:networks_networknode_changelist')
+
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.other_factory = NetworkNode.objects.create(name='Other Factory', level=0)
+        self.retailers = [
+            NetworkNode.objects.create(name=f'Retail {i}', level=1, supplier=self.factory) for i in range(3)
+        ]
+        self.consumer = NetworkNode.objects.create(name='Consumer', level=2, supplier=self.retailers[0],
+                                                   debt_amount='5.00')
+
+    def links(self):
+        return set(SupplyLink.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def assertLinksConsistent(self):
+        """ Таблица замыкания совпадает с полным перестроением по полю supplier """
+        links = self.links()
+        SupplyLink.objects.rebuild()
+        self.assertEqual(links, self.links())
+
+    def post_action(self, action, nodes, **data):
+        # Сообщения предыдущего действия не были выведены на странице списка
+        self.client.cookies.pop('messages', None)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {
+                'action': action,
+                '_selected_action': [node.pk for node in nodes],
+                **data,
+            })
+
+    def messages(self, response):
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_parameters_page(self):
+        """ Без параметров действие выводит промежуточную страницу с формой и выбором """
+
+        response = self.client.post(self.url, {'action': 'reassign_supplier', 'select_across': '1',
+                                               '_selected_action': [self.retailers[0].pk]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTemplateUsed(response, 'admin/action_form.html')
+        self.assertContains(response, 'name="select_across" value="1"')
+        self.assertContains(response, f'Selected Network Nodes: {NetworkNode.objects.count()}.')
+
+    def test_reassign_supplier(self):
+        """ Перенос организаций со всеми клиентами к другому поставщику """
+
+        response = self.post_action('reassign_supplier', self.retailers[:2], supplier=self.other_factory.pk,
+                                    apply='Apply')
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(self.messages(response), ['Supplier reassigned: 2 objects updated.'])
+        self.assertEqual(
+            set(NetworkNode.objects.filter(supplier=self.other_factory).values_list('name', flat=True)),
+            {'Retail 0', 'Retail 1'},
+        )
+        self.assertIn((self.other_factory.pk, self.consumer.pk, 2), self.links())
+        self.assertLinksConsistent()
+
+    def test_reassign_nested_selection(self):
+        """ Организация и её клиент из одной выборки переносятся к поставщику напрямую """
+
+        self.post_action('reassign_supplier', [self.retailers[0], self.consumer], supplier=self.retailers[1].pk,
+                         apply='Apply')
+
+        self.consumer.refresh_from_db()
+        self.assertEqual(self.consumer.supplier, self.retailers[1])
+        self.assertLinksConsistent()
+
+    def test_reassign_validation(self):
+        """ Поставщик-клиент и заводы в выборке отклоняются без изменений """
+
+        links = self.links()
+        response = self.post_action('reassign_supplier', [self.factory, self.retailers[0]],
+                                    supplier=self.consumer.pk, apply='Apply')
+
+        self.assertEqual(self.messages(response), [
+            'Factory cannot have a supplier.',
+            'An organisation cannot be supplied by its own client.',
+        ])
+        self.assertEqual(links, self.links())
+        self.assertEqual(NetworkNode.objects.filter(supplier=self.consumer).count(), 0)
+
+    def test_change_level(self):
+        """ Изменение уровня с проверкой правил уровней для всей выборки """
+
+        response = self.post_action('change_level', self.retailers, level=2, apply='Apply')
+
+        self.assertEqual(self.messages(response), ['Level changed: 3 objects updated.'])
+        self.assertEqual(NetworkNode.objects.filter(level=2).count(), 4)
+
+        response = self.post_action('change_level', [self.other_factory, self.consumer], level=0, apply='Apply')
+
+        self.assertEqual(self.messages(response), [
+            'Factory cannot have a supplier.',
+            'The factory cannot be in debt as it has no supplier.',
+        ])
+        self.consumer.refresh_from_db()
+        self.assertEqual(self.consumer.level, 2)
+
+    def test_constant_queries(self):
+        """ Число запросов действия не зависит от размера выборки """
+
+        clients = [NetworkNode.objects.create(name=f'Client {i}', level=2, supplier=self.retailers[1])
+                   for i in range(20)]
+        counts = []
+        for nodes, supplier in ((clients[:2], self.retailers[2]), (clients, self.retailers[0])):
+            for action, data in (('reassign_supplier', {'supplier': supplier.pk}), ('change_level', {'level': 1})):
+                with CaptureQueriesContext(connection) as queries:
+                    self.post_action(action, nodes, apply='Apply', **data)
+                counts.append(len(queries))
+
+        self.assertEqual(counts[:2], counts[2:])
+        self.assertLinksConsistent()
+
+    def test_background_mode(self):
+        """ Большая выборка проверяется сразу, а изменяется фоновой задачей """
+
+        with override_settings(ADMIN_ACTIONS_BACKGROUND_THRESHOLD=2):
+            response = self.post_action('change_level', self.retailers, level=2, apply='Apply')
+
+        job = Job.objects.get()
+        self.assertEqual(self.messages(response),
+                         [f'Level changed: 3 objects will be updated in the background (job #{job.pk}).'])
+        self.assertEqual((job.task, job.params, job.created_by),
+                         ('networks.change_level', {'pks': [node.pk for node in self.retailers], 'level': 2},
+                          self.admin))
+        self.assertEqual(NetworkNode.objects.filter(level=2).count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('run_jobs', processes=0, once=True, stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.SUCCEEDED, {'updated': 3}))
+        self.assertEqual(NetworkNode.objects.filter(level=2).count(), 4)
+
+
+class AdminChangeListTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование списков и карточек админ-панели на больших таблицах """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.admin)
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.add_rows(0, 3)
+
+    def add_rows(self, start, stop):
+        """ Ретейлеры завода с контактами, продуктами и проводками """
+        for i in range(start, stop):
+            node = NetworkNode.objects.create(name=f'Retail {i}', level=1, supplier=self.factory, debt_amount=i * 600)
+            node.contacts.add(Contacts.objects.create(email=f'info{i}@retail.com', country=f'Country {i}',
+                                                      city=f'City {i}', network_node=node))
+            product = Product.objects.create(name=f'Product {i}', model=f'M-{i}')
+            product.sales_channel.add(self.factory, node)
+
+    def changelist_queries(self, model_name, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:networks_{model_name}_changelist'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return queries.captured_queries
+
+    def test_changelist_queries(self):
+        """ Число запросов списков не зависит от числа строк """
+        models = ('networknode', 'product', 'contacts', 'debttransaction')
+        before = {model_name: len(self.changelist_queries(model_name)) for model_name in models}
+
+        self.add_rows(3, 30)
+
+        after = {model_name: len(self.changelist_queries(model_name)) for model_name in models}
+        self.assertEqual(before, after)
+        self.assertEqual(after, {'networknode': 5, 'product': 5, 'contacts': 6, 'debttransaction': 4})
+
+    def test_cached_counts_and_filters(self):
+        """ Повторная загрузка списка не считает строки и не строит варианты фильтров заново """
+        url = reverse('admin:networks_contacts_changelist')
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertContains(response, 'Country 2')
+
+    def test_no_full_table_distinct(self):
+        """ Варианты фильтра страны организаций берутся из таблицы контактов, без соединения с организациями """
+        queries = self.changelist_queries('networknode')
+
+        distinct = [query['sql'] for query in queries if 'DISTINCT' in query['sql']]
+        self.assertEqual(len(distinct), 1)
+        self.assertNotIn('networks_networknode', distinct[0])
+
+    def test_estimated_count(self):
+        """ Количество строк без фильтров - оценка по статистике таблицы """
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=10 ** 6), \
+                CaptureQueriesContext(connection) as queries:
+            paginator = EstimatedCountPaginator(NetworkNode.objects.all(), 10)
+            self.assertEqual(paginator.count, 10 ** 6)
+        self.assertEqual(len(queries), 0)
+
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=10):
+            self.assertEqual(EstimatedCountPaginator(NetworkNode.objects.all(), 10).count, 4)
+        self.assertIsNone(EstimatedCountPaginator.estimate(NetworkNode.objects.all()))
+
+    def test_debt_range_filter(self):
+        """ Фильтр задолженности по диапазонам """
+        response = self.client.get(reverse('admin:networks_networknode_changelist'), {'debt_range': 'lt10000'})
+
+        self.assertEqual([node.name for node in response.context['cl'].result_list], ['Retail 2'])
+
+    def test_factory_filter(self):
+        """ Фильтр продуктов по заводу среди каналов продаж """
+        other = NetworkNode.objects.create(name='Other Factory', level=0)
+        Product.objects.create(name='Other Product', model='M-0').sales_channel.add(other)
+
+        response = self.client.get(reverse('admin:networks_product_changelist'), {'factory': other.pk})
+
+        self.assertEqual([product.name for product in response.context['cl'].result_list], ['Other Product'])
+
+    def test_change_page_clients(self):
+        """ В карточке завода выводятся только первые клиенты, число запросов не зависит от их количества """
+        url = reverse('admin:networks_networknode_change', args=[self.factory.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.add_rows(3, 30)
+
+        with CaptureQueriesContext(connection) as more_queries:
+            response = self.client.get(url)
+
+        self.assertEqual(len(queries), len(more_queries))
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 20)
+        self.assertContains(response, f'?supplier__id__exact={self.factory.pk}">30 clients</a>')
+
+
+class JobsTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование фоновых задач: постановка через API, выполнение обработчиком, ход выполнения и повторы """
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.result_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.result_dir.cleanup)
+        settings = override_settings(JOBS_RESULT_DIR=self.result_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.retailer = NetworkNode.objects.create(name='Retail', level=1, supplier=self.factory, debt_amount='10.00')
+        Contacts.objects.create(network_node=self.retailer, email='retail@example.com', country='Serbia', city='Niš')
+
+    def run_jobs(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('run_jobs', processes=0, once=True, stdout=StringIO())
+
+    def test_export(self):
+        """ Выгрузка ставится в очередь с ответом 202, выполняется обработчиком и скачивается файлом """
+
+        response = self.client.post(reverse('networks:networks-export'), {'export_format': 'csv'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+        self.assertTrue(response['Location'].endswith(reverse('networks:jobs-detail', args=[response.data['id']])))
+
+        self.run_jobs()
+
+        job = self.client.get(response['Location']).data
+        self.assertEqual((job['status'], job['progress'], job['done'], job['total']), (Job.SUCCEEDED, 100, 2, 2))
+        self.assertEqual(job['result']['rows'], 2)
+        download = self.client.get(reverse('networks:jobs-download', args=[job['id']]))
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        self.assertEqual(download['Content-Type'], 'text/csv')
+        expected = self.client.get(reverse('networks:networks-export'), {'export_format': 'csv'})
+        self.assertEqual(b''.join(download.streaming_content), b''.join(expected.streaming_content))
+
+    def test_enqueue(self):
+        """ Задачи ставятся в очередь через /jobs/ с проверкой параметров до постановки """
+
+        url = reverse('networks:jobs-list')
+        for data in (
+            {'task': 'unknown'},
+            {'task': 'users.toggle_active', 'params': {'pks': [self.user.pk]}},
+            {'task': 'networks.export', 'params': {'export_format': 'xml'}},
+            {'task': 'networks.change_level', 'params': {'pks': [self.retailer.pk], 'level': 0}},
+        ):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+        self.assertEqual(response.data['params']['non_field_errors'], [
+            'Factory cannot have a supplier.',
+            'The factory cannot be in debt as it has no supplier.',
+        ])
+        self.assertFalse(Job.objects.exists())
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.post(url, {'task': 'networks.change_level',
+                                          'params': {'pks': [self.retailer.pk], 'level': 2}}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['params'], {'pks': [self.retailer.pk], 'level': 2})
+        self.run_jobs()
+        self.retailer.refresh_from_db()
+        self.assertEqual(self.retailer.level, 2)
+
+    def test_enqueue_permissions(self):
+        """ Пересчёты и массовые изменения ставит в очередь только сотрудник, выгрузку - любой пользователь """
+
+        url = reverse('networks:jobs-list')
+        for data in (
+            {'task': 'networks.reconcile_debt', 'params': {'mode': 'fix'}},
+            {'task': 'networks.rebuild_supply_chain'},
+            {'task': 'networks.reassign_supplier',
+             'params': {'pks': [self.retailer.pk], 'supplier_id': self.factory.pk}},
+            {'task': 'networks.change_level', 'params': {'pks': [self.retailer.pk], 'level': 2}},
+            {'task': 'networks.zero_out_debt', 'params': {'pks': [self.retailer.pk]}},
+        ):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN, data)
+        self.assertFalse(Job.objects.exists())
+
+        response = self.client.post(url, {'task': 'networks.export'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_reconcile(self):
+        """ Пересчёт задолженности по журналу фоновой задачей """
+        NetworkNode.objects.filter(pk=self.retailer.pk).update(debt_amount='12.00')
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.post(reverse('networks:jobs-list'),
+                                    {'task': 'networks.reconcile_debt', 'params': {'mode': 'fix'}}, format='json')
+        self.run_jobs()
+
+        job = Job.objects.get(pk=response.data['id'])
+        self.assertEqual(job.result, {'checked': 2, 'mismatches': 1, 'repaired': 1,
+                                      'sample': [[self.retailer.pk, '12.00', '10.00']]})
+        self.retailer.refresh_from_db()
+        self.assertEqual(self.retailer.debt_amount, Decimal('10.00'))
+
+    def test_retry(self):
+        """ Ошибка возвращает задачу в очередь с задержкой, после последней попытки задача завершается с ошибкой """
+        func = mock.Mock(side_effect=[ValueError('first'), ValueError('second'), {'ok': True}])
+
+        with mock.patch.dict(TASKS, {'tests.flaky': Task('tests.flaky', func, max_attempts=2)}), \
+                self.assertLogs('networks.jobs', 'ERROR'):
+            job = enqueue('tests.flaky', created_by=self.user, value=1)
+            self.run_jobs()
+
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+            self.assertIn('ValueError: first', job.error)
+            self.assertGreater(job.run_after, timezone.now())
+
+            # Повтор ещё не наступил
+            self.run_jobs()
+            self.assertEqual(func.call_count, 1)
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.run_jobs()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+            self.assertIn('ValueError: second', job.error)
+
+            response = self.client.post(reverse('networks:jobs-retry', args=[job.pk]))
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual((response.data['status'], response.data['attempts']), (Job.QUEUED, 0))
+            response = self.client.post(reverse('networks:jobs-retry', args=[job.pk]))
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.error), (Job.SUCCEEDED, {'ok': True}, ''))
+        func.assert_called_with(job, value=1)
+
+    def test_invalid_operation_not_retried(self):
+        """ Выборка, ставшая неверной после постановки в очередь, завершает задачу с ошибкой без повторов """
+        job = enqueue('networks.change_level', pks=[self.retailer.pk], level=0)
+
+        self.run_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1))
+        self.assertEqual(job.error,
+                         'Factory cannot have a supplier. The factory cannot be in debt as it has no supplier.')
+
+    def test_claim(self):
+        """ Задача захватывается одним обработчиком """
+        job = enqueue('networks.rebuild_supply_chain')
+
+        self.assertEqual(Job.objects.claim('worker 1'), [job.pk])
+        self.assertEqual(Job.objects.claim('worker 2'), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (Job.RUNNING, 'worker 1', 1))
+
+    def test_requeued_attempt_result_dropped(self):
+        """ Попытка, задачу которой вернули в очередь и захватили снова, не перезаписывает итог новой попытки """
+
+        def task(job):
+            # Обработчик не отмечал ход выполнения: задачу вернули в очередь и захватил другой обработчик
+            Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+            requeue_stale(timeout=60)
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            Job.objects.claim('worker 2')
+            return {'ok': True}
+
+        with mock.patch.dict(TASKS, {'tests.slow': Task('tests.slow', task)}), \
+                self.assertLogs('networks.jobs', 'WARNING') as logs:
+            job = enqueue('tests.slow')
+            Job.objects.claim('worker 1')
+            self.assertEqual(execute(job.pk), Job.RUNNING)
+
+        self.assertIn('result of attempt 1 is dropped', logs.output[-1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts, job.result), (Job.RUNNING, 'worker 2', 2, None))
+
+    def test_inline_heartbeat(self):
+        """ Обработчик без пула процессов отмечает ход выполнения задачи, которая не вызывает job.report """
+        beats = threading.Event()
+
+        def task(job):
+            self.assertTrue(beats.wait(5))
+            return {}
+
+        with mock.patch.dict(TASKS, {'tests.silent': Task('tests.silent', task)}), \
+                mock.patch.object(JobQuerySet, 'heartbeat', side_effect=lambda *args: beats.set()) as heartbeat, \
+                override_settings(JOBS_STALE_TIMEOUT=0.03):
+            job = enqueue('tests.silent')
+            self.run_jobs()
+
+        heartbeat.assert_called_with([job.pk], worker_name())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+
+    def test_stale(self):
+        """ Задача остановленного обработчика возвращается в очередь как неудачная попытка """
+        job = enqueue('networks.rebuild_supply_chain')
+        Job.objects.claim('worker')
+
+        self.assertEqual(requeue_stale(timeout=60), 0)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+        with self.assertLogs('networks.jobs', 'WARNING'):
+            self.assertEqual(requeue_stale(timeout=60), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (Job.QUEUED, 1, 'Worker worker stopped responding.'))
+
+    def test_visibility(self):
+        """ Пользователь видит только свои задачи, сотрудник - все """
+        other = get_user_model().objects.create(username='other')
+        own, foreign = enqueue('networks.rebuild_supply_chain', created_by=self.user), \
+            enqueue('networks.rebuild_supply_chain', created_by=other)
+
+        response = self.client.get(reverse('networks:jobs-list'))
+        self.assertEqual([job['id'] for job in response.data['results']], [own.pk])
+        self.assertEqual(self.client.get(reverse('networks:jobs-detail', args=[foreign.pk])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('networks:jobs-list'))
+        self.assertEqual({job['id'] for job in response.data['results']}, {own.pk, foreign.pk})
+
+    def test_admin_export_and_retry(self):
+        """ Выгрузка ставится в очередь действием админ-панели, задачи с ошибкой повторяются действием """
+        admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        self.client.force_login(admin)
+
+        response = self.client.post(reverse('admin:networks_networknode_changelist'), {
+            'action': 'export_nodes', 'select_across': '1', '_selected_action': [self.retailer.pk],
+            'export_format': 'ndjson', 'apply': 'Apply',
+        })
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        job = Job.objects.get()
+        self.assertEqual(job.params, {'export_format': 'ndjson', 'pks': None})
+
+        response = self.client.post(reverse('admin:networks_networknode_changelist'), {
+            'action': 'export_nodes', '_selected_action': [self.retailer.pk],
+            'export_format': 'ndjson', 'apply': 'Apply',
+        })
+        self.assertEqual(Job.objects.latest('pk').params, {'export_format': 'ndjson', 'pks': [self.retailer.pk]})
+        self.run_jobs()
+        self.assertEqual(list(Job.objects.values_list('result__rows', flat=True)), [1, 2])
+
+        Job.objects.update(status=Job.FAILED)
+        response = self.client.post(reverse('admin:networks_job_changelist'), {
+            'action': 'retry_jobs', '_selected_action': [job.pk],
+        })
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), [Job.FAILED, Job.QUEUED])
+        self.assertEqual(self.client.get(reverse('admin:networks_job_changelist')).status_code, status.HTTP_200_OK)
+
+
+class LocationTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование справочника мест и сводок по странам и городам """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.retailer = NetworkNode.objects.create(name='Retail', level=1, supplier=self.factory, debt_amount='100.00')
+        self.other = NetworkNode.objects.create(name='Other Retail', level=1, supplier=self.factory,
+                                                debt_amount='30.00')
+        self.consumer = NetworkNode.objects.create(name='Consumer', level=2, supplier=self.retailer,
+                                                   debt_amount='50.50')
+        self.moscow = Contacts.objects.create(email='a@retail.com', country='Russia', city='Moscow')
+        self.kazan = Contacts.objects.create(email='b@retail.com', country='Russia', city='Kazan')
+        self.nis = Contacts.objects.create(email='c@consumer.com', country='Serbia', city='Nis')
+        self.retailer.contacts.add(self.moscow, self.kazan)
+        self.other.contacts.add(self.kazan)
+        self.consumer.contacts.add(self.nis)
+
+    def locations(self):
+        return {node.name: node.location and (node.location.country, node.location.city)
+                for node in NetworkNode.objects.select_related('location')}
+
+    def test_deduplicated(self):
+        """ Контакты с одинаковыми страной и городом ссылаются на одно место """
+        contacts = Contacts.objects.create(email='d@retail.com', country='Russia', city='Moscow')
+
+        self.assertEqual(contacts.location, self.moscow.location)
+        self.assertEqual(Location.objects.count(), 3)
+
+    def test_node_location(self):
+        """ Место организации - место первого контакта, пересчитывается при изменении контактов """
+        self.assertEqual(self.locations(), {'Factory': None, 'Retail': ('Russia', 'Moscow'),
+                                            'Other Retail': ('Russia', 'Kazan'), 'Consumer': ('Serbia', 'Nis')})
+
+        self.retailer.contacts.remove(self.moscow)
+        self.assertEqual(self.locations()['Retail'], ('Russia', 'Kazan'))
+
+        self.kazan.city = 'Kazan City'
+        self.kazan.save()
+        self.assertEqual(self.locations()['Retail'], ('Russia', 'Kazan City'))
+        self.assertEqual(self.locations()['Other Retail'], ('Russia', 'Kazan City'))
+
+        self.kazan.organisation.clear()
+        self.assertEqual(self.locations()['Retail'], None)
+        self.assertEqual(self.locations()['Other Retail'], None)
+
+        self.moscow.organisation.add(self.factory)
+        self.nis.delete()
+        self.assertEqual(self.locations(), {'Factory': ('Russia', 'Moscow'), 'Retail': None,
+                                            'Other Retail': None, 'Consumer': None})
+
+    def test_location_analytics(self):
+        """ Сводки по странам и городам одним запросом без чтения контактов """
+        url = reverse('networks:networks-location-analytics')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['country'], row['nodes'], row['total_debt']) for row in response.data],
+                         [('Russia', 2, '130.00'), ('Serbia', 1, '50.50'), (None, 1, '0.00')])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('networks_contacts', queries[0]['sql'])
+
+        response = self.client.get(url, {'group_by': 'city', 'country': 'Russia'})
+        self.assertEqual([(row['country'], row['city'], row['nodes'], row['total_debt']) for row in response.data],
+                         [('Russia', 'Kazan', 1, '30.00'), ('Russia', 'Moscow', 1, '100.00')])
+
+        self.assertEqual(self.client.get(url, {'group_by': 'street'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_location_analytics_cache(self):
+        """ Сводка кэшируется и сбрасывается при изменении контактов организаций """
+        url = reverse('networks:networks-location-analytics')
+        self.client.get(url)
+
+        self.retailer.contacts.remove(self.moscow)
+
+        response = self.client.get(url, {'group_by': 'city'})
+        self.assertEqual([(row['city'], row['nodes']) for row in response.data],
+                         [('Kazan', 2), ('Nis', 1), (None, 1)])
+
+    def test_list_filter(self):
+        """ Список организаций отбирается по стране и городу первого контакта """
+        url = reverse('networks:networks-list-create')
+
+        response = self.client.get(url, {'country': 'Russia'})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Retail', 'Other Retail'])
+
+        response = self.client.get(url, {'country': 'Russia', 'city': 'Kazan'})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Other Retail'])
+
+    def test_backfill_migration(self):
+        """ Заполнение мест существующих контактов и организаций частями """
+        expected = self.locations()
+        migration = importlib.import_module('networks.migrations.0008_backfill_location')
+        NetworkNode.objects.update(location=None)
+        Contacts.objects.update(location=None)
+        Location.objects.all().delete()
+
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.backfill_locations(apps, None)
+
+        self.assertEqual(self.locations(), expected)
+        self.assertEqual(Location.objects.count(), 3)
+        self.assertFalse(Contacts.objects.filter(location=None).exists())
+
+
+class CountersTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование хранимых счётчиков продуктов организаций и каналов продаж продуктов """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+
+        self.factory = NetworkNode.objects.create(name='Factory', level=0)
+        self.retailer = NetworkNode.objects.create(name='Retail', level=1, supplier=self.factory)
+        self.products = [Product.objects.create(name=f'Product {i}', model=f'M-{i}') for i in range(3)]
+
+    def counters(self):
+        return (dict(NetworkNode.objects.values_list('name', 'products_count')),
+                dict(Product.objects.values_list('name', 'sales_channels_count')))
+
+    def test_forward_changes(self):
+        """ Изменение связей со стороны владельца счётчика: учитываются только действительные изменения """
+        self.retailer.products.add(*self.products)
+        self.retailer.products.add(self.products[0])
+        self.assertEqual(self.retailer.products_count, 3)
+
+        self.retailer.products.remove(self.products[0], self.products[0])
+        self.retailer.products.remove(self.products[0])
+        self.products[1].sales_channel.set([self.factory, self.retailer])
+        self.assertEqual(self.counters(), ({'Factory': 0, 'Retail': 2},
+                                           {'Product 0': 0, 'Product 1': 2, 'Product 2': 0}))
+
+        self.retailer.products.clear()
+        self.products[1].sales_channel.set([self.factory])
+        self.assertEqual(self.counters(), ({'Factory': 0, 'Retail': 0},
+                                           {'Product 0': 0, 'Product 1': 1, 'Product 2': 0}))
+
+    def test_reverse_changes(self):
+        """ Изменение связей со стороны связанной модели изменяет счётчики затронутых строк на 1 """
+        self.products[0].seller.add(self.factory, self.retailer)
+        self.products[1].seller.add(self.retailer)
+        self.retailer.product.add(*self.products[:2])
+        self.assertEqual(self.counters(), ({'Factory': 1, 'Retail': 2},
+                                           {'Product 0': 1, 'Product 1': 1, 'Product 2': 0}))
+
+        self.products[0].seller.remove(self.retailer)
+        self.retailer.product.clear()
+        self.assertEqual(self.counters(), ({'Factory': 1, 'Retail': 1},
+                                           {'Product 0': 0, 'Product 1': 0, 'Product 2': 0}))
+
+    def test_delete(self):
+        """ Удаление строки уменьшает счётчики связанных строк """
+        self.retailer.products.add(*self.products)
+        self.factory.products.add(self.products[0])
+        self.products[0].sales_channel.add(self.retailer)
+
+        self.products[0].delete()
+        self.retailer.delete()
+        self.assertEqual(self.counters(), ({'Factory': 0}, {'Product 1': 0, 'Product 2': 0}))
+
+    def test_repair_command(self):
+        """ Команда repair_counters пересчитывает расходящиеся счётчики частями """
+        self.retailer.products.add(*self.products)
+        self.products[2].sales_channel.add(self.factory, self.retailer)
+        expected = self.counters()
+        NetworkNode.objects.update(products_count=7)
+        Product.objects.update(sales_channels_count=0)
+
+        output = StringIO()
+        call_command('repair_counters', chunk_size=1, stdout=output)
+
+        self.assertEqual(self.counters(), expected)
+        self.assertIn('Fixed 2 network nodes counters', output.getvalue())
+        self.assertIn('Fixed 1 products counters', output.getvalue())
+
+    def test_list_filter_and_ordering(self):
+        """ Отбор и сортировка списков по счётчикам, в том числе с пагинацией по ключу """
+        url = reverse('networks:networks-list-create')
+        self.retailer.products.add(*self.products)
+        self.factory.products.add(self.products[0])
+        consumer = NetworkNode.objects.create(name='Consumer', level=2, supplier=self.retailer)
+        consumer.products.add(*self.products[:2])
+
+        response = self.client.get(url, {'ordering': '-products_count'})
+        self.assertEqual([(row['name'], row['items_quantity']) for row in response.data['results']],
+                         [('Retail', 3), ('Consumer', 2), ('Factory', 1)])
+
+        response = self.client.get(url, {'products_count__gte': 2, 'products_count__lte': 2})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Consumer'])
+
+        names = []
+        with mock.patch('networks.pagination.CustomPaginator.page_size', 1):
+            response = self.client.get(url, {'ordering': '-products_count', 'pagination': 'cursor'})
+            while True:
+                names += [row['name'] for row in response.data['results']]
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+        self.assertEqual(names, ['Retail', 'Consumer', 'Factory'])
+
+        response = self.client.get(reverse('networks:products-list'),
+                                   {'ordering': 'sales_channels_count', 'sales_channels_count__gte': 'many'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_migration(self):
+        """ Заполнение счётчиков существующих строк частями """
+        self.retailer.products.add(*self.products)
+        self.products[0].sales_channel.add(self.factory)
+        expected = self.counters()
+        migration = importlib.import_module('networks.migrations.0010_backfill_counters')
+        NetworkNode.objects.update(products_count=0)
+        Product.objects.update(sales_channels_count=5)
+
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.backfill_counters(apps, None)
+
+        self.assertEqual(self.counters(), expected)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=60)
+class ReplicaRoutingTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование чтения с реплики: вторая база данных SQLite в памяти вместо реплики PostgreSQL """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Реплика подключается после баз данных теста: её изменения не откатываются и удаляются в tearDown
+        connections.settings['replica'] = connections.configure_settings({
+            **connections.settings, 'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+        })['replica']
+        with override_settings(DATABASE_REPLICAS=[]):
+            call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        super().tearDownClass()
+
+    def tearDown(self) -> None:
+        Product.objects.using('replica').all().delete()
+        NetworkNode.objects.using('replica').all().delete()
+        get_user_model().objects.using('replica').all().delete()
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=self.user)
+        Product.objects.create(name='Primary product', model='P-1')
+        Product.objects.using('replica').create(name='Replica product', model='R-1')
+        self.url = reverse('networks:products-list')
+
+    def names(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['name'] for row in response.data['results']]
+
+    def test_safe_requests_read_from_replica(self):
+        """ Списки API читаются с реплики, запросы вне запросов к API - с основной базы данных """
+        self.assertEqual(self.names(self.client.get(self.url)), ['Replica product'])
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Primary product'])
+
+    def test_sticky_primary_after_write(self):
+        """ После изменяющего запроса клиент читает с основной базы данных, другие клиенты - с реплики """
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer first')
+        response = self.client.post(self.url, {'name': 'New product', 'model': 'N-1'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Product.objects.using('replica').filter(name='New product').exists())
+
+        self.assertEqual(self.names(self.client.get(self.url)), ['New product', 'Primary product'])
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer second')
+        self.assertEqual(self.names(self.client.get(self.url)), ['Replica product'])
+
+    def test_sticky_window(self):
+        """ По истечении REPLICA_STICKY_SECONDS клиент снова читает с реплики """
+        with self.settings(REPLICA_STICKY_SECONDS=0):
+            self.client.post(self.url, {'name': 'New product', 'model': 'N-1'})
+
+        self.assertEqual(self.names(self.client.get(self.url)), ['Replica product'])
+
+    def test_cache_not_filled_from_lagging_replica(self):
+        """ Ответ, прочитанный с реплики вскоре после сброса кэша, не сохраняется: реплика могла отстать """
+        node = NetworkNode.objects.create(name='Factory', level=0)
+        # Реплика получает организацию репликацией, без сигналов и иерархии поставок
+        NetworkNode.objects.using('replica').bulk_create([NetworkNode(pk=node.pk, name='Factory', level=0)])
+        url = reverse('networks:network-detail', kwargs={'pk': node.pk})
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer writer')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {'name': 'Best Factory'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Другой клиент читает с отставшей реплики прежнее название, но не сохраняет его под новой версией
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer reader')
+        self.assertEqual(self.client.get(url).data['name'], 'Factory')
+        NetworkNode.objects.using('replica').filter(pk=node.pk).update(name='Best Factory')
+        self.assertEqual(self.client.get(url).data['name'], 'Best Factory')
+
+        # После окна отставания ответ с реплики кэшируется
+        with self.settings(REPLICA_STICKY_SECONDS=0):
+            self.client.get(url)
+        with self.assertNumQueries(0, using='replica'):
+            self.assertEqual(self.client.get(url).data['name'], 'Best Factory')
+
+    def test_admin_changelist(self):
+        """ Списки админ-панели читаются с реплики, сессии - с основной базы данных """
+        admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        # Реплика получает пользователя репликацией
+        admin.save(using='replica')
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('admin:networks_product_changelist'))
+
+        self.assertContains(response, 'Replica product')
+        self.assertNotContains(response, 'Primary product')
+
+    def test_use_primary(self):
+        """ use_primary возвращает чтение на основную базу данных внутри блока """
+        token = read_from_replica.set(True)
+        try:
+            self.assertEqual(Product.objects.get().name, 'Replica product')
+            with use_primary():
+                self.assertEqual(Product.objects.get().name, 'Primary product')
+        finally:
+            read_from_replica.reset(token)
+
+
+class FakeConnection:
+    """ Соединение для тестов пула без сервера PostgreSQL """
+
+    def __init__(self):
+        self.closed = 0
+        self.info = SimpleNamespace(transaction_status=0)
+
+    def rollback(self):
+        self.info.transaction_status = 0
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование пула соединений процесса и метрик соединений """
+
+    def setUp(self) -> None:
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def test_reuse(self):
+        """ Возвращённое соединение выдаётся повторно без открытия нового """
+        pool = ConnectionPool('default', max_size=2)
+        first, waited = pool.getconn(self.connect)
+        pool.putconn(first)
+        second, _ = pool.getconn(self.connect)
+
+        self.assertIs(second, first)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_wait_and_timeout(self):
+        """ При max_size занятых соединениях поток ждёт возврата соединения, по истечении timeout - ошибка """
+        pool = ConnectionPool('default', max_size=1, timeout=5)
+        connection, _ = pool.getconn(self.connect)
+        timer = threading.Timer(0.05, pool.putconn, [connection])
+        timer.start()
+
+        reused, waited = pool.getconn(self.connect)
+        timer.join()
+
+        self.assertIs(reused, connection)
+        self.assertGreater(waited, 0)
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['waits']), (1, 1))
+        self.assertGreater(stats['wait_ms_max'], 0)
+
+        pool.timeout = 0.01
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(self.connect)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_discard(self):
+        """ Непригодные, закрытые и устаревшие соединения закрываются и заменяются новыми """
+        pool = ConnectionPool('default', max_size=1, max_lifetime=60)
+        connection, _ = pool.getconn(self.connect)
+        pool.putconn(connection, discard=True)
+        self.assertTrue(connection.closed)
+
+        connection, _ = pool.getconn(self.connect)
+        pool.putconn(connection)
+        replaced, _ = pool.getconn(self.connect, check=lambda connection: False)
+        self.assertIsNot(replaced, connection)
+        self.assertTrue(connection.closed)
+
+        pool.opened_at[id(replaced)] -= 120
+        pool.putconn(replaced)
+        self.assertTrue(replaced.closed)
+        self.assertEqual((pool.stats()['size'], pool.stats()['discarded']), (0, 3))
+
+    def test_warm_up(self):
+        """ min_size соединений открываются заранее """
+        pool = ConnectionPool('default', min_size=2, max_size=4)
+        pool.warm_up(self.connect)
+        pool.warm_up(self.connect)
+
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def pooled_wrapper(self):
+        return PooledDatabaseWrapper(connections.configure_settings({
+            **connections.settings,
+            'pooled': {'ENGINE': 'networks.backends.postgresql_pool', 'NAME': 'network', 'USER': 'user',
+                       'OPTIONS': {'pool': {'max_size': 4}}},
+        })['pooled'], 'pooled')
+
+    def test_backend_connection_params(self):
+        """ Настройки пула не передаются драйверу PostgreSQL """
+        params = self.pooled_wrapper().get_connection_params()
+
+        self.assertNotIn('pool', params)
+        self.assertEqual((params['dbname'], params['user']), ('network', 'user'))
+
+    def test_backend_returns_connections(self):
+        """ Закрытие соединения Django возвращает его в пул, незавершённая транзакция откатывается """
+        first, second = self.pooled_wrapper(), self.pooled_wrapper()
+        self.addCleanup(lambda: [pools.pop(key) for key in list(pools) if key[0] == 'pooled'])
+        with mock.patch('django.db.backends.postgresql.base.DatabaseWrapper.get_new_connection',
+                        lambda wrapper, params: self.connect()):
+            params = first.get_connection_params()
+            first.connection = first.get_new_connection(params)
+            first.connection.info.transaction_status = 2
+            first._close()
+            second.connection = second.get_new_connection(params)
+
+        self.assertEqual(len(self.opened), 1)
+        self.assertIs(second.connection, self.opened[0])
+        self.assertEqual(second.connection.info.transaction_status, 0)
+        self.assertEqual(second.pool.stats()['checkouts'], 2)
+
+    def test_metrics_endpoint(self):
+        """ Метрики соединений доступны только персоналу """
+        url = reverse('networks:database-metrics')
+        user = get_user_model().objects.create(username='username', password='password')
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        user.save()
+        pool = get_pool(('metrics-test',), 'metrics-test', max_size=3)
+        self.addCleanup(pools.pop, ('metrics-test',))
+        pool.putconn(pool.getconn(self.connect)[0])
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['databases'][0]['alias'], 'default')
+        stats = next(stats for stats in response.data['pools'] if stats['name'] == 'metrics-test')
+        self.assertEqual((stats['size'], stats['idle'], stats['max_size'], stats['checkouts']), (1, 1, 3, 1))
@@ -2,16 +2,38 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from networks.apps import NetworksConfig
-from networks.views import NetworkNodeAPIView, ProductViewSet, ContactsViewSet, NetworkNodeRetrieveAPIView
+from networks.async_views import AsyncNetworkNodeListView, AsyncNetworkNodeDetailView, AsyncProductListView, \
+    AsyncProductDetailView, AsyncContactsListView, AsyncContactsDetailView
+from networks.views import NetworkNodeAPIView, ProductViewSet, ContactsViewSet, NetworkNodeRetrieveAPIView, \
+    NetworkNodeAncestorsAPIView, NetworkNodeDescendantsAPIView, NetworkNodeBulkAPIView, \
+    NetworkNodeExportAPIView, DebtAnalyticsAPIView, DebtTransactionAPIView, JobViewSet, \
+    LocationAnalyticsAPIView, DatabaseMetricsAPIView
 
 app_name = NetworksConfig.name
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='products')
 router.register(r'contacts', ContactsViewSet, basename='contacts')
+router.register(r'jobs', JobViewSet, basename='jobs')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('networks/', NetworkNodeAPIView.as_view(), name='networks-list-create'),
+    path('networks/export/', NetworkNodeExportAPIView.as_view(), name='networks-export'),
+    path('networks/analytics/debt/', DebtAnalyticsAPIView.as_view(), name='networks-debt-analytics'),
+    path('networks/analytics/locations/', LocationAnalyticsAPIView.as_view(), name='networks-location-analytics'),
+    path('networks/debt/transactions/', DebtTransactionAPIView.as_view(), name='networks-debt-transactions'),
+    path('networks/bulk/', NetworkNodeBulkAPIView.as_view(), name='networks-bulk'),
     path('networks/<int:pk>/', NetworkNodeRetrieveAPIView.as_view(), name='network-detail'),
+    path('networks/<int:pk>/ancestors/', NetworkNodeAncestorsAPIView.as_view(), name='network-ancestors'),
+    path('networks/<int:pk>/descendants/', NetworkNodeDescendantsAPIView.as_view(), name='network-descendants'),
+    path('metrics/databases/', DatabaseMetricsAPIView.as_view(), name='database-metrics'),
+
+    # Асинхронные (ASGI) эндпоинты чтения
+    path('async/networks/', AsyncNetworkNodeListView.as_view(), name='async-networks-list'),
+    path('async/networks/<int:pk>/', AsyncNetworkNodeDetailView.as_view(), name='async-network-detail'),
+    path('async/products/', AsyncProductListView.as_view(), name='async-products-list'),
+    path('async/products/<int:pk>/', AsyncProductDetailView.as_view(), name='async-products-detail'),
+    path('async/contacts/', AsyncContactsListView.as_view(), name='async-contacts-list'),
+    path('async/contacts/<int:pk>/', AsyncContactsDetailView.as_view(), name='async-contacts-detail'),
 ]
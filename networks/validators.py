@@ -1,5 +1,7 @@
 from rest_framework.exceptions import ValidationError
 
+from networks.models import SupplyLink
+
 
 class SupplierValidator:
     """ Проверка, что завод не иметь поставщика, а ретейл и ИП могут ссылаться на другие уровни """
@@ -20,3 +22,15 @@ class FactoryDebtValidator:
         if instance.get('level', None) == 0:
             if instance.get('debt_amount', None):
                 raise ValidationError("The factory cannot be in debt as it has no supplier.")
+
+
+class SupplyCycleValidator:
+    """ Проверка, что поставщик не является клиентом организации на любом нижестоящем уровне """
+
+    requires_context = True
+
+    def __call__(self, instance, serializer):
+        supplier = instance.get('supplier', None)
+        node = serializer.instance
+        if node is not None and supplier is not None and SupplyLink.objects.creates_cycle(node.pk, supplier.pk):
+            raise ValidationError("An organisation cannot be supplied by its own client.")
@@ -1,21 +1,46 @@
-from django.db.models import Count
-from rest_framework import viewsets, generics
-from rest_framework.filters import SearchFilter
-from rest_framework.permissions import IsAuthenticated
+import os
+from decimal import Decimal
 
-from networks.models import NetworkNode, Product, Contacts
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.http import StreamingHttpResponse, FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from rest_framework import viewsets, generics, status, views
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+
+from networks.bulk import NetworkNodeBulkUpsert
+from networks.cache import CachedListMixin, CachedRetrieveMixin, LIST_VERSION_KEY, cached_response, get_version, \
+    request_key
+from networks.db_pool import pool_stats
+from networks.export import EXPORT_FORMATS
+from networks.filters import IndexedSearchFilter, CounterFilter
+from networks.jobs import TASKS, enqueue, result_path
+from networks.ledger import DebtPosting
+from networks.models import NetworkNode, Product, Contacts, DebtTransaction, Job
 from networks.pagination import CustomPaginator
+from networks.parsers import FastJSONParser, NDJSONParser
 from networks.serializers import NetworkNodeSerializer, ContactsSerializer, NetworkNodeDetailSerializer, \
-    ProductSerializer, NetworkNodeCreateSerializer
+    ProductSerializer, NetworkNodeCreateSerializer, NetworkNodeBulkSerializer, DebtAnalyticsFilterSerializer, \
+    DebtAnalyticsSerializer, DebtTransactionSerializer, DebtPostingSerializer, JobSerializer, JobCreateSerializer, \
+    ExportJobSerializer, LocationAnalyticsFilterSerializer, DebtByCountrySerializer, DebtByCitySerializer, \
+    DebtTransactionFilterSerializer
 from users.permissions import IsActive
 
 
 class ProductViewSet(viewsets.ModelViewSet):
     """ API эндпоинт для управления продуктами """
     serializer_class = ProductSerializer
-    queryset = Product.objects.all()
+    queryset = Product.objects.for_list()
+    filter_backends = [CounterFilter]
+    counter_field = 'sales_channels_count'
     pagination_class = CustomPaginator
+    keyset_fields = ('name', 'pk')
     permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 4, 'POST': 6, 'PUT': 9, 'PATCH': 9, 'DELETE': 9}
 
 
 class ContactsViewSet(viewsets.ModelViewSet):
@@ -24,15 +49,18 @@ class ContactsViewSet(viewsets.ModelViewSet):
     queryset = Contacts.objects.all()
     pagination_class = CustomPaginator
     permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 3, 'POST': 3, 'PUT': 4, 'PATCH': 4, 'DELETE': 5}
 
 
-class NetworkNodeAPIView(generics.ListCreateAPIView):
+class NetworkNodeAPIView(CachedListMixin, generics.ListCreateAPIView):
     """ API эндпоинт для получения списка и создания узлов сети """
     queryset = NetworkNode.objects.all()
-    filter_backends = [SearchFilter]
+    filter_backends = [IndexedSearchFilter, CounterFilter]
     search_fields = ['contacts__country']
+    counter_field = 'products_count'
     pagination_class = CustomPaginator
     permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 4, 'POST': 18}
 
     def get_serializer_class(self):
         """ Определяет класс сериализатора в зависимости от метода запроса """
@@ -42,16 +70,271 @@ class NetworkNodeAPIView(generics.ListCreateAPIView):
             return NetworkNodeSerializer
 
     def get_queryset(self):
-        """ Добавляет аннотацию к queryset с количеством связанных продуктов """
+        """
+        Добавляет к queryset предзагрузку контактов.
+        ?country= и ?city= отбирают организации по месту первого контакта (по индексу мест).
+        """
         queryset = super().get_queryset()
-        queryset = queryset.annotate(
-            items_quantity=Count('products')
-        )
+        if self.request.method == 'GET':
+            queryset = queryset.for_list()
+            for field in ('country', 'city'):
+                value = self.request.query_params.get(field)
+                if value:
+                    queryset = queryset.filter(**{f'location__{field}': value})
         return queryset
 
 
-class NetworkNodeRetrieveAPIView(generics.RetrieveUpdateDestroyAPIView):
+class NetworkNodeRetrieveAPIView(CachedRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     """ API эндпоинт для получения, обновления и удаления конкретного узла сети """
     serializer_class = NetworkNodeDetailSerializer
-    queryset = NetworkNode.objects.all()
+    queryset = NetworkNode.objects.for_detail()
+    permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 4, 'PUT': 22, 'PATCH': 22, 'DELETE': 14}
+
+
+class NetworkNodeBulkAPIView(generics.GenericAPIView):
+    """
+    API эндпоинт для пакетного создания и обновления узлов сети: JSON-массив или поток NDJSON.
+    Бюджет SQL-запросов не задан: количество запросов растёт с числом частей по CHUNK_SIZE записей.
+    """
+    serializer_class = NetworkNodeBulkSerializer
+    parser_classes = [FastJSONParser, NDJSONParser]
+    permission_classes = [IsAuthenticated, IsActive]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            if isinstance(serializer.errors, dict):
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            errors = [{'index': index, 'errors': errors} for index, errors in enumerate(serializer.errors) if errors]
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        upsert = NetworkNodeBulkUpsert(serializer.validated_data)
+        if not upsert.is_valid():
+            return Response({'errors': upsert.get_errors()}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(upsert.save(), status=status.HTTP_200_OK)
+
+
+class NetworkNodeExportAPIView(views.APIView):
+    """
+    API эндпоинт для потоковой выгрузки всей сети: ?export_format=ndjson (по умолчанию) или csv.
+    Запросы выгрузки выполняются при передаче ответа и в бюджет не входят.
+    POST ставит выгрузку в файл в очередь фоновых задач и сразу возвращает задачу (/jobs/<id>/).
+    """
+    permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 1, 'POST': 2}
+
+    def post(self, request, *args, **kwargs):
+        serializer = ExportJobSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return job_accepted(request, enqueue('networks.export', created_by=request.user, **serializer.validated_data))
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'export_format': [f'Supported formats: {", ".join(sorted(EXPORT_FORMATS))}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        stream, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(stream(), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="network.{export_format}"'
+        return response
+
+
+def job_accepted(request, job):
+    """ Ответ 202 на постановку задачи в очередь: состояние задачи и её адрес в заголовке Location """
+    url = request.build_absolute_uri(reverse('networks:jobs-detail', args=[job.pk]))
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    API эндпоинт фоновых задач: постановка в очередь ({"task": ..., "params": {...}}) с ответом 202 без ожидания
+    выполнения, состояние и ход выполнения, повтор задачи с ошибкой и скачивание файла выгрузки.
+    Пользователь видит свои задачи, сотрудник с is_staff - все; пересчёты и массовые изменения ставит в очередь
+    только сотрудник.
+    """
+    serializer_class = JobSerializer
+    queryset = Job.objects.all()
+    pagination_class = CustomPaginator
+    permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 3}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        serializer = JobCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        for permission in (permission_class() for permission_class in TASKS[data['task']].permission_classes):
+            if not permission.has_permission(request, self):
+                self.permission_denied(request, message=getattr(permission, 'message', None))
+        return job_accepted(request, enqueue(data['task'], created_by=request.user, **data['params']))
+
+    @action(detail=True, methods=['post'])
+    def retry(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status != Job.FAILED:
+            return Response({'detail': 'Only failed jobs can be retried.'}, status=status.HTTP_409_CONFLICT)
+        Job.objects.filter(pk=job.pk).retry()
+        job.refresh_from_db()
+        return job_accepted(request, job)
+
+    @action(detail=True)
+    def download(self, request, *args, **kwargs):
+        """ Файл результата выполненной выгрузки """
+        job = self.get_object()
+        if job.status != Job.SUCCEEDED or not (job.result or {}).get('file'):
+            raise Http404('The job has no result file.')
+        try:
+            output = open(result_path(job.result['file']), 'rb')
+        except FileNotFoundError:
+            raise Http404('The result file was removed.')
+        return FileResponse(output, as_attachment=True, filename=job.result['file'],
+                            content_type=job.result['content_type'])
+
+
+class NetworkNodeAncestorsAPIView(generics.ListAPIView):
+    """ API эндпоинт для получения всей цепочки поставщиков узла сети, от прямого поставщика к заводу """
+    serializer_class = NetworkNodeSerializer
+    pagination_class = CustomPaginator
     permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 5}
+    keyset_fields = ('depth', 'pk')
+
+    def get_queryset(self):
+        node = get_object_or_404(NetworkNode.objects.only('id'), pk=self.kwargs['pk'])
+        ancestors = node.get_ancestors().for_list().annotate(depth=F('descendant_links__depth'))
+        return ancestors.order_by(*self.keyset_fields)
+
+
+class NetworkNodeDescendantsAPIView(generics.ListAPIView):
+    """ API эндпоинт для получения всех клиентов узла сети на всех нижестоящих уровнях """
+    serializer_class = NetworkNodeSerializer
+    pagination_class = CustomPaginator
+    permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 5}
+    keyset_fields = ('depth', 'pk')
+
+    def get_queryset(self):
+        node = get_object_or_404(NetworkNode.objects.only('id'), pk=self.kwargs['pk'])
+        descendants = node.get_descendants().for_list().annotate(depth=F('ancestor_links__depth'))
+        return descendants.order_by(*self.keyset_fields)
+
+
+class DebtTransactionAPIView(generics.ListAPIView):
+    """
+    API эндпоинт журнала задолженности: список проводок (?network_node= - проводки одной организации)
+    и пакетная проводка JSON-массивом или потоком NDJSON в одной транзакции.
+    """
+    serializer_class = DebtTransactionSerializer
+    parser_classes = [FastJSONParser, NDJSONParser]
+    pagination_class = CustomPaginator
+    permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 3}
+
+    def get_queryset(self):
+        queryset = DebtTransaction.objects.order_by('pk')
+        filters = DebtTransactionFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        if 'network_node' in filters.validated_data:
+            queryset = queryset.filter(network_node=filters.validated_data['network_node'])
+        return queryset
+
+    def post(self, request, *args, **kwargs):
+        serializer = DebtPostingSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            if isinstance(serializer.errors, dict):
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            errors = [{'index': index, 'errors': errors} for index, errors in enumerate(serializer.errors) if errors]
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        posting = DebtPosting(serializer.validated_data)
+        if not posting.is_valid():
+            return Response({'errors': posting.get_errors()}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(posting.save(), status=status.HTTP_201_CREATED)
+
+
+class DebtAnalyticsAPIView(views.APIView):
+    """
+    API эндпоинт аналитики задолженности: итог, по уровням, по странам и по заводам с учётом всех их клиентов.
+    Каждая сводка - один запрос с группировкой в базе данных; ?created_after= и ?created_before= ограничивают
+    организации временем создания. Результат кэшируется на NETWORKS_ANALYTICS_CACHE_TIMEOUT секунд.
+    """
+    permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 4}
+
+    def get(self, request, *args, **kwargs):
+        filters = DebtAnalyticsFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        version = get_version(LIST_VERSION_KEY)
+        return cached_response(
+            request, request_key('networks:debt', request, version), version,
+            lambda: self.build(filters.validated_data), timeout=settings.NETWORKS_ANALYTICS_CACHE_TIMEOUT,
+        )
+
+    def build(self, filters):
+        nodes = NetworkNode.objects.created_between(**filters)
+        by_level = list(nodes.debt_by_level())
+        serializer = DebtAnalyticsSerializer({
+            'nodes': sum(row['nodes'] for row in by_level),
+            'total_debt': sum((row['total_debt'] for row in by_level), Decimal('0.00')),
+            'by_level': by_level,
+            'by_country': nodes.debt_by_country(),
+            'by_factory': nodes.debt_by_factory(),
+        })
+        return Response(serializer.data)
+
+
+class LocationAnalyticsAPIView(views.APIView):
+    """
+    API эндпоинт количества организаций и задолженности по странам (?group_by=country) или городам
+    (?group_by=city, ?country= ограничивает страну). Организация учитывается в месте своего первого контакта;
+    сводка - один запрос с группировкой по индексу (location, debt_amount) без чтения контактов.
+    Параметры created_after и created_before - как у аналитики задолженности.
+    """
+    permission_classes = [IsAuthenticated, IsActive]
+    query_budget = {'GET': 2}
+
+    def get(self, request, *args, **kwargs):
+        filters = LocationAnalyticsFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        version = get_version(LIST_VERSION_KEY)
+        return cached_response(
+            request, request_key('networks:locations', request, version), version,
+            lambda: self.build(**filters.validated_data), timeout=settings.NETWORKS_ANALYTICS_CACHE_TIMEOUT,
+        )
+
+    def build(self, group_by, country=None, **filters):
+        nodes = NetworkNode.objects.created_between(**filters)
+        if country is not None:
+            nodes = nodes.filter(location__country=country)
+        if group_by == 'city':
+            return Response(DebtByCitySerializer(nodes.debt_by_city(), many=True).data)
+        return Response(DebtByCountrySerializer(nodes.debt_by_country(), many=True).data)
+
+
+class DatabaseMetricsAPIView(views.APIView):
+    """
+    API эндпоинт метрик соединений с базами данных процесса, обработавшего запрос: настройки постоянных
+    соединений и метрики пулов (networks.db_pool) - размер, свободные соединения, выдачи и время ожидания.
+    """
+    permission_classes = [IsAdminUser]
+    query_budget = {'GET': 0}
+
+    def get(self, request, *args, **kwargs):
+        databases = [
+            {
+                'alias': connection.alias,
+                'vendor': connection.vendor,
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'conn_health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+                'pooled': 'pool' in connection.settings_dict['OPTIONS'],
+            }
+            for connection in connections.all(initialized_only=False)
+        ]
+        return Response({'pid': os.getpid(), 'databases': databases, 'pools': pool_stats()})
@@ -0,0 +1,16 @@
+"""
+Точки входа процессов пула обработчика run_jobs. Процессы запускаются методом spawn без копии соединений
+родителя и настраивают Django сами, поэтому модуль не импортирует модели при загрузке.
+"""
+
+import django
+
+
+def setup():
+    django.setup()
+
+
+def run(pk):
+    from networks.jobs import execute
+
+    return execute(pk)
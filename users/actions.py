@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, When, Value
+
+from networks.bulk import chunked
+from users.authentication import user_cache
+
+
+class ActiveStatusToggle:
+    """ Переключение is_active выбранных пользователей одним UPDATE с Case/When на часть пользователей """
+
+    task = 'users.toggle_active'
+
+    def __init__(self, pks):
+        self.pks = sorted(set(pks))
+        self.errors = []
+
+    def params(self):
+        return {'pks': self.pks}
+
+    def is_valid(self):
+        return True
+
+    @transaction.atomic
+    def save(self):
+        users = get_user_model().objects
+        for chunk in chunked(self.pks):
+            users.filter(pk__in=chunk).update(is_active=Case(When(is_active=True, then=Value(False)),
+                                                             default=Value(True)))
+        # UPDATE не отправляет сигналы сохранения: записи кэша аутентификации сбрасываются явно
+        transaction.on_commit(lambda: [user_cache.invalidate(str(pk)) for pk in self.pks])
+        return len(self.pks)
@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.models import User
 
+from networks.admin_actions import perform
+from users.actions import ActiveStatusToggle
+
 
 class UserAdmin(admin.ModelAdmin):
     fields = ('username', 'email', 'password', 'first_name', 'last_name', 'is_staff', 'is_active', 'is_superuser')
@@ -14,10 +17,8 @@ class UserAdmin(admin.ModelAdmin):
 
     @admin.action(description="Toggle users' active status")
     def toggle_user_active_status(self, request, queryset):
-        for user in queryset:
-            user.is_active = not user.is_active
-            user.save(update_fields=['is_active'])
-        self.message_user(request, 'The users status is changed.')
+        pks = list(queryset.values_list('pk', flat=True))
+        perform(self, request, ActiveStatusToggle(pks), len(pks), 'The users status is changed')
 
 
 admin.site.unregister(User)
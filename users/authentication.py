@@ -0,0 +1,102 @@
+"""
+JWT-аутентификация с кэшем пользователей в памяти процесса.
+
+JWTAuthentication читает пользователя из базы данных на каждый запрос. CachedJWTAuthentication хранит
+прочитанных пользователей USERS_AUTH_CACHE_TIMEOUT секунд, не больше USERS_AUTH_CACHE_SIZE записей
+с вытеснением давно не использованных. Сохранение и удаление пользователя сбрасывают его запись в кэше
+текущего процесса (users.signals), в остальных процессах изменение is_active вступает в силу не позже
+чем через USERS_AUTH_CACHE_TIMEOUT секунд.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """ Потокобезопасный LRU-кэш пользователей по id из токена (строке) с временем жизни записей """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Номер сброса: пользователь, прочитанный до сброса, не сохраняется в кэш после него
+        self.generation = 0
+
+    def get(self, pk):
+        """ Пользователь из кэша или None, если записи нет или она устарела """
+        with self.lock:
+            entry = self.entries.get(pk)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[pk]
+                return None
+            self.entries.move_to_end(pk)
+            return user
+
+    def set(self, pk, user, generation):
+        """ Запись пользователя, прочитанного при номере сброса generation """
+        if self.size <= 0 or self.timeout <= 0:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[pk] = (user, time.monotonic() + self.timeout)
+            self.entries.move_to_end(pk)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, pk):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(pk, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+user_cache = UserCache(settings.USERS_AUTH_CACHE_SIZE, settings.USERS_AUTH_CACHE_TIMEOUT)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """ JWTAuthentication, которая читает пользователя из user_cache и обращается к базе данных только при промахе """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        # В токене id пользователя может быть строкой или числом
+        user_id = str(user_id)
+        user = user_cache.get(user_id)
+        if user is None:
+            generation = user_cache.generation
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+            user_cache.set(user_id, user, generation)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        # Каждый запрос получает свою копию: изменения request.user не попадают в кэш
+        return copy.copy(user)
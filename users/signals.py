@@ -0,0 +1,13 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from users.authentication import user_cache
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user(sender, instance, **kwargs):
+    """ Сброс пользователя в кэше JWT-аутентификации: изменение is_active и пароля действует сразу """
+    user_cache.invalidate(str(getattr(instance, api_settings.USER_ID_FIELD)))
@@ -0,0 +1,12 @@
+"""
+Фоновые задачи пользователей (networks.jobs).
+"""
+
+from networks.jobs import task
+from networks.tasks import run_operation
+from users.actions import ActiveStatusToggle
+
+
+@task('users.toggle_active')
+def toggle_active(job, pks):
+    return run_operation(job, ActiveStatusToggle(pks))
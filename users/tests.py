@@ -0,0 +1,187 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from networks.tests import QueryBudgetTestMixin
+from users.authentication import UserCache, user_cache
+
+
+class CachedJWTAuthenticationTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование JWT-аутентификации с кэшем пользователей """
+
+    def setUp(self) -> None:
+        user_cache.clear()
+        self.user = get_user_model().objects.create(username='username', password='password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = reverse('networks:contacts-list')
+
+    def user_queries(self):
+        """ Запрос списка контактов; результат - число SQL-запросов к таблице пользователей """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sum('auth_user' in query['sql'] for query in queries.captured_queries)
+
+    def test_user_read_once(self):
+        """ Пользователь читается из базы данных только при первом запросе """
+
+        self.assertEqual(self.user_queries(), 1)
+        self.assertEqual(self.user_queries(), 0)
+        self.assertEqual(self.user_queries(), 0)
+
+    def test_deactivation_by_admin_action(self):
+        """ Блокировка пользователя действием админ-панели действует со следующего запроса """
+        admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        self.client.get(self.url)
+        admin_client = APIClient()
+        admin_client.force_login(admin)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = admin_client.post(reverse('admin:auth_user_changelist'), {
+                'action': 'toggle_user_active_status',
+                '_selected_action': [self.user.pk],
+            })
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['code'], 'user_inactive')
+
+    def test_deactivation_by_save(self):
+        """ Любое сохранение пользователя сбрасывает его запись в кэше """
+        self.client.get(self.url)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = True
+        self.user.save()
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_deactivation_without_signals(self):
+        """ Изменение в обход сигналов (update, другой процесс) действует по истечении времени жизни записи """
+        self.client.get(self.url)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        with mock.patch('users.authentication.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user(self):
+        """ Удалённый пользователь не аутентифицируется из кэша """
+        self.client.get(self.url)
+        self.user.delete()
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_request_user_is_copy(self):
+        """ Изменения request.user не попадают в кэш """
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        cached = user_cache.get(str(self.user.pk))
+        self.assertIsNotNone(cached)
+        response = self.client.get(self.url)
+        self.assertIsNot(response.wsgi_request.user, cached)
+        self.assertEqual(response.wsgi_request.user, cached)
+
+
+class UserAdminTestCase(QueryBudgetTestMixin, APITestCase):
+    """ Тестирование действий админ-панели пользователей """
+
+    def setUp(self) -> None:
+        admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        self.client.force_login(admin)
+        self.url = reverse('admin:auth_user_changelist')
+
+    def toggle(self, users):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {
+                'action': 'toggle_user_active_status',
+                '_selected_action': [user.pk for user in users],
+            })
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        return len(queries)
+
+    def test_toggle_active_status(self):
+        """ Активные пользователи блокируются, заблокированные - разблокируются одним UPDATE """
+        active = get_user_model().objects.create(username='active')
+        inactive = get_user_model().objects.create(username='inactive', is_active=False)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.toggle([active, inactive])
+
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('CASE WHEN', updates[0])
+        active.refresh_from_db()
+        inactive.refresh_from_db()
+        self.assertFalse(active.is_active)
+        self.assertTrue(inactive.is_active)
+
+    def test_constant_queries(self):
+        """ Число запросов не зависит от числа выбранных пользователей """
+        users = [get_user_model().objects.create(username=f'user {i}') for i in range(20)]
+
+        self.assertEqual(self.toggle(users[:2]), self.toggle(users))
+
+    def test_invalidates_cached_users(self):
+        """ Переключение сбрасывает записи кэша аутентификации выбранных пользователей """
+        user = get_user_model().objects.create(username='user')
+        user_cache.set(str(user.pk), user, user_cache.generation)
+
+        self.toggle([user])
+
+        self.assertIsNone(user_cache.get(str(user.pk)))
+
+
+class UserCacheTestCase(APITestCase):
+    """ Тестирование LRU-кэша пользователей """
+
+    def test_lru_eviction(self):
+        """ При переполнении вытесняется давно не использованная запись """
+        cache = UserCache(size=2, timeout=60)
+        for pk in (1, 2):
+            cache.set(pk, f'user {pk}', cache.generation)
+        cache.get(1)
+        cache.set(3, 'user 3', cache.generation)
+
+        self.assertEqual(cache.get(1), 'user 1')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), 'user 3')
+
+    def test_timeout(self):
+        """ Запись устаревает через timeout секунд """
+        cache = UserCache(size=2, timeout=30)
+        with mock.patch('users.authentication.time.monotonic', return_value=100):
+            cache.set(1, 'user 1', cache.generation)
+        with mock.patch('users.authentication.time.monotonic', return_value=129):
+            self.assertEqual(cache.get(1), 'user 1')
+        with mock.patch('users.authentication.time.monotonic', return_value=130):
+            self.assertIsNone(cache.get(1))
+
+    def test_invalidation_during_read(self):
+        """ Пользователь, прочитанный до сброса, не сохраняется в кэш после него """
+        cache = UserCache(size=2, timeout=60)
+        generation = cache.generation
+        cache.invalidate(1)
+        cache.set(1, 'stale user 1', generation)
+
+        self.assertIsNone(cache.get(1))
+
+    def test_disabled(self):
+        """ Нулевой размер или время жизни отключают кэш """
+        for cache in (UserCache(size=0, timeout=60), UserCache(size=2, timeout=0)):
+            cache.set(1, 'user 1', cache.generation)
+            self.assertIsNone(cache.get(1))